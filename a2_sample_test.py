@@ -37,13 +37,37 @@ IMPORTANT NOTES:
       machines.  This is a second reason why you should run this test module
       there.
 """
+import csv
+import ctypes
+import errno
+import json
 import os
+import shutil
+import time
 
+import pygame
+import pytest
 from hypothesis import given
-from hypothesis.strategies import integers
-from typing import Tuple
+from hypothesis.strategies import integers, lists
+from typing import List, Set, Tuple
 
+import benchmarks
+import fs_watch
+from benchmarks import SyntheticTree, build_deep
+from compact_tree import CompactTree
+from fs_scanner import Scanner
+from fs_watch import InotifyWatcher, PollingWatcher
+import layouts
+import papers
+from papers import PaperTree
+from profiling import PROFILER
+from scan_cache import ScanCache, load_snapshot, save_snapshot
+import scan_shards
+import tm_trees
 from tm_trees import TMTree, FileSystemTree
+import treemap_visualiser
+import treemap_export
+from treemap_export import export_all, export_treemap
 
 # This should be the path to the "workshop" folder in the sample data.
 # You may need to modify this, depending on where you downloaded and
@@ -128,6 +152,948 @@ def test_example_data_rectangles() -> None:
         assert expected_rects[i] == actual_rects[i]
 
 
+def test_parallel_scan_matches_serial() -> None:
+    """Test that reading the example data with a pool of threads builds the
+    same tree as reading it in a single thread.
+    """
+    serial = FileSystemTree(EXAMPLE_PATH)
+    parallel = FileSystemTree(EXAMPLE_PATH, Scanner(workers=4))
+    assert _shape(parallel) == _shape(serial)
+    assert parallel.data_size == 151
+    for subtree in parallel._subtrees:
+        assert subtree._parent_tree is parallel
+
+
+def test_deep_tree_data_size() -> None:
+    """Test that a tree deeper than the recursion limit is built with the
+    correct data_size at every level.
+    """
+    depth = 5000
+    tree = build_deep(depth)
+    assert tree.data_size == depth * (depth + 1) // 2 + 1
+
+    level = tree
+    for i in range(1, depth + 1):
+        assert level.data_size == tree.data_size - (i - 1) * i // 2
+        level = level._subtrees[1]
+    assert level.data_size == 1
+
+
+def test_edits_update_ancestor_sizes(monkeypatch) -> None:
+    """Test that change_size, move and delete_self keep the data_size of
+    every ancestor up to date, without update_data_sizes being called.
+    """
+    monkeypatch.setattr(tm_trees, 'CHECK_INVARIANTS', True)
+    tree = build_deep(50)
+    total = tree.data_size
+    bottom = tree
+    while bottom._subtrees:
+        bottom = bottom._subtrees[-1]
+
+    bottom.change_size(1.0)
+    assert bottom.data_size == 2
+    assert tree.data_size == total + 1
+
+    top_file = tree._subtrees[0]
+    top_file.move(bottom.get_parent())
+    assert top_file.get_parent() is bottom.get_parent()
+    assert len(tree._subtrees) == 1
+    assert tree.data_size == total + 1
+    assert bottom.get_parent().data_size == 2 + 50 + 1
+
+    assert top_file.delete_self()
+    assert tree.data_size == total
+    tree._check_rep_invariants()
+
+
+def test_emptied_parent_has_no_size() -> None:
+    """Test that a tree whose last subtree is moved or deleted has a
+    data_size of 0, and that its ancestors no longer count what it held, for
+    both a TMTree and a CompactTree.
+    """
+    tree = _layout_example_tree()
+    for root in (tree, CompactTree.from_tree(tree).root()):
+        folder = _children(root)[2]
+        first, second = _children(folder)
+        assert first.delete_self()
+        second.move(root)
+        assert folder.data_size == 0
+        assert root.data_size == 100
+        assert [sub.data_size for sub in _children(root)] == \
+            [30, 10, 0, 0, 20, 40]
+
+
+@pytest.mark.parametrize('layout, expected_rects', [
+    ('slice_and_dice', [(0, 0, 50, 100), (50, 0, 16, 100), (66, 0, 100, 33),
+                        (66, 33, 100, 67), (166, 0, 0, 100),
+                        (166, 0, 34, 100)]),
+    ('squarified', [(100, 0, 50, 100), (150, 67, 50, 33), (67, 0, 33, 100),
+                    (0, 0, 67, 100), (200, 100, 0, 0), (150, 0, 50, 67)]),
+    ('strip', [(0, 0, 60, 83), (60, 0, 20, 83), (80, 0, 40, 83),
+               (120, 0, 80, 83), (200, 0, 0, 83), (0, 83, 200, 17)]),
+])
+def test_layout_rectangles(layout, expected_rects) -> None:
+    """Test the rectangles produced by each layout algorithm for a small
+    tree with a nested folder and an empty file.
+    """
+    tree = _layout_example_tree()
+    if layout != 'slice_and_dice':
+        tree.set_layout(layout)
+    tree.expand_all()
+    tree.update_rectangles((0, 0, 200, 100))
+    actual_rects = [r[0] for r in tree.get_rectangles()]
+    assert actual_rects == expected_rects
+
+
+def test_subtree_layout_overrides_root() -> None:
+    """Test that a layout chosen for a subtree is used for that subtree
+    only, and that unknown layouts are rejected.
+    """
+    tree = _layout_example_tree()
+    tree.set_layout('squarified')
+    tree._subtrees[2].set_layout('slice_and_dice')
+    tree.expand_all()
+    tree.update_rectangles((0, 0, 200, 100))
+    actual_rects = [r[0] for r in tree.get_rectangles()]
+    assert actual_rects[2:4] == [(0, 0, 100, 33), (0, 33, 100, 67)]
+
+    with pytest.raises(ValueError):
+        tree.set_layout('circles')
+
+
+@pytest.mark.parametrize('layout', ['slice_and_dice', 'squarified', 'strip'])
+def test_indexed_position_matches_search(layout) -> None:
+    """Test that get_tree_at_position finds the same trees with the subtree
+    index as by checking every subtree, including on shared edges.
+    """
+    tree = SyntheticTree('root', [SyntheticTree(str(i), [], i % 7)
+                                  for i in range(100)])
+    tree.set_layout(layout)
+    tree.expand()
+    tree.update_rectangles((0, 0, 300, 200))
+    assert tree._index is not None
+
+    points = [(x, y) for x in range(-1, 302, 7) for y in range(-1, 202, 9)]
+    for (x, y, width, height), _ in tree.get_rectangles():
+        points.extend([(x, y), (x + width, y), (x + width, y + height)])
+    indexed = [tree.get_tree_at_position(p) for p in points]
+    tree._index = None
+    assert [tree.get_tree_at_position(p) for p in points] == indexed
+
+
+def test_position_on_shared_edge() -> None:
+    """Test that a position on the edge shared by two rectangles gives the
+    leftmost one when the subtree index is used.
+    """
+    tree = SyntheticTree('root', [SyntheticTree(str(i), [], 1)
+                                  for i in range(20)])
+    tree.expand()
+    tree.update_rectangles((0, 0, 200, 10))
+    assert tree._index is not None
+    assert tree.get_tree_at_position((10, 5)) is tree._subtrees[0]
+    assert tree.get_tree_at_position((11, 5)) is tree._subtrees[1]
+    assert tree.get_tree_at_position((201, 5)) is None
+
+
+@given(lists(integers(min_value=0, max_value=10 ** 12), min_size=1,
+             max_size=50),
+       integers(min_value=0, max_value=2000),
+       integers(min_value=0, max_value=2000))
+def test_vectorized_slice_and_dice_matches_loop(sizes, width, height) -> None:
+    """Test that the NumPy version of slice_and_dice gives exactly the same
+    rectangles as the loop.
+    """
+    if layouts.np is None:
+        pytest.skip('NumPy is not installed')
+    rect = (3, 5, width, height)
+    for total in (sum(sizes), 0):
+        assert layouts._slice_and_dice_vectorized(
+            layouts.np.array(sizes, dtype=layouts.np.float64), total, rect) \
+            == layouts.slice_and_dice(sizes, total, rect)
+
+
+def test_dirty_rectangles_after_change_size() -> None:
+    """Test that update_dirty_rectangles lays out a tree like
+    update_rectangles, and reports exactly the rectangles that changed.
+    """
+    tree = _layout_example_tree()
+    tree.expand_all()
+    changed = tree.update_dirty_rectangles((0, 0, 200, 100))
+    before = [r[0] for r in tree.get_rectangles()]
+    assert changed == set(before)
+    assert tree.update_dirty_rectangles((0, 0, 200, 100)) == set()
+
+    tree._subtrees[2]._subtrees[0].change_size(1.0)
+    changed = tree.update_dirty_rectangles((0, 0, 200, 100))
+    after = [r[0] for r in tree.get_rectangles()]
+    assert after == [(0, 0, 42, 100), (42, 0, 14, 100), (56, 0, 57, 100),
+                     (113, 0, 57, 100), (170, 0, 0, 100), (170, 0, 30, 100)]
+    assert changed == {new for old, new in zip(before, after) if old != new}
+
+    tree.update_rectangles((0, 0, 200, 100))
+    assert [r[0] for r in tree.get_rectangles()] == after
+
+    empty = SyntheticTree('empty', [SyntheticTree('z', [], 0)])
+    empty.expand()
+    assert empty.update_dirty_rectangles((0, 0, 200, 100)) == \
+        {(0, 0, 200, 100)}
+    assert empty.update_dirty_rectangles((0, 0, 200, 100)) == set()
+
+
+def test_dirty_rectangles_after_expand() -> None:
+    """Test that expanding a tree again reports every rectangle it now
+    displays, including those of subtrees that stayed expanded.
+    """
+    tree = _layout_example_tree()
+    tree.expand_all()
+    tree.update_dirty_rectangles((0, 0, 200, 100))
+    tree._subtrees[0].collapse()
+    assert tree.update_dirty_rectangles((0, 0, 200, 100)) == {(0, 0, 200, 100)}
+
+    tree.expand()
+    changed = tree.update_dirty_rectangles((0, 0, 200, 100))
+    assert changed == {r[0] for r in tree.get_rectangles()}
+    assert len(changed) == 6
+
+
+def test_compact_moves_reuse_storage() -> None:
+    """Test that moving leaves back and forth in a CompactTree does not make
+    its storage grow without bound, and keeps the subtrees in order.
+    """
+    store = CompactTree.from_tree(_layout_example_tree())
+    root = store.root()
+    leaf, _, folder = _children(root)[:3]
+    for _ in range(500):
+        leaf.move(folder)
+        leaf.move(root)
+    assert len(store._children) <= 2 * len(store)
+    assert [sub.get_path_string() for sub in _children(root)] == \
+        ['root/b', 'root/c', 'root/f', 'root/g', 'root/a']
+    assert [sub.get_path_string() for sub in _children(folder)] == \
+        ['root/c/d', 'root/c/e']
+    assert root.data_size == 120 and folder.data_size == 60
+
+
+def test_drawable_rectangles_cull_and_merge() -> None:
+    """Test that iter_drawable yields the visible leaves at full detail,
+    skips those outside the area, and draws runs of tiny subtrees as their
+    parent, for both a TMTree and a CompactTree.
+    """
+    tree = _layout_example_tree()
+    compact = CompactTree.from_tree(tree).root()
+    for t in (tree, compact):
+        t.expand_all()
+        t.update_rectangles((0, 0, 200, 100))
+        leaves = [r for r in t.iter_rectangles() if r[0][2] > 0]
+        assert list(t.iter_drawable()) == leaves
+        assert [r[0] for r in t.iter_drawable((100, 0, 20, 100))] == \
+            [(66, 0, 100, 33), (66, 33, 100, 67)]
+        assert [r[0] for r in t.iter_drawable(detail=1700)] == \
+            [(0, 0, 200, 100), (0, 0, 50, 100), (66, 0, 100, 33),
+             (66, 33, 100, 67), (166, 0, 34, 100)]
+        assert [r[0] for r in t.iter_drawable(detail=30000)] == \
+            [(0, 0, 200, 100)]
+        assert list(t.iter_drawable((300, 0, 10, 10))) == []
+
+
+def test_batched_pixels_match_fill() -> None:
+    """Test that writing small rectangles straight into the pixels of a
+    surface gives the same picture as filling them, within the area.
+    """
+    rects = [(0, 0, 3, 2), (3, 0, 1, 5), (5, 5, 4, 4), (8, 1, 2, 1)]
+    colours = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (9, 9, 9)]
+    area = pygame.Rect(1, 1, 7, 8)
+    filled = pygame.Surface((10, 10), depth=32)
+    filled.set_clip(area)
+    written = filled.copy()
+    for rect, colour in zip(rects, colours):
+        filled.fill(colour, rect)
+    batch = [(*rect, written.map_rgb(colour))
+             for rect, colour in zip(rects, colours)]
+    treemap_visualiser._write_rects(
+        written, layouts.np.array(batch, dtype=layouts.np.int64), area)
+    assert pygame.image.tobytes(written, 'RGB') == \
+        pygame.image.tobytes(filled, 'RGB')
+
+
+def test_path_strings_are_cached_and_forgotten() -> None:
+    """Test that path strings are saved by get_path_string, forgotten when a
+    tree is moved or deleted, and yielded for every tree by iter_paths.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH)
+    paths = {id(t): t.get_path_string() for t, _ in tree.iter_paths()}
+    assert [path for _, path in tree.iter_paths()] == \
+        [paths[id(t)] for t, _ in tree.iter_paths()]
+    leaves = _leaves(tree)
+    assert all(paths[id(leaf)].startswith('workshop' + os.sep)
+               for leaf in leaves)
+    assert all(os.path.exists(os.path.join(os.path.dirname(EXAMPLE_PATH),
+                                           path)) for path in paths.values())
+
+    names = [leaf._name for leaf in FileSystemTree(EXAMPLE_PATH)._subtrees]
+    assert all(any(name is sub._name for sub in tree._subtrees)
+               for name in names)
+
+    leaf = leaves[-1]
+    folder = [sub for sub in tree._subtrees
+              if sub._subtrees and sub is not leaf._parent_tree][0]
+    leaf.move(folder)
+    assert leaf.get_path_string() == \
+        folder.get_path_string() + os.sep + leaf._name
+    assert dict(tree.iter_paths())[leaf] == leaf.get_path_string()
+    tree._check_rep_invariants()
+
+    assert folder.delete_self() and folder._path is None
+    assert all(sub._path is None for sub in folder._subtrees)
+    assert folder.get_path_string() == paths[id(folder)]
+    tree._check_rep_invariants()
+
+
+def test_compact_scan_matches_tree() -> None:
+    """Test that a CompactTree of the example data has the same sizes, paths
+    and rectangles as the FileSystemTree.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH)
+    compact = CompactTree.from_scan(Scanner().scan(EXAMPLE_PATH)).root()
+    assert compact.data_size == 151
+    assert compact.get_parent() is None
+    assert compact.get_suffix() == tree.get_suffix()
+
+    tree.expand_all()
+    compact.expand_all()
+    tree.update_rectangles((0, 0, 200, 100))
+    compact.update_rectangles((0, 0, 200, 100))
+    assert [r[0] for r in compact.get_rectangles()] == \
+        [r[0] for r in tree.get_rectangles()]
+    for rect, colour in compact.get_rectangles():
+        assert is_valid_colour(colour)
+
+    leaf = compact.get_tree_at_position((1, 1))
+    assert leaf is compact.get_tree_at_position((1, 1))
+    assert leaf.get_path_string() == \
+        tree.get_tree_at_position((1, 1)).get_path_string()
+
+
+def test_compact_edits_match_tree() -> None:
+    """Test that editing a CompactTree through its views changes the sizes
+    and rectangles in the same way as editing the TMTree it was built from.
+    """
+    tree = _layout_example_tree()
+    compact = CompactTree.from_tree(tree).root()
+    for t in (tree, compact):
+        t.set_layout('squarified')
+        t.expand_all()
+        t.update_rectangles((0, 0, 200, 100))
+    assert compact.get_rectangles() == tree.get_rectangles()
+
+    tree._subtrees[0].change_size(0.5)
+    compact.get_tree_at_position((120, 50)).change_size(0.5)
+    tree._subtrees[1].move(tree._subtrees[2])
+    compact.get_tree_at_position((175, 80)).move(
+        compact.get_tree_at_position((10, 50)).get_parent())
+    tree._subtrees[-1].delete_self()
+    compact.get_tree_at_position((175, 20)).delete_self()
+    assert compact.data_size == tree.data_size == 115
+
+    assert compact.update_dirty_rectangles((0, 0, 200, 100)) == \
+        tree.update_dirty_rectangles((0, 0, 200, 100))
+    assert compact.get_rectangles() == tree.get_rectangles()
+    assert compact.get_tree_at_position((80, 50)).get_path_string() == \
+        tree.get_tree_at_position((80, 50)).get_path_string()
+
+    compact.collapse_all()
+    compact.update_rectangles((0, 0, 200, 100))
+    assert compact.get_rectangles() == [((0, 0, 200, 100),
+                                         tree._colour)]
+
+
+def test_cache_rereads_only_modified_folders(tmp_path) -> None:
+    """Test that a cached scan reuses the folders that were not modified,
+    and reads the ones that were.
+    """
+    root = tmp_path / 'root'
+    for folder in ('a', 'b', 'b/c'):
+        (root / folder).mkdir(parents=True)
+        (root / folder / 'file.txt').write_bytes(b'x' * 10)
+    # Folders modified just before a scan are never reused, so make them
+    # an hour old.
+    hour_ago = time.time() - 3600
+    for folder in ('.', 'a', 'b', 'b/c'):
+        os.utime(root / folder, (hour_ago, hour_ago))
+    cache = ScanCache(str(tmp_path / 'cache'))
+    scanner = Scanner()
+
+    first = FileSystemTree(str(root), scanner, cache)
+    assert scanner.reused == 0
+    second = FileSystemTree(str(root), scanner, cache)
+    assert scanner.reused == 4
+    assert _shape(second) == _shape(first)
+
+    (root / 'b' / 'c' / 'new.txt').write_bytes(b'y' * 5)
+    third = FileSystemTree(str(root), scanner, cache)
+    assert scanner.reused == 3
+    assert third.data_size == first.data_size + 5
+
+    cache.refresh = True
+    FileSystemTree(str(root), scanner, cache)
+    assert scanner.reused == 0
+
+
+def test_cache_size_limit(tmp_path) -> None:
+    """Test that a snapshot larger than the limit is not kept.
+    """
+    cache = ScanCache(str(tmp_path), max_bytes=10)
+    scanner = Scanner()
+    FileSystemTree(EXAMPLE_PATH, scanner, cache)
+    assert cache.load(EXAMPLE_PATH) is None
+    FileSystemTree(EXAMPLE_PATH, scanner, cache)
+    assert scanner.reused == 0
+
+    cache.max_bytes = None
+    FileSystemTree(EXAMPLE_PATH, scanner, cache)
+    assert cache.load(EXAMPLE_PATH).name == 'workshop'
+
+
+def test_watcher_changes_patch_tree(tmp_path) -> None:
+    """Test that applying the changes reported by a PollingWatcher gives the
+    same tree as scanning the folder again.
+    """
+    root = tmp_path / 'root'
+    (root / 'a').mkdir(parents=True)
+    (root / 'a' / 'old.txt').write_bytes(b'x' * 10)
+    (root / 'b.txt').write_bytes(b'x' * 20)
+    watcher = PollingWatcher(str(root), interval=0)
+    tree = FileSystemTree(str(root))
+    tree.expand_all()
+    tree.update_rectangles((0, 0, 200, 100))
+
+    (root / 'a' / 'old.txt').rename(root / 'a' / 'new.txt')
+    (root / 'b.txt').write_bytes(b'x' * 50)
+    (root / 'c' / 'd').mkdir(parents=True)
+    (root / 'c' / 'd' / 'e.txt').write_bytes(b'x' * 5)
+    assert watcher.poll() == set()
+    changed = _poll_scanned(watcher)
+    assert str(root / 'b.txt') in changed
+    assert tree.update_from_disk(str(root), changed)
+    assert _sorted_shape(tree) == _sorted_shape(FileSystemTree(str(root)))
+    assert tree.data_size == 65
+
+    (root / 'c' / 'd' / 'e.txt').unlink()
+    assert tree.update_from_disk(str(root), _poll_scanned(watcher))
+    assert _sorted_shape(tree) == _sorted_shape(FileSystemTree(str(root)))
+    assert not tree.update_from_disk(str(root), _poll_scanned(watcher))
+
+
+def test_polling_watcher_rereads_modified_folders(tmp_path) -> None:
+    """Test that a PollingWatcher only reads again the folders modified
+    since its last scan, and that it can watch a single file.
+    """
+    root = tmp_path / 'root'
+    for folder in ('a', 'b'):
+        (root / folder).mkdir(parents=True)
+        (root / folder / 'f.txt').write_bytes(b'x')
+    hour_ago = time.time() - 3600
+    for folder in ('.', 'a', 'b'):
+        os.utime(root / folder, (hour_ago, hour_ago))
+    scanner = Scanner()
+    watcher = PollingWatcher(str(root), interval=0, scanner=scanner)
+    assert _poll_scanned(watcher) == set()
+    assert scanner.folders == 0 and scanner.reused == 3
+
+    (root / 'b' / 'g.txt').write_bytes(b'yy')
+    assert _poll_scanned(watcher) == {str(root / 'b' / 'g.txt')}
+    assert scanner.folders == 1 and scanner.reused == 2
+    shutil.rmtree(root / 'b')
+    assert _poll_scanned(watcher) == {str(root / 'b')}
+    assert watcher._children.keys() == {str(root), str(root / 'a')}
+
+    path = root / 'a' / 'f.txt'
+    watcher = PollingWatcher(str(path), interval=0)
+    assert _poll_scanned(watcher) == set()
+    path.write_bytes(b'xyz')
+    assert _poll_scanned(watcher) == {str(path)}
+    path.unlink()
+    path.mkdir()
+    assert _poll_scanned(watcher) == {str(path)}
+
+
+def test_small_files_fold_and_unfold(tmp_path) -> None:
+    """Test that the small files of each folder are folded into one leaf
+    with their total size, shown again by unfold, and folded again by fold
+    or after an update from disk.
+    """
+    root = tmp_path / 'root'
+    (root / 'many').mkdir(parents=True)
+    for i in range(50):
+        (root / 'many' / f'{i}.txt').write_bytes(b'x' * (i % 5))
+    (root / 'many' / 'big.bin').write_bytes(b'x' * 1000)
+    (root / 'tiny.txt').write_bytes(b'x')
+    full = FileSystemTree(str(root))
+
+    tree = FileSystemTree(str(root), fold=100)
+    assert tree.data_size == full.data_size
+    many = [sub for sub in tree._subtrees if sub._name == 'many'][0]
+    assert sorted(sub._name for sub in many._subtrees) == \
+        ['50 small files', 'big.bin']
+    assert [sub._name for sub in tree._subtrees if not sub._subtrees] == \
+        ['tiny.txt']
+    tree._check_rep_invariants()
+
+    folded = [sub for sub in many._subtrees if sub._folded is not None][0]
+    assert folded.unfold() is many
+    assert _sorted_shape(tree) == _sorted_shape(full)
+    tree.fold()
+    assert len(many._subtrees) == 2 and tree.data_size == full.data_size
+    tree._check_rep_invariants()
+
+    (root / 'many' / '7.txt').write_bytes(b'x' * 40)
+    assert tree.update_from_disk(str(root), [str(root / 'many' / '7.txt')])
+    assert len(many._subtrees) == 2
+    assert _sorted_shape(tree) == \
+        _sorted_shape(FileSystemTree(str(root), fold=100))
+    (root / 'many' / 'new.txt').write_bytes(b'x' * 3)
+    assert tree.update_from_disk(str(root), [str(root / 'many')])
+    assert sorted(sub._name for sub in many._subtrees) == \
+        ['51 small files', 'big.bin']
+    assert tree.data_size == FileSystemTree(str(root)).data_size
+    tree._check_rep_invariants()
+
+    full = FileSystemTree(str(root))
+    full.fold(100)
+    assert _sorted_shape(full) == _sorted_shape(
+        FileSystemTree(str(root), fold=100))
+
+
+def test_inotify_watcher_reports_changes(tmp_path) -> None:
+    """Test that an InotifyWatcher reports new, modified and removed files,
+    including those in folders created after it started.
+    """
+    try:
+        watcher = InotifyWatcher(str(tmp_path))
+    except OSError:
+        pytest.skip('inotify is not available')
+    try:
+        (tmp_path / 'a.txt').write_bytes(b'x')
+        (tmp_path / 'sub').mkdir()
+        assert watcher.poll() == {str(tmp_path / 'a.txt'),
+                                  str(tmp_path / 'sub')}
+        (tmp_path / 'sub' / 'b.txt').write_bytes(b'x')
+        (tmp_path / 'a.txt').unlink()
+        assert watcher.poll() == {str(tmp_path / 'a.txt'),
+                                  str(tmp_path / 'sub' / 'b.txt')}
+        assert watcher.poll() == set()
+    finally:
+        watcher.close()
+
+
+def test_inotify_watch_limit_is_reported(tmp_path, monkeypatch) -> None:
+    """Test that running out of inotify watches makes open_watcher use a
+    PollingWatcher, and is reported by an InotifyWatcher that is running.
+    """
+    try:
+        watcher = InotifyWatcher(str(tmp_path))
+    except OSError:
+        pytest.skip('inotify is not available')
+    monkeypatch.setattr(ctypes, 'get_errno', lambda: errno.ENOSPC)
+    try:
+        watcher._libc = _FailingLibc(watcher._libc)
+        (tmp_path / 'sub').mkdir()
+        assert watcher.poll() == {str(tmp_path / 'sub')}
+        assert watcher.error.errno == errno.ENOSPC
+    finally:
+        watcher.close()
+
+    cdll = ctypes.CDLL
+    monkeypatch.setattr(ctypes, 'CDLL', lambda *args, **kwargs:
+                        _FailingLibc(cdll(*args, **kwargs)))
+    assert isinstance(fs_watch.open_watcher(str(tmp_path)), PollingWatcher)
+
+
+def test_scan_links_and_inodes(tmp_path) -> None:
+    """Test that a scan never reads a folder twice through a symbolic link
+    cycle, counts hard links once only when asked to, and can report the
+    space allocated on disk.
+    """
+    if not hasattr(os, 'link') or os.name == 'nt':
+        pytest.skip('hard and symbolic links are not available')
+    (tmp_path / 'a' / 'b').mkdir(parents=True)
+    (tmp_path / 'a' / 'f').write_bytes(b'x' * 5000)
+    os.link(tmp_path / 'a' / 'f', tmp_path / 'a' / 'b' / 'g')
+    os.symlink(os.path.join('..', '..'), tmp_path / 'a' / 'b' / 'loop')
+
+    for workers in (1, 4):
+        scanner = Scanner(workers=workers)
+        tree = FileSystemTree(str(tmp_path), scanner)
+        assert tree.data_size == 10000
+        assert scanner.folders == 3 and scanner.linked == 1
+
+        scanner = Scanner(workers=workers, unique_inodes=True)
+        tree = FileSystemTree(str(tmp_path), scanner)
+        assert tree.data_size == 5000
+        assert scanner.linked == 2
+
+    scanner = Scanner(follow_links=False)
+    tree = FileSystemTree(str(tmp_path), scanner)
+    assert tree.data_size == 10000 + os.lstat(tmp_path / 'a' / 'b' /
+                                              'loop').st_size
+    assert scanner.linked == 0
+
+    stat = os.stat(tmp_path / 'a' / 'f')
+    if hasattr(stat, 'st_blocks'):
+        tree = FileSystemTree(str(tmp_path),
+                              Scanner(disk_usage=True, unique_inodes=True))
+        assert tree.data_size == stat.st_blocks * 512
+
+    tree = FileSystemTree(str(tmp_path), Scanner(unique_inodes=True),
+                          lazy=True)
+    while not tree._sizer.is_done():
+        tree.update_folder_sizes()
+    assert tree.data_size == 5000
+
+
+def test_scan_follows_links_outside_its_ancestors(tmp_path) -> None:
+    """Test that a symbolic link to a folder that is not above it is read
+    like any other folder, whatever the number of workers, unless inodes
+    are counted once, and that a link to a folder reused from the cache is
+    still found to be a cycle.
+    """
+    if os.name == 'nt':
+        pytest.skip('symbolic links are not available')
+    root = tmp_path / 'root'
+    (root / 'a').mkdir(parents=True)
+    (root / 'b' / 'd').mkdir(parents=True)
+    (root / 'a' / 'f').write_bytes(b'x' * 100)
+    (root / 'b' / 'd' / 'g').write_bytes(b'y' * 10)
+    os.symlink(os.path.join('..', 'a'), root / 'b' / 'a')
+    os.symlink('..', root / 'a' / 'up')
+
+    shapes = []
+    for workers in (1, 4):
+        scanner = Scanner(workers=workers)
+        tree = FileSystemTree(str(root), scanner)
+        assert tree.data_size == 210 and scanner.linked == 2
+        shapes.append(_sorted_shape(tree))
+    assert shapes[0] == shapes[1]
+
+    (root / 'c').mkdir()
+    os.symlink(os.path.join('..', 'a'), root / 'c' / 'one')
+    os.symlink(os.path.join('..', 'a'), root / 'c' / 'two')
+    for workers in (1, 4):
+        scanner = Scanner(workers=workers, unique_inodes=True)
+        tree = FileSystemTree(str(root), scanner)
+        assert tree.data_size == 110 and scanner.linked == 4
+    (root / 'c' / 'one').unlink()
+    (root / 'c' / 'two').unlink()
+    (root / 'c').rmdir()
+
+    hour_ago = time.time() - 3600
+    for folder in ('.', 'a', 'b', 'b/d'):
+        os.utime(root / folder, (hour_ago, hour_ago))
+    cache = ScanCache(str(tmp_path / 'cache'))
+    scanner = Scanner()
+    FileSystemTree(str(root), scanner, cache)
+    os.symlink('..', root / 'b' / 'd' / 'back')
+    tree = FileSystemTree(str(root), scanner, cache)
+    assert scanner.reused == 4 and scanner.linked == 1
+    assert _sorted_shape(tree) == _sorted_shape(FileSystemTree(str(root)))
+
+
+def test_sharded_scan_and_merged_snapshots(tmp_path) -> None:
+    """Test that a scan split across processes finds the same tree as a
+    serial scan, and that snapshots of parts of a folder saved separately
+    merge into the tree of the whole folder, with newer parts replacing
+    older ones.
+    """
+    root = tmp_path / 'root'
+    for i in range(4):
+        (root / f'shard{i}' / 'inner').mkdir(parents=True)
+        (root / f'shard{i}' / 'a.txt').write_bytes(b'x' * (i + 1))
+        (root / f'shard{i}' / 'inner' / 'b.txt').write_bytes(b'x' * 10 * i)
+    (root / 'top.txt').write_bytes(b'x' * 7)
+    full = FileSystemTree(str(root))
+
+    scanner = Scanner()
+    tree = FileSystemTree(str(root), scanner, processes=2)
+    assert _sorted_shape(tree) == _sorted_shape(full)
+    serial = Scanner()
+    serial.scan(str(root))
+    assert (scanner.folders, scanner.entries) == \
+        (serial.folders, serial.entries) == (9, 17)
+
+    snapshots = []
+    for i, part in enumerate(['shard0', 'shard1', 'shard2', 'shard3',
+                              'top.txt']):
+        path = str(root / part)
+        snapshots.append(str(tmp_path / f'{i}.json.gz'))
+        save_snapshot(snapshots[-1], path, Scanner().scan(path))
+    assert load_snapshot(snapshots[0])[0] == str(root / 'shard0')
+    path, entry = scan_shards.merge_snapshots(snapshots)
+    assert path == str(root)
+    merged = FileSystemTree.from_scan(entry)
+    assert _sorted_shape(merged) == _sorted_shape(full)
+    merged._check_rep_invariants()
+
+    (root / 'shard2' / 'inner' / 'b.txt').write_bytes(b'x' * 100)
+    newer = str(root / 'shard2' / 'inner')
+    snapshots.append(str(tmp_path / 'newer.json.gz'))
+    save_snapshot(snapshots[-1], newer, Scanner().scan(newer))
+    merged = FileSystemTree.from_scan(
+        scan_shards.merge_snapshots(snapshots)[1])
+    assert merged.data_size == full.data_size + 80 == \
+        FileSystemTree(str(root)).data_size
+    assert _sorted_shape(merged) == _sorted_shape(FileSystemTree(str(root)))
+
+
+def test_sharded_scan_finds_links_back_to_its_root(tmp_path) -> None:
+    """Test that a link from a shard back to the folder shared out is found
+    to be a cycle, and a link into another shard is read, as in a serial
+    scan.
+    """
+    if os.name == 'nt':
+        pytest.skip('symbolic links are not available')
+    root = tmp_path / 'root'
+    for i in range(3):
+        (root / f'shard{i}').mkdir(parents=True)
+        (root / f'shard{i}' / 'a.txt').write_bytes(b'x' * (i + 1))
+    os.symlink('..', root / 'shard0' / 'up')
+    os.symlink(os.path.join('..', 'shard2'), root / 'shard1' / 'side')
+
+    scanner, serial = Scanner(), Scanner()
+    tree = FileSystemTree(str(root), scanner, processes=2)
+    assert _sorted_shape(tree) == \
+        _sorted_shape(FileSystemTree(str(root), serial))
+    assert tree.data_size == 9
+    assert scanner.linked == serial.linked == 1
+
+
+def test_lazy_tree_reads_folders_on_expand() -> None:
+    """Test that a lazy tree only reads a folder when it is expanded, gets
+    the folder sizes from the background, and matches the full tree once
+    everything is expanded.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH, lazy=True)
+    activities = [sub for sub in tree._subtrees if sub._name == 'activities']
+    assert activities[0]._subtrees == []
+    assert activities[0].get_suffix().startswith(' (folder, ')
+
+    while not tree._sizer.is_done():
+        tree.update_folder_sizes()
+    tree.update_folder_sizes()
+    assert activities[0].data_size == 71
+    assert tree.data_size == 151
+
+    activities[0].expand()
+    assert len(activities[0]._subtrees) == 3
+    assert activities[0].data_size == 71
+    tree.expand_all()
+    assert _sorted_shape(tree) == _sorted_shape(FileSystemTree(EXAMPLE_PATH))
+
+
+def test_streamed_tree_matches_full_scan() -> None:
+    """Test that a streamed tree grows as its folders are read, and matches
+    the fully scanned tree once the scan is done.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH, stream=True)
+    while not tree.update_from_stream(1):
+        pass
+    assert len(tree._subtrees) == 3
+    while tree._stream is not None:
+        tree.update_from_stream(1)
+    assert tree.data_size == 151
+    assert tree.scan_progress() is None
+    assert _sorted_shape(tree) == _sorted_shape(FileSystemTree(EXAMPLE_PATH))
+
+
+def test_export_svg_and_png(tmp_path) -> None:
+    """Test that an exported SVG has one rectangle per non-empty leaf
+    rectangle, and that an exported PNG has the requested size.
+    """
+    tree = FileSystemTree(EXAMPLE_PATH)
+    tree.expand_all()
+    svg_path = str(tmp_path / 'workshop.svg')
+    export_treemap(tree, svg_path, (300, 200))
+    rects = [rect for rect, _ in tree.get_rectangles()
+             if rect[2] > 0 and rect[3] > 0]
+    with open(svg_path, encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    assert len(lines) == len(rects) + 3
+    x, y, width, height = rects[0]
+    assert lines[2].startswith(f'<rect x="{x}" y="{y}" width="{width}" '
+                               f'height="{height}" ')
+
+    results = export_all([EXAMPLE_PATH], str(tmp_path), 'png', (64, 48), 1)
+    assert results[0][0] == EXAMPLE_PATH and results[0][2] is None
+    assert pygame.image.load(results[0][1]).get_size() == (64, 48)
+
+    with pytest.raises(ValueError):
+        export_treemap(tree, str(tmp_path / 'workshop.bmp'))
+
+
+def test_export_error_is_kept_per_root(tmp_path, monkeypatch) -> None:
+    """Test that any error while exporting a root is returned as the error
+    of that root instead of being raised.
+    """
+    def fail(*_) -> None:
+        raise MemoryError('out of memory')
+
+    monkeypatch.setattr(treemap_export, 'export_treemap', fail)
+    job = (EXAMPLE_PATH, str(tmp_path / 'workshop.png'), (64, 48), None)
+    root, path, error = treemap_export._export_root(job)
+    assert root == EXAMPLE_PATH and path is None
+    assert error == 'MemoryError: out of memory'
+
+
+def test_benchmark_suite_runs_and_flags_regressions() -> None:
+    """Test that the benchmark suite times every benchmark on small trees
+    of each shape, and flags only the benchmarks that got much slower.
+    """
+    for shape in benchmarks.SHAPES:
+        parents, sizes = benchmarks.generate_shape(shape, 300)
+        assert len(parents) == len(sizes) == 300
+        assert all(parents[node] < node for node in range(1, 300))
+        tree = benchmarks.build_synthetic(parents, sizes)
+        assert tree.data_size == sum(size for node, size in enumerate(sizes)
+                                     if node not in set(parents))
+
+    results = benchmarks.run_suite([300], fs_max_nodes=300, repeat=1)
+    assert [r for r in results if 'error' in r] == []
+    names = {r['benchmark'] for r in results}
+    assert 'tree/deep/300/get_tree_at_position' in names
+    assert 'fs/skewed/300/scan' in names
+
+    slower = [dict(results[0], seconds=results[0]['seconds'] * 2 + 1)]
+    faster = [dict(results[1], seconds=results[1]['seconds'] / 2)]
+    assert benchmarks.compare_results(slower + faster, results) == [
+        (results[0]['benchmark'], results[0]['seconds'],
+         slower[0]['seconds'])]
+
+
+def test_profiler_records_timed_calls_and_trace(tmp_path) -> None:
+    """Test that the profiler times the tree methods and counts the scan
+    while it is on, writes a Chrome trace, and records nothing while off.
+    """
+    PROFILER.clear()
+    PROFILER.enabled = True
+    try:
+        tree = FileSystemTree(EXAMPLE_PATH)
+        tree.update_rectangles((0, 0, 200, 100))
+        tree.get_tree_at_position((10, 10))
+    finally:
+        PROFILER.enabled = False
+    names = [name for name, _, _ in PROFILER.take_totals()]
+    assert 'TMTree.update_rectangles' in names
+    assert 'TMTree.get_tree_at_position' in names
+    assert 'FileSystemTree.scan' in names
+    assert PROFILER.counters()['scan.entries'] > 0
+
+    path = str(tmp_path / 'trace.json')
+    PROFILER.export_trace(path)
+    with open(path, encoding='utf-8') as file:
+        events = json.load(file)['traceEvents']
+    assert {event['ph'] for event in events} == {'X', 'C'}
+
+    PROFILER.clear()
+    tree.update_rectangles((0, 0, 200, 100))
+    assert PROFILER.take_totals() == []
+    assert PROFILER.counters() == {}
+
+
+def test_paper_tree_has_one_leaf_per_paper() -> None:
+    """Test that the paper tree holds each row of the dataset as one leaf
+    under its categories, with no empty entries, and sums the citations.
+    """
+    with open(papers.DATA_FILE, newline='') as file:
+        rows = list(csv.reader(file))[1:]
+    for by_year in (True, False):
+        tree = PaperTree('CS1', [], all_papers=True, by_year=by_year)
+        leaves = _leaves(tree)
+        assert len(leaves) == len(rows)
+        assert sorted(leaf._doi for leaf in leaves) == \
+            sorted(row[4] for row in rows)
+        assert tree.data_size == sum(int(row[5]) for row in rows)
+
+        depths = {row[4]: 1 + by_year + len(row[3].split(':'))
+                  for row in rows}
+        for leaf in leaves:
+            depth, ancestor = 0, leaf.get_parent()
+            while ancestor is not None:
+                depth, ancestor = depth + 1, ancestor.get_parent()
+            assert depth == depths[leaf._doi]
+
+
+def test_paper_filter_uses_indexes() -> None:
+    """Test that filtering the paper tree by author, years, category and DOI
+    gives a view with the same papers as walking the whole tree.
+    """
+    with open(papers.DATA_FILE, newline='') as file:
+        rows = list(csv.reader(file))[1:]
+    tree = PaperTree('CS1', [], all_papers=True, by_year=True)
+    author = 'Simon, Beth'
+    queries = [
+        ({'author': author}, lambda row: author in row[0].split(' and ')),
+        ({'author': author, 'years': (2010, 2015)},
+         lambda row: author in row[0].split(' and ')
+         and 2010 <= int(row[2]) <= 2015),
+        ({'category': 'LA'}, lambda row: row[3].startswith('LA:')),
+        ({'category': 'LA: assessment', 'years': (2000, 2009)},
+         lambda row: row[3].startswith('LA: assessment')
+         and 2000 <= int(row[2]) <= 2009),
+        ({'doi': rows[7][4]}, lambda row: row[4] == rows[7][4]),
+        ({'author': 'Nobody, A.'}, lambda row: False),
+    ]
+    for query, matches in queries:
+        view = tree.filter(**query)
+        expected = [row for row in rows if matches(row)]
+        assert sorted(leaf._doi for leaf in _leaves(view) if leaf._doi) == \
+            sorted(row[4] for row in expected)
+        assert view.data_size == sum(int(row[5]) for row in expected)
+
+    view = tree.filter(category='LA')
+    assert _leaves(view.filter(years=(2000, 2009))) != []
+    assert len(_leaves(view.filter(years=(2000, 2009)))) == \
+        len(_leaves(tree.filter(category='LA', years=(2000, 2009))))
+
+    group = tree.filter(years=(2010, 2010))._subtrees[0]
+    view = group.filter(years=(2010, 2010))
+    assert not view._catalogue.grouped
+    assert view.filter(category='CA').data_size == \
+        group.filter(category='CA').data_size == \
+        tree.filter(category='CA', years=(2010, 2010)).data_size > 0
+
+    paper = tree._catalogue.dois[rows[7][4]]
+    assert paper.delete_self()
+    view = tree.filter(doi=rows[7][4])
+    assert view._subtrees == [] and view.data_size == 0
+
+
+def test_paper_hierarchies_share_one_store() -> None:
+    """Test that each hierarchy of the paper tree holds every paper under a
+    group of the expected kind, and that switching between them keeps each
+    tree instead of reading the dataset again.
+    """
+    store = papers.PaperStore(papers.DATA_FILE)
+    trees = [store.tree('year')]
+    for _ in papers.HIERARCHIES:
+        trees.append(trees[-1].next_hierarchy())
+    assert trees[-1] is trees[0]
+    assert [t._hierarchy for t in trees[:-1]] == list(papers.HIERARCHIES)
+
+    for root in trees[:-1]:
+        assert root._store is store
+        assert len(_leaves(root)) == len(store)
+        assert root.data_size == trees[0].data_size
+    groups = {t._hierarchy: {sub._name for sub in t._subtrees}
+              for t in trees[:-1]}
+    assert all(name.endswith('0s') for name in groups['decade'])
+    assert 'Simon, Beth' in groups['author']
+    assert groups['category'] == {name for name in groups['category']
+                                  if not name.isdigit()}
+
+    tree = PaperTree('CS1', [], all_papers=True, by_year=False)
+    assert tree._store is papers.get_store()
+    assert PaperTree('CS1', [], all_papers=True)._store is tree._store
+
+
 ##############################################################################
 # Helpers
 ##############################################################################
@@ -143,6 +1109,85 @@ def is_valid_colour(colour: Tuple[int, int, int]) -> bool:
     return True
 
 
+def _layout_example_tree() -> TMTree:
+    """Return a small tree whose root holds three files, a folder with two
+    files, and an empty file.
+    """
+    return SyntheticTree('root', [
+        SyntheticTree('a', [], 30),
+        SyntheticTree('b', [], 10),
+        SyntheticTree('c', [SyntheticTree('d', [], 20),
+                            SyntheticTree('e', [], 40)]),
+        SyntheticTree('f', [], 0),
+        SyntheticTree('g', [], 20)])
+
+
+def _leaves(tree: TMTree) -> List[TMTree]:
+    """Return the leaves of <tree>.
+    """
+    if not tree._subtrees:
+        return [tree]
+    return [leaf for sub in tree._subtrees for leaf in _leaves(sub)]
+
+
+def _children(tree: TMTree) -> List[TMTree]:
+    """Return the subtrees of <tree>, which may be a CompactNode.
+    """
+    if isinstance(tree, TMTree):
+        return tree._subtrees
+    store = tree._store
+    return [store.view(node) for node in store._subtrees(tree._node)]
+
+
+def _poll_scanned(watcher: PollingWatcher) -> Set[str]:
+    """Start a scan by <watcher>, whose interval is 0, unless one is
+    running, and return the changes it reports once the scan has finished.
+    """
+    if watcher._stream is None:
+        assert watcher.poll() == set()
+    while not watcher._stream.is_done():
+        time.sleep(0.01)
+    return watcher.poll()
+
+
+class _FailingLibc:
+    """A C library whose inotify_add_watch always fails.
+    """
+
+    def __init__(self, libc: ctypes.CDLL) -> None:
+        """Initialize a new _FailingLibc that passes every other call on to
+        <libc>.
+        """
+        self._libc = libc
+
+    def __getattr__(self, name: str) -> object:
+        """Return the function <name> of the wrapped library.
+        """
+        return getattr(self._libc, name)
+
+    @staticmethod
+    def inotify_add_watch(*args: object) -> int:
+        """Fail to add a watch.
+        """
+        return -1
+
+
+def _shape(tree: TMTree) -> tuple:
+    """Return a nested tuple of the names and data sizes in <tree>, in the
+    order the subtrees are stored.
+    """
+    return (tree._name, tree.data_size,
+            [_shape(subtree) for subtree in tree._subtrees])
+
+
+def _sorted_shape(tree: TMTree) -> tuple:
+    """Return a nested tuple of the names and data sizes in <tree>, with the
+    subtrees in alphabetical order.
+    """
+    return (tree._name, tree.data_size,
+            sorted(_sorted_shape(subtree) for subtree in tree._subtrees))
+
+
 def _sort_subtrees(tree: TMTree) -> None:
     """Sort the subtrees of <tree> in alphabetical order.
     THIS IS FOR THE PURPOSES OF THE SAMPLE TEST ONLY; YOU SHOULD NOT SORT
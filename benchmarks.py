@@ -0,0 +1,452 @@
+"""
+Assignment 2: Treemap Benchmarks
+
+=== CSC148 Summer 2022 ===
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, David Liu, Diane Horton,
+                   Haocheng Hu, Jacqueline Smith
+
+=== Module Description ===
+This module contains timing benchmarks for the treemap trees.
+
+The suite generates trees of a given number of nodes in three shapes:
+
+- wide: one folder holding every file.
+- deep: chains of folders DEEP_LEVELS levels deep hanging from the root,
+  where every folder holds one file and the next folder down.
+- skewed: each new node is added to a folder picked with probability
+  proportional to its size, which gives a few huge folders and many small
+  ones, as on real disks. File sizes are heavy-tailed.
+
+Each shape is built as a SyntheticTree in memory, and also written to a
+temporary folder and read as a FileSystemTree if it is small enough. The
+suite times building the trees, update_rectangles, get_rectangles,
+get_tree_at_position, change_size, move and delete_self, and loading the
+PaperTree.
+
+Run this module to print the results, save them as JSON with --output, and
+compare them with an earlier --output file given as --baseline. Benchmarks
+that got slower than the baseline by more than --threshold are flagged, and
+the exit status is 1 if there are any:
+
+    python benchmarks.py --sizes 1e3,1e4,1e5 --output today.json \\
+        --baseline last_week.json
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import papers
+from fs_scanner import Scanner
+from tm_trees import FileSystemTree, TMTree
+
+# The shapes of the generated trees.
+SHAPES = ('wide', 'deep', 'skewed')
+
+# The number of levels of folders in each chain of a deep tree. Laying out a
+# tree uses a few stack frames per level, so this stays well within the
+# recursion limit.
+DEEP_LEVELS = 200
+
+# Trees with at least this many nodes are built and timed only once, since
+# a second copy might not fit in memory.
+LARGE_TREE = 100000
+
+# The size of the area the trees are laid out in.
+SCREEN = (0, 0, 1920, 1080)
+
+# The number of positions looked up and of each kind of edit timed.
+QUERIES = 1000
+EDITS = 100
+
+# The version of the results file format.
+RESULTS_VERSION = 1
+
+
+class SyntheticTree(TMTree):
+    """A tree with generated names and sizes, used only for benchmarking.
+    """
+
+    def get_separator(self) -> str:
+        """Return the string used to separate names in a path.
+        """
+        return '/'
+
+    def get_suffix(self) -> str:
+        """Return the final descriptor of this tree.
+        """
+        return self._describe(len(self._subtrees), self.data_size)
+
+    @staticmethod
+    def _describe(item_count: int, data_size: int) -> str:
+        """Return the final descriptor of a tree with <item_count> subtrees
+        and size <data_size>, which is always empty.
+        """
+        return ''
+
+
+def build_deep(depth: int) -> SyntheticTree:
+    """Return a tree that is <depth> folders deep, where every folder holds
+    one file and the next folder down.
+
+    The tree is built bottom-up without recursion, so <depth> may be much
+    larger than the recursion limit. It has 2 * <depth> + 1 nodes.
+    """
+    tree = SyntheticTree('leaf', [], 1)
+    for level in range(depth, 0, -1):
+        tree = SyntheticTree(f'd{level}',
+                             [SyntheticTree(f'f{level}', [], level), tree])
+    return tree
+
+
+def time_call(func: Callable[[], object], repeat: int = 3) -> float:
+    """Return the best wall-clock time in seconds of <repeat> calls to
+    <func>. Garbage collection is paused while timing, as in timeit.
+    """
+    best = float('inf')
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best
+
+
+def bench_deep_build(depths: List[int]) -> List[Tuple[int, float]]:
+    """Return a (number of nodes, seconds) pair for building a deep tree of
+    each depth in <depths>.
+    """
+    return [(2 * depth + 1, time_call(lambda d=depth: build_deep(d)))
+            for depth in depths]
+
+
+def generate_shape(shape: str, nodes: int, seed: int = 0) \
+        -> Tuple[List[int], List[int]]:
+    """Return the parent and the size of each of the <nodes> nodes of a
+    tree with the given <shape>, which is one of SHAPES.
+
+    Node 0 is the root, with parent -1, and every node comes after its
+    parent. The sizes of nodes that get children are not used. The same
+    <seed> always gives the same tree.
+
+    Precondition: nodes >= 1
+    """
+    rng = random.Random(seed)
+    parents = [-1]
+    if shape == 'wide':
+        parents.extend([0] * (nodes - 1))
+    elif shape == 'deep':
+        folder, level = 0, 0
+        while len(parents) < nodes:
+            if level == DEEP_LEVELS:
+                folder, level = 0, 0
+            parents.append(folder)
+            if len(parents) < nodes:
+                parents.append(folder)
+                folder, level = len(parents) - 1, level + 1
+    elif shape == 'skewed':
+        # Each node appears once, plus once per child, so a folder is picked
+        # in proportion to how many children it already has.
+        targets = [0]
+        for node in range(1, nodes):
+            parent = rng.choice(targets)
+            parents.append(parent)
+            targets.append(parent)
+            targets.append(node)
+    else:
+        raise ValueError(f'unknown shape {shape!r}; expected one of '
+                         f'{", ".join(SHAPES)}')
+    sizes = [int(rng.paretovariate(1.2)) for _ in range(nodes)]
+    return parents, sizes
+
+
+def build_synthetic(parents: List[int], sizes: List[int]) -> SyntheticTree:
+    """Return the SyntheticTree with the given <parents> and <sizes>, as
+    returned by generate_shape.
+
+    The tree is built bottom-up without recursion, like build_deep.
+    """
+    children = [[] for _ in parents]
+    for node in range(1, len(parents)):
+        children[parents[node]].append(node)
+    trees = [None] * len(parents)
+    for node in range(len(parents) - 1, -1, -1):
+        trees[node] = SyntheticTree(f'n{node}',
+                                    [trees[child] for child in children[node]],
+                                    sizes[node])
+        for child in children[node]:
+            trees[child] = None
+        children[node] = None
+    return trees[0]
+
+
+def write_directory(parents: List[int], sizes: List[int], path: str) -> None:
+    """Create the tree with the given <parents> and <sizes>, as returned by
+    generate_shape, inside the existing empty folder at <path>.
+
+    The nodes with children are folders, and the others are files of their
+    size. The files are sparse, so they take up almost no disk space.
+    """
+    has_children = [False] * len(parents)
+    for parent in parents[1:]:
+        has_children[parent] = True
+    folders = {0: path}
+    for node in range(1, len(parents)):
+        node_path = os.path.join(folders[parents[node]], f'n{node}')
+        if has_children[node]:
+            os.mkdir(node_path)
+            folders[node] = node_path
+        else:
+            with open(node_path, 'wb') as file:
+                file.truncate(sizes[node])
+
+
+def run_suite(sizes: List[int], shapes: Tuple[str, ...] = SHAPES,
+              fs_max_nodes: int = 10000, repeat: int = 3,
+              seed: int = 0) -> List[Dict[str, Any]]:
+    """Run every benchmark on trees of each shape in <shapes> with each
+    number of nodes in <sizes>, and return the results.
+
+    File system trees are only timed up to <fs_max_nodes> nodes. Each
+    benchmark is the best of <repeat> runs, except on large trees and for
+    edits. A result has the benchmark's name, the number of nodes, and
+    either the seconds it took or the error that stopped it.
+    """
+    results = []
+    for shape in shapes:
+        for nodes in sizes:
+            parents, node_sizes = generate_shape(shape, nodes, seed)
+            runs = repeat if nodes < LARGE_TREE else 1
+            _bench_synthetic(results, f'tree/{shape}/{nodes}', parents,
+                             node_sizes, runs, seed)
+            if nodes <= fs_max_nodes:
+                _bench_file_system(results, f'fs/{shape}/{nodes}', parents,
+                                   node_sizes, runs)
+    _record(results, 'papers/load', 0, repeat,
+            lambda: papers.PaperStore(papers.DATA_FILE).tree('year'))
+    if _record(results, 'papers/read', 0, 1, papers.get_store):
+        _record(results, 'papers/build_hierarchy', 0, repeat,
+                lambda: papers.get_store().build('author'))
+    return results
+
+
+def _bench_synthetic(results: List[Dict[str, Any]], name: str,
+                     parents: List[int], sizes: List[int], repeat: int,
+                     seed: int) -> None:
+    """Add to <results> the timings of building, laying out, drawing,
+    hit-testing and editing the SyntheticTree with <parents> and <sizes>.
+    """
+    nodes = len(parents)
+    built = []
+
+    def build() -> None:
+        built[:] = []
+        built.append(build_synthetic(parents, sizes))
+
+    if not _record(results, f'{name}/build', nodes, repeat, build):
+        return
+    tree = built.pop()
+    tree.expand_all()
+    if not _record(results, f'{name}/update_rectangles', nodes, repeat,
+                   lambda: tree.update_rectangles(SCREEN)):
+        return
+    _record(results, f'{name}/get_rectangles', nodes, repeat,
+            tree.get_rectangles)
+
+    rng = random.Random(seed)
+    points = [(rng.randrange(SCREEN[2]), rng.randrange(SCREEN[3]))
+              for _ in range(QUERIES)]
+    _record(results, f'{name}/get_tree_at_position', nodes, repeat,
+            lambda: [tree.get_tree_at_position(p) for p in points])
+
+    leaves, folders = [], []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        (folders if node._subtrees else leaves).append(node)
+        stack.extend(node._subtrees)
+    # Each leaf is edited at most once, so that none is deleted twice.
+    edits = min(EDITS, len(leaves) // 3)
+    if edits == 0:
+        return
+    chosen = rng.sample(leaves, 3 * edits)
+    destinations = [rng.choice(folders) for _ in range(edits)]
+
+    def edit(method: Callable[[TMTree], object],
+             trees: List[TMTree]) -> Callable[[], None]:
+        def run() -> None:
+            for leaf in trees:
+                method(leaf)
+                tree.update_dirty_rectangles(SCREEN)
+        return run
+
+    _record(results, f'{name}/change_size', nodes, 1,
+            edit(lambda leaf: leaf.change_size(0.01), chosen[:edits]))
+    moves = dict(zip(chosen[edits:2 * edits], destinations))
+    _record(results, f'{name}/move', nodes, 1,
+            edit(lambda leaf: leaf.move(moves[leaf]), list(moves)))
+    _record(results, f'{name}/delete_self', nodes, 1,
+            edit(lambda leaf: leaf.delete_self(), chosen[2 * edits:]))
+
+
+def _bench_file_system(results: List[Dict[str, Any]], name: str,
+                       parents: List[int], sizes: List[int],
+                       repeat: int) -> None:
+    """Add to <results> the timings of reading the tree with <parents> and
+    <sizes> from a temporary folder as a FileSystemTree, with one thread
+    and with several.
+    """
+    nodes = len(parents)
+    with tempfile.TemporaryDirectory() as path:
+        try:
+            write_directory(parents, sizes, path)
+        except OSError as error:
+            results.append({'benchmark': f'{name}/scan', 'nodes': nodes,
+                            'error': str(error)})
+            return
+        _record(results, f'{name}/scan', nodes, repeat,
+                lambda: FileSystemTree(path))
+        _record(results, f'{name}/scan_parallel', nodes, repeat,
+                lambda: FileSystemTree(path, Scanner(workers=8)))
+
+
+def _record(results: List[Dict[str, Any]], name: str, nodes: int,
+            repeat: int, func: Callable[[], object]) -> bool:
+    """Time <func> as time_call does, add the result to <results> under
+    <name>, and return whether it succeeded.
+
+    A RecursionError, MemoryError or OSError is recorded as the result
+    instead of being raised, so that the other benchmarks still run.
+    """
+    try:
+        seconds = time_call(func, repeat)
+    except (RecursionError, MemoryError, OSError) as error:
+        results.append({'benchmark': name, 'nodes': nodes,
+                        'error': f'{type(error).__name__}: {error}'})
+        return False
+    results.append({'benchmark': name, 'nodes': nodes, 'seconds': seconds})
+    return True
+
+
+def save_results(results: List[Dict[str, Any]], path: str) -> None:
+    """Save <results> from run_suite to <path> as JSON, with a description
+    of the machine they were measured on.
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'version': RESULTS_VERSION,
+                   'python': platform.python_version(),
+                   'machine': platform.machine(),
+                   'platform': platform.platform(),
+                   'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'results': results}, file, indent=1)
+        file.write('\n')
+
+
+def load_results(path: str) -> List[Dict[str, Any]]:
+    """Return the results saved to <path> by save_results.
+
+    Raise a ValueError if <path> does not hold results in this format.
+    """
+    with open(path, encoding='utf-8') as file:
+        data = json.load(file)
+    if not isinstance(data, dict) or data.get('version') != RESULTS_VERSION:
+        raise ValueError(f'{path} does not hold benchmark results of '
+                         f'version {RESULTS_VERSION}')
+    return data['results']
+
+
+def compare_results(results: List[Dict[str, Any]],
+                    baseline: List[Dict[str, Any]], threshold: float = 1.25,
+                    floor: float = 0.001) \
+        -> List[Tuple[str, float, float]]:
+    """Return a (name, baseline seconds, seconds) triple for each benchmark
+    in <results> that took more than <threshold> times as long as in
+    <baseline>, in the order of <results>.
+
+    Differences of less than <floor> seconds are ignored as noise, as are
+    benchmarks that failed or are not in <baseline>.
+    """
+    before = {result['benchmark']: result.get('seconds')
+              for result in baseline}
+    slower = []
+    for result in results:
+        old = before.get(result['benchmark'])
+        new = result.get('seconds')
+        if old is not None and new is not None \
+                and new > old * threshold and new - old >= floor:
+            slower.append((result['benchmark'], old, new))
+    return slower
+
+
+def _parse_args() -> argparse.Namespace:
+    """Return the command line options of the benchmark suite.
+    """
+    parser = argparse.ArgumentParser(
+        description='Time the treemap trees on generated data.')
+    parser.add_argument('--sizes', default='1e3,1e4,1e5',
+                        help='comma-separated numbers of nodes, such as '
+                             '1e3,1e4,1e7 (default: 1e3,1e4,1e5)')
+    parser.add_argument('--shapes', default=','.join(SHAPES),
+                        help='comma-separated tree shapes (default: all)')
+    parser.add_argument('--fs-max-nodes', type=int, default=10000,
+                        help='largest tree to also write to disk and read '
+                             'as a FileSystemTree')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per benchmark; the best one counts')
+    parser.add_argument('--output', help='file to save the results to')
+    parser.add_argument('--baseline',
+                        help='earlier --output file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='flag benchmarks slower than the baseline by '
+                             'more than this factor (default: 1.25)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    ARGS = _parse_args()
+    RESULTS = run_suite([int(float(size)) for size in ARGS.sizes.split(',')],
+                        tuple(ARGS.shapes.split(',')), ARGS.fs_max_nodes,
+                        ARGS.repeat)
+    if ARGS.output:
+        save_results(RESULTS, ARGS.output)
+    BASELINE = {} if not ARGS.baseline else \
+        {result['benchmark']: result.get('seconds')
+         for result in load_results(ARGS.baseline)}
+    SLOWER = {} if not ARGS.baseline else \
+        {name for name, _, _ in compare_results(
+            RESULTS, load_results(ARGS.baseline), ARGS.threshold)}
+
+    print(f'{"benchmark":<40} {"seconds":>10} {"baseline":>10}')
+    for RESULT in RESULTS:
+        NAME = RESULT['benchmark']
+        if 'error' in RESULT:
+            print(f'{NAME:<40} {RESULT["error"]}')
+            continue
+        OLD = BASELINE.get(NAME)
+        print(f'{NAME:<40} {RESULT["seconds"]:>10.4f} '
+              f'{"" if OLD is None else format(OLD, ".4f"):>10}'
+              f'{"  SLOWER" if NAME in SLOWER else ""}')
+    if SLOWER:
+        print(f'{len(SLOWER)} benchmark(s) slower than the baseline',
+              file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,779 @@
+"""
+Assignment 2: Compact Tree Store
+
+=== CSC148 Summer 2022 ===
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, David Liu, Diane Horton,
+                   Haocheng Hu, Jacqueline Smith
+
+=== Module Description ===
+This module contains CompactTree, which stores a whole tree in a handful of
+typed arrays, and CompactNode, a lightweight view of one node of a
+CompactTree with the same public methods as TMTree.
+
+Every TMTree is a Python object with its own attribute dictionary, list of
+subtrees, rectangle tuple, colour tuple and name, which adds up to several
+hundred bytes per node. A CompactTree instead numbers its nodes from 0 and
+keeps one slot per node in each of its arrays, and stores each distinct name
+only once in a string table. This uses a small fraction of the memory, so
+file systems with millions of files can be visualised.
+
+Views are only created for the nodes that the visualiser asks for, and each
+node always has the same view, so views can be compared with `is`.
+"""
+from __future__ import annotations
+
+import math
+import os
+import random
+from array import array
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from fs_scanner import ScanEntry
+from layouts import DEFAULT_LAYOUT, LAYOUTS, Layout, RectIndex, overlaps
+from profiling import timed
+from tm_trees import INDEX_THRESHOLD, FileSystemTree, TMTree
+
+# Bits of CompactTree._flags
+_EXPANDED = 1
+_DIRTY = 2
+_STRAY = 4
+
+
+class CompactTree:
+    """A whole tree stored as a struct of arrays.
+
+    Node 0 is the root. The subtrees of node i are the nodes
+    _children[_child_start[i]:_child_start[i] + _child_count[i]], in order.
+
+    === Public Attributes ===
+    separator:
+        The string used to separate names in the string representation of a
+        path.
+
+    === Private Attributes ===
+    _describe:
+        Returns the suffix of a node, given its number of subtrees and its
+        data_size.
+    _names:
+        The string table: each distinct name, once.
+    _name_ids:
+        The position of the name of each node in _names.
+    _lookup:
+        The position of each name in _names. This is only kept while the
+        tree is being built.
+    _parents:
+        The parent of each node, or -1 if it has no parent.
+    _child_start:
+        The position in _children of the first subtree of each node.
+    _child_count:
+        The number of subtrees of each node.
+    _children:
+        The subtrees of every node, one slice per node. Positions left
+        behind by edits belong to no slice until the array is compacted.
+    _dead:
+        The number of positions in _children that belong to no slice.
+    _sizes:
+        The data_size of each node.
+    _rects:
+        The x, y, width and height of each node's rectangle.
+    _colours:
+        The red, green and blue values of each node's colour.
+    _flags:
+        The _EXPANDED, _DIRTY and _STRAY bits of each node, which have the
+        same meaning as TMTree._expanded, TMTree._dirty and TMTree._stray.
+    _layouts:
+        The layout name chosen with set_layout, for the nodes that chose one.
+    _indexes:
+        The RectIndex over the rectangles of the subtrees, for the nodes
+        that have one.
+    _views:
+        The CompactNode created for each node so far.
+
+    === Representation Invariants ===
+    - _name_ids, _parents, _child_start, _child_count, _sizes and _flags
+      have one element per node, and _rects and _colours have four and three
+    - If _child_count[i] > 0, then _sizes[i] is the sum of the _sizes of
+      the subtrees of node i.
+    - if _parents[i] != -1, then i is a subtree of _parents[i]
+    - The _child_count of every node adds up to len(_children) - _dead
+    - _dead <= len(_children) // 2
+    """
+    separator: str
+    _describe: Callable[[int, int], str]
+    _names: List[Optional[str]]
+    _name_ids: array
+    _lookup: Dict[Optional[str], int]
+    _parents: array
+    _child_start: array
+    _child_count: array
+    _children: array
+    _dead: int
+    _sizes: array
+    _rects: array
+    _colours: bytearray
+    _flags: bytearray
+    _layouts: Dict[int, str]
+    _indexes: Dict[int, RectIndex]
+    _views: Dict[int, CompactNode]
+
+    def __init__(self, separator: str,
+                 describe: Callable[[int, int], str]) -> None:
+        """Initialize a new CompactTree with no nodes, which uses <separator>
+        in paths and <describe> for suffixes.
+        """
+        self.separator = separator
+        self._describe = describe
+        self._names = []
+        self._name_ids = array('I')
+        self._lookup = {}
+        self._parents = array('i')
+        self._child_start = array('i')
+        self._child_count = array('i')
+        self._children = array('i')
+        self._dead = 0
+        self._sizes = array('q')
+        self._rects = array('i')
+        self._colours = bytearray()
+        self._flags = bytearray()
+        self._layouts = {}
+        self._indexes = {}
+        self._views = {}
+
+    @classmethod
+    def from_scan(cls, entry: ScanEntry) -> CompactTree:
+        """Return a CompactTree of the file or folder <entry> read by a
+        Scanner, which describes its nodes like FileSystemTree.
+
+        The whole of <entry> is read before this is called, so the memory
+        used while scanning is that of the ScanEntry objects. Only the
+        memory kept afterwards is reduced.
+        """
+        tree = cls(os.sep, FileSystemTree._describe)
+        tree._add_node(entry.name, -1, entry.size)
+        queue = deque([(0, entry)])
+        while queue:
+            node, entry = queue.popleft()
+            tree._child_start[node] = len(tree._children)
+            for sub in entry.children or []:
+                child = tree._add_node(sub.name, node, sub.size)
+                if sub.children:
+                    queue.append((child, sub))
+        tree._colours = bytearray(random.randbytes(3 * len(tree._sizes)))
+        tree._sum_sizes()
+        tree._lookup = {}
+        return tree
+
+    @classmethod
+    def from_tree(cls, root: TMTree) -> CompactTree:
+        """Return a CompactTree with the same names, sizes, colours and
+        expanded trees as <root> and its descendants.
+
+        Precondition: <root> is a FileSystemTree, a PaperTree or another
+        TMTree subclass with a _describe static method.
+        """
+        tree = cls(root.get_separator(), type(root)._describe)
+        tree._add_node(root._name, -1, root.data_size)
+        queue = deque([(0, root)])
+        while queue:
+            node, source = queue.popleft()
+            tree._child_start[node] = len(tree._children)
+            tree._colours[3 * node:3 * node + 3] = bytes(source._colour)
+            if source._expanded:
+                tree._flags[node] = _EXPANDED
+            for sub in source._subtrees:
+                queue.append((tree._add_node(sub._name, node, sub.data_size),
+                              sub))
+        tree._lookup = {}
+        return tree
+
+    def _add_node(self, name: Optional[str], parent: int, size: int) -> int:
+        """Add a node with no subtrees and return its number. If <parent> is
+        not -1, the node is added to the end of <parent>'s subtrees.
+
+        Precondition: <parent> is -1 or it is the last node that had
+        subtrees added.
+        """
+        node = len(self._sizes)
+        name_id = self._lookup.get(name)
+        if name_id is None:
+            name_id = self._lookup[name] = len(self._names)
+            self._names.append(name)
+        self._name_ids.append(name_id)
+        self._parents.append(parent)
+        self._child_start.append(0)
+        self._child_count.append(0)
+        self._sizes.append(size)
+        self._rects.extend((0, 0, 0, 0))
+        self._colours.extend(b'\0\0\0')
+        self._flags.append(0)
+        if parent != -1:
+            self._children.append(node)
+            self._child_count[parent] += 1
+        return node
+
+    def _sum_sizes(self) -> None:
+        """Set the size of every node with subtrees to the sum of the sizes
+        of its subtrees.
+
+        Every node is numbered after its parent, so one pass from the last
+        node to the first adds each size to its parent after the size
+        itself is complete.
+        """
+        for node in range(len(self._sizes)):
+            if self._child_count[node]:
+                self._sizes[node] = 0
+        for node in range(len(self._sizes) - 1, 0, -1):
+            self._sizes[self._parents[node]] += self._sizes[node]
+
+    def __len__(self) -> int:
+        """Return the number of nodes in this tree, including deleted
+        nodes.
+        """
+        return len(self._sizes)
+
+    def root(self) -> CompactNode:
+        """Return the view of the root of this tree.
+        """
+        return self.view(0)
+
+    def view(self, node: int) -> CompactNode:
+        """Return the view of node number <node>, creating it if needed.
+        """
+        found = self._views.get(node)
+        if found is None:
+            found = self._views[node] = CompactNode(self, node)
+        return found
+
+    # Helpers used by CompactNode. They mirror the TMTree methods and helpers
+    # of the same name, with the node number as an extra argument.
+    def _subtrees(self, node: int) -> array:
+        """Return the subtrees of <node>.
+        """
+        start = self._child_start[node]
+        return self._children[start:start + self._child_count[node]]
+
+    def _get_layout(self, node: int) -> str:
+        """Return the layout name chosen for <node> or its closest ancestor,
+        or DEFAULT_LAYOUT if none was chosen.
+        """
+        while node != -1:
+            if node in self._layouts:
+                return self._layouts[node]
+            node = self._parents[node]
+        return DEFAULT_LAYOUT
+
+    def _set_rect(self, node: int, rect: Tuple[int, int, int, int]) -> None:
+        """Set the rectangle of <node> to <rect>.
+        """
+        self._rects[4 * node:4 * node + 4] = array('i', rect)
+
+    def _get_rect(self, node: int) -> Tuple[int, int, int, int]:
+        """Return the rectangle of <node>.
+        """
+        return tuple(self._rects[4 * node:4 * node + 4])
+
+    def _layout_rectangles(self, node: int, rect: Tuple[int, int, int, int],
+                           layout: Layout, changed: Optional[Set]) -> bool:
+        """Lay out <node> and its descendants to fill <rect>, as in
+        TMTree._layout_rectangles.
+
+        If <changed> is None, lay out every node. Otherwise skip the nodes
+        that are not dirty and have not moved, as in TMTree._relayout, and
+        add the rectangles of the displayed nodes that changed to <changed>.
+
+        Return True iff <node> holds an expanded node of data_size 0.
+        """
+        if node in self._layouts:
+            layout = LAYOUTS[self._layouts[node]]
+
+        flags = self._flags[node]
+        if changed is not None:
+            if not flags & _DIRTY and rect == self._get_rect(node):
+                return bool(flags & _STRAY)
+            flags = self._flags[node] = flags & ~_DIRTY
+
+        subtrees = self._subtrees(node)
+        if not flags & _EXPANDED or not subtrees:
+            self._set_rect(node, rect)
+            if changed is not None:
+                changed.add(rect)
+            return False
+
+        elif self._sizes[node] == 0 \
+                or self._names[self._name_ids[node]] is None:
+            if changed is not None:
+                changed.add(rect)
+            self._flags[node] |= _STRAY
+            return True
+
+        else:
+            self._set_rect(node, rect)
+            sizes = [self._sizes[sub] for sub in subtrees]
+            sub_rects = layout(sizes, self._sizes[node], rect)
+            stray = [i for i, (sub, sub_rect)
+                     in enumerate(zip(subtrees, sub_rects))
+                     if self._layout_rectangles(sub, sub_rect, layout,
+                                                changed)]
+            self._indexes.pop(node, None)
+            if len(subtrees) > INDEX_THRESHOLD:
+                self._indexes[node] = RectIndex(
+                    [self._get_rect(sub) for sub in subtrees], stray)
+            if stray:
+                self._flags[node] |= _STRAY
+            else:
+                self._flags[node] &= ~_STRAY
+            return bool(stray)
+
+    def _forget_ancestor_indexes(self, node: int) -> None:
+        """Drop the indexes of the ancestors of <node>.
+        """
+        node = self._parents[node]
+        while node != -1:
+            self._indexes.pop(node, None)
+            node = self._parents[node]
+
+    def _tree_at_position(self, node: int, pos: Tuple[int, int]) -> int:
+        """Return the leaf in the displayed-tree rooted at <node> that
+        contains <pos>, or -1, as in TMTree.get_tree_at_position.
+        """
+        subtrees = self._subtrees(node)
+        if not self._flags[node] & _EXPANDED or not subtrees:
+            x, y, width, height = self._get_rect(node)
+            if x <= pos[0] <= x + width and y <= pos[1] <= y + height:
+                return node
+            return -1
+
+        elif self._names[self._name_ids[node]] is None:
+            return -1
+
+        index = self._indexes.get(node)
+        if index is not None:
+            subtrees = [subtrees[i] for i in index.query(pos)]
+        finds = [found for found
+                 in (self._tree_at_position(sub, pos) for sub in subtrees)
+                 if found != -1]
+        if not finds:
+            return -1
+        best = finds[0]
+        for found in finds:
+            if self._rects[4 * best] > self._rects[4 * found]:
+                best = found
+            elif self._rects[4 * best + 1] > self._rects[4 * found + 1]:
+                best = found
+        return best
+
+    def _descendants(self, node: int) -> List[int]:
+        """Return <node> and all of its descendants, each after its parent.
+        """
+        result = [node]
+        for sub in result:
+            result.extend(self._subtrees(sub))
+        return result
+
+    def _displayed(self, node: int) -> Iterator[int]:
+        """Yield the nodes displayed below <node>, in order, including the
+        nodes below expanded nodes.
+        """
+        stack = list(reversed(self._subtrees(node)))
+        while stack:
+            sub = stack.pop()
+            yield sub
+            if self._flags[sub] & _EXPANDED:
+                stack.extend(reversed(self._subtrees(sub)))
+
+    def _propagate_size(self, node: int, change: int) -> None:
+        """Add <change> to the size of <node> and each of its ancestors, and
+        mark them as dirty.
+        """
+        while node != -1:
+            self._sizes[node] += change
+            self._flags[node] |= _DIRTY
+            node = self._parents[node]
+
+    def _mark_dirty(self, node: int) -> None:
+        """Mark <node> and each of its ancestors as dirty.
+        """
+        while node != -1:
+            self._flags[node] |= _DIRTY
+            node = self._parents[node]
+
+    def _mark_displayed_dirty(self, node: int) -> None:
+        """Mark <node>, its ancestors and every node it displays as dirty.
+        """
+        self._mark_dirty(node)
+        stack = list(self._subtrees(node))
+        while stack:
+            sub = stack.pop()
+            self._flags[sub] |= _DIRTY
+            if self._flags[sub] & _EXPANDED:
+                stack.extend(self._subtrees(sub))
+
+    def _detach(self, node: int) -> None:
+        """Remove <node> from its parent's subtrees, and subtract its size
+        from each of its ancestors.
+
+        Precondition: <node> has a parent.
+        """
+        parent = self._parents[node]
+        start = self._child_start[parent]
+        count = self._child_count[parent]
+        end = start + count
+        position = self._children.index(node, start, end)
+        self._children[position:end - 1] = self._children[position + 1:end]
+        self._children[end - 1] = node
+        self._child_count[parent] = count - 1
+        self._dead += 1
+        self._indexes.pop(parent, None)
+        self._propagate_size(parent, -self._sizes[node])
+        if count == 1:
+            self._flags[parent] &= ~_EXPANDED
+        if self._dead > len(self._children) // 2:
+            self._compact()
+
+    def _append(self, parent: int, node: int) -> None:
+        """Add <node> to the end of the subtrees of <parent>, and add its
+        size to <parent> and each of its ancestors.
+
+        If the subtrees of <parent> are not at the end of _children, they
+        are copied there first, leaving the old slice unused. Once more than
+        half of _children is unused, it is compacted.
+        """
+        start = self._child_start[parent]
+        count = self._child_count[parent]
+        if start + count != len(self._children):
+            self._child_start[parent] = len(self._children)
+            self._children.extend(self._children[start:start + count])
+            self._dead += count
+        self._children.append(node)
+        self._child_count[parent] = count + 1
+        self._parents[node] = parent
+        self._indexes.pop(parent, None)
+        self._propagate_size(parent, self._sizes[node])
+        if self._dead > len(self._children) // 2:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Copy the slice of every node into a new _children with no unused
+        positions.
+
+        This takes time linear in the number of nodes, and at least as many
+        positions were left unused since the last time, so each edit costs
+        constant time on average.
+        """
+        children = array('i')
+        for node in range(len(self._sizes)):
+            count = self._child_count[node]
+            if count:
+                start = self._child_start[node]
+                self._child_start[node] = len(children)
+                children.extend(self._children[start:start + count])
+        self._children = children
+        self._dead = 0
+
+
+class CompactNode:
+    """A view of one node of a CompactTree, with the public methods of
+    TMTree.
+
+    Use CompactTree.view or CompactTree.root to get a view, rather than
+    creating one directly.
+
+    === Private Attributes ===
+    _store:
+        The CompactTree that holds this node.
+    _node:
+        The number of this node in _store.
+    """
+    __slots__ = ('_store', '_node')
+    _store: CompactTree
+    _node: int
+
+    def __init__(self, store: CompactTree, node: int) -> None:
+        """Initialize a new view of node <node> of <store>.
+        """
+        self._store = store
+        self._node = node
+
+    @property
+    def rect(self) -> Tuple[int, int, int, int]:
+        """The pygame rectangle representing this node in the treemap
+        visualization.
+        """
+        return self._store._get_rect(self._node)
+
+    @property
+    def data_size(self) -> int:
+        """The size of the data represented by this node.
+        """
+        return self._store._sizes[self._node]
+
+    def is_empty(self) -> bool:
+        """Return True iff this tree is empty.
+        """
+        store = self._store
+        return store._names[store._name_ids[self._node]] is None
+
+    def get_parent(self) -> Optional[CompactNode]:
+        """Returns the parent of this tree.
+        """
+        parent = self._store._parents[self._node]
+        return None if parent == -1 else self._store.view(parent)
+
+    @timed('tree')
+    def update_rectangles(self, rect: Tuple[int, int, int, int]) -> None:
+        """Update the rectangles in this tree and its descendents to fill
+        <rect>, as in TMTree.update_rectangles.
+        """
+        store = self._store
+        layout = LAYOUTS[store._get_layout(self._node)]
+        if store._layout_rectangles(self._node, rect, layout, None):
+            store._forget_ancestor_indexes(self._node)
+
+    @timed('tree')
+    def update_dirty_rectangles(self, rect: Tuple[int, int, int, int]) \
+            -> Set[Tuple[int, int, int, int]]:
+        """Lay out again the dirty trees in this tree to fill <rect>, and
+        return the rectangles that changed, as in
+        TMTree.update_dirty_rectangles.
+        """
+        store = self._store
+        changed = set()
+        layout = LAYOUTS[store._get_layout(self._node)]
+        if store._layout_rectangles(self._node, rect, layout, changed):
+            store._forget_ancestor_indexes(self._node)
+        return changed
+
+    def set_layout(self, layout: str) -> None:
+        """Use the layout algorithm named <layout> for this tree and for every
+        tree in it that has not chosen its own layout.
+
+        Raise a ValueError if <layout> is not a key of layouts.LAYOUTS.
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f'unknown layout {layout!r}; expected one of '
+                             f'{", ".join(LAYOUTS)}')
+        self._store._layouts[self._node] = layout
+        self._store._mark_displayed_dirty(self._node)
+
+    @timed('tree')
+    def get_rectangles(self) -> List[Tuple[Tuple[int, int, int, int],
+                                           Tuple[int, int, int]]]:
+        """Return the rectangle and colour of every leaf in the displayed-tree
+        rooted at this tree.
+        """
+        return list(self.iter_rectangles())
+
+    def iter_rectangles(self) -> Iterator[Tuple[Tuple[int, int, int, int],
+                                                 Tuple[int, int, int]]]:
+        """Yield the same rectangles and colours as get_rectangles, in the
+        same order, one at a time.
+        """
+        store = self._store
+        if not store._flags[self._node] & _EXPANDED:
+            nodes = (self._node,)
+        else:
+            nodes = store._displayed(self._node)
+        for node in nodes:
+            if not store._flags[node] & _EXPANDED:
+                yield store._get_rect(node), \
+                    tuple(store._colours[3 * node:3 * node + 3])
+
+    def iter_drawable(self, area: Optional[Tuple[int, int, int, int]] = None,
+                      detail: int = 1) \
+            -> Iterator[Tuple[Tuple[int, int, int, int],
+                              Tuple[int, int, int]]]:
+        """Yield rectangles and colours that paint the displayed-tree rooted
+        at this node at a level of detail, as TMTree.iter_drawable does.
+        """
+        store = self._store
+        if not overlaps(store._get_rect(self._node), area):
+            return
+        stack = [self._node]
+        while stack:
+            node = stack.pop()
+            rect = store._get_rect(node)
+            if not store._flags[node] & _EXPANDED \
+                    or rect[2] * rect[3] < detail:
+                yield rect, tuple(store._colours[3 * node:3 * node + 3])
+                continue
+            shown = []
+            merged = False
+            for sub in store._subtrees(node):
+                sub_rect = store._get_rect(sub)
+                if store._sizes[sub] == 0 or not overlaps(sub_rect, area):
+                    continue
+                if sub_rect[2] * sub_rect[3] < detail:
+                    merged = True
+                else:
+                    shown.append(sub)
+            if merged:
+                yield rect, tuple(store._colours[3 * node:3 * node + 3])
+            stack.extend(reversed(shown))
+
+    @timed('tree')
+    def get_tree_at_position(self, pos: Tuple[int, int]) \
+            -> Optional[CompactNode]:
+        """Return the leaf in the displayed-tree rooted at this tree whose
+        rectangle contains position <pos>, or None if <pos> is outside of this
+        tree's rectangle.
+
+        If <pos> is on the shared edge between two or more rectangles,
+        always return the leftmost and topmost rectangle (wherever applicable).
+        """
+        found = self._store._tree_at_position(self._node, pos)
+        return None if found == -1 else self._store.view(found)
+
+    @timed('tree')
+    def update_data_sizes(self) -> int:
+        """Update the data_size for this tree and its subtrees, based on the
+        size of their leaves, and return the new size.
+        """
+        store = self._store
+        for node in reversed(store._descendants(self._node)):
+            subtrees = store._subtrees(node)
+            if subtrees:
+                store._sizes[node] = sum(store._sizes[sub]
+                                         for sub in subtrees)
+        return store._sizes[self._node]
+
+    @timed('tree')
+    def move(self, destination: CompactNode) -> None:
+        """If this tree is a leaf, and <destination> is not a leaf, move this
+        tree to be the last subtree of <destination>. Otherwise, do nothing.
+
+        The data_size of this tree is taken off its old ancestors and added
+        to its new ones. A parent left with no subtrees has a data_size of 0.
+        """
+        store = self._store
+        if store._child_count[destination._node] \
+                and not store._child_count[self._node] \
+                and store._parents[self._node] != -1:
+            store._detach(self._node)
+            store._append(destination._node, self._node)
+
+    @timed('tree')
+    def change_size(self, factor: float) -> None:
+        """Change the value of this tree's data_size attribute by <factor>.
+
+        Always round up the amount to change, so that it's an int, and
+        some change is made.
+
+        Do nothing if this tree is not a leaf.
+        """
+        store = self._store
+        if not self.is_empty() and not store._child_count[self._node]:
+            size = store._sizes[self._node]
+            store._propagate_size(self._node,
+                                  max(math.ceil(factor * size), -size))
+
+    @timed('tree')
+    def delete_self(self) -> bool:
+        """Removes the current node from the visualization and
+        returns whether the deletion was successful.
+
+        Only do this if this node has a parent tree. The parent is kept, so
+        that the visualiser can still go back to the parent folder.
+
+        The data_size of this tree is taken off each of its ancestors, so a
+        parent left with no subtrees has a data_size of 0.
+        """
+        if self._store._parents[self._node] == -1:
+            return False
+        self._store._detach(self._node)
+        return True
+
+    def expand(self) -> None:
+        """Expand the tree to show subtrees if not expanded already.
+        If expanded do nothing.
+        """
+        store = self._store
+        if not store._child_count[self._node] \
+                or store._flags[self._node] & _EXPANDED:
+            return
+        store._flags[self._node] |= _EXPANDED
+        store._mark_displayed_dirty(self._node)
+        self.update_rectangles(self.rect)
+
+    def expand_all(self) -> None:
+        """Expand the tree and all subtrees if not expanded.
+        If expanded do nothing.
+        """
+        store = self._store
+        if not store._child_count[self._node] \
+                or store._flags[self._node] & _EXPANDED:
+            return
+        stack = [self._node]
+        while stack:
+            node = stack.pop()
+            if store._child_count[node] \
+                    and not store._flags[node] & _EXPANDED:
+                store._flags[node] |= _EXPANDED
+                stack.extend(store._subtrees(node))
+        store._mark_displayed_dirty(self._node)
+        self.update_rectangles(self.rect)
+
+    def collapse(self) -> None:
+        """Collapse current tree.
+        Do nothing if the tree is a root (no parent)
+        """
+        store = self._store
+        parent = store._parents[self._node]
+        if parent != -1:
+            store._flags[parent] &= ~_EXPANDED
+            store._mark_dirty(parent)
+
+    def collapse_all(self) -> None:
+        """Collapse all the trees
+        """
+        store = self._store
+        root = self._node
+        while store._parents[root] != -1:
+            root = store._parents[root]
+        for node in store._descendants(root):
+            store._flags[node] &= ~_EXPANDED
+        store._flags[root] |= _DIRTY
+
+    def get_path_string(self) -> str:
+        """Return a string representing the path containing this tree
+        and its ancestors, using the separator between each tree's name.
+        """
+        store = self._store
+        names = []
+        node = self._node
+        while node != -1:
+            names.append(store._names[store._name_ids[node]])
+            node = store._parents[node]
+        return store.separator.join(reversed(names))
+
+    def get_separator(self) -> str:
+        """Return the string used to separate names in the string
+        representation of a path from the tree root to this tree.
+        """
+        return self._store.separator
+
+    def get_suffix(self) -> str:
+        """Return the string used at the end of the string representation of
+        a path from the tree root to this tree.
+        """
+        return self._store._describe(self._store._child_count[self._node],
+                                     self.data_size)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'math', 'os', 'random', 'array',
+            'collections', '__future__', 'fs_scanner', 'layouts', 'profiling',
+            'tm_trees'
+        ]
+    })
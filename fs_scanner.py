@@ -0,0 +1,710 @@
+"""
+Assignment 2: File System Scanner
+
+=== CSC148 Summer 2022 ===
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, David Liu, Diane Horton,
+                   Haocheng Hu, Jacqueline Smith
+
+=== Module Description ===
+This module contains the scanner engine that FileSystemTree uses to read a
+file or folder from disk.
+
+Each folder is read with a single os.scandir call, and the size of every
+entry is taken from the stat data cached on its os.DirEntry, so each entry
+costs at most one stat call instead of the three calls made by
+os.listdir, os.path.isdir and os.path.getsize. Folder reads can be spread
+across a pool of worker threads.
+
+A scan can be given the ScanEntry of an earlier scan of the same path. Any
+folder whose modification time has not changed since then is not read
+again; its entries from the earlier scan are reused. Only the folders
+themselves are checked, so a file whose contents changed without an entry
+being added, removed or renamed in its folder keeps its earlier size.
+
+ScanStream runs a scan in a background thread and hands over the entries
+of each folder as soon as it has been read, so that a tree can grow while
+the scan goes on.
+
+FolderSizer adds up the size of every folder in a background thread,
+without keeping any entries, so that a tree can show the size of a folder
+before the folder itself has been read.
+
+During a scan, or while a FolderSizer runs, each folder carries the
+(st_dev, st_ino) pairs of the folders above it, and a symbolic link to one
+of its own ancestors is reported as an empty file instead of being read, so
+that it cannot make a scan go on without end. Any other folder reached
+through a link is read like the rest, so the result does not depend on the
+order in which folders are read. A Scanner can also be told not to follow
+symbolic links, to stay on the file system it started on, to report the
+space allocated on disk instead of the apparent size, and to count each
+hard-linked file, and each folder reached through more than one link, only
+once, as du does.
+
+The scanner only produces ScanEntry records; tm_trees turns those records
+into FileSystemTree objects.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, \
+    wait
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, \
+    Tuple
+
+# The (st_dev, st_ino) pairs of a folder and of the folders above it.
+_Chain = FrozenSet[Tuple[int, int]]
+
+# A folder waiting to be read: its path, its entry, its entry from an
+# earlier scan or None, and its chain.
+_Folder = Tuple[str, 'ScanEntry', Optional['ScanEntry'], _Chain]
+
+# Called by Scanner.scan with the path and the entries of each folder read.
+OnRead = Callable[[str, List['ScanEntry']], None]
+
+
+class ScanEntry:
+    """A file or folder read from disk by a Scanner.
+
+    === Public Attributes ===
+    name:
+        The name of the file or folder, not its full path.
+    size:
+        The size of this entry in bytes, as reported by os.stat.
+    children:
+        The entries inside this folder, in the order os.scandir reported
+        them, or None if this entry is not a folder.
+    mtime:
+        The modification time of this entry in nanoseconds, as reported by
+        os.stat, or 0 if it is not known.
+
+    === Representation Invariants ===
+    - size >= 0
+    """
+    __slots__ = ('name', 'size', 'children', 'mtime')
+
+    name: str
+    size: int
+    children: Optional[List[ScanEntry]]
+    mtime: int
+
+    def __init__(self, name: str, size: int,
+                 children: Optional[List[ScanEntry]] = None,
+                 mtime: int = 0) -> None:
+        """Initialize a new ScanEntry with the given <name>, <size>,
+        <children> and <mtime>.
+        """
+        self.name = name
+        self.size = size
+        self.children = children
+        self.mtime = mtime
+
+    def is_dir(self) -> bool:
+        """Return True iff this entry is a folder.
+        """
+        return self.children is not None
+
+
+class Scanner:
+    """A reusable scanner that reads a file or folder from disk.
+
+    === Public Attributes ===
+    workers:
+        The number of threads used to read folders. If this is 1, every
+        folder is read in the calling thread.
+    errors:
+        The number of folders or entries that could not be read during the
+        most recent scan.
+    reused:
+        The number of folders whose entries were reused from an earlier scan
+        during the most recent scan.
+    folders:
+        The number of folders read from disk during the most recent scan.
+    entries:
+        The number of files and folders found during the most recent scan,
+        including those in reused folders.
+    linked:
+        The number of symbolic links to an ancestor folder, and of files
+        and folders found again through another link if unique_inodes,
+        during the most recent scan. These are reported as empty files.
+    follow_links:
+        Whether symbolic links are followed. If not, a link is reported as
+        a file with the size of the link itself.
+    one_file_system:
+        Whether folders on a different file system than the folder they are
+        in are reported as files instead of being read, as with du -x.
+    disk_usage:
+        Whether sizes are the space allocated on disk, from st_blocks,
+        instead of the apparent size, from st_size. The apparent size is
+        used where st_blocks is not available.
+    unique_inodes:
+        Whether a file with more than one hard link, or a folder, is only
+        counted the first time it is found during a scan, and is empty
+        after that, so that no folder is read twice. With
+        more than one worker, which of its links is found first can change
+        from one scan to the next, though the total size does not.
+
+    === Private Attributes ===
+    _lock:
+        Guards the counters and _seen against the worker threads.
+    _seen:
+        The (st_dev, st_ino) pairs of the folders and hard-linked files
+        found so far by the current scan if unique_inodes, or None if no
+        scan is running or unique_inodes is False.
+    _above:
+        The (st_dev, st_ino) pairs of the folders above the path of each
+        scan, which scan_sharded sets for the folder it shares out.
+
+    === Representation Invariants ===
+    - workers >= 1
+    """
+    workers: int
+    errors: int
+    reused: int
+    folders: int
+    entries: int
+    linked: int
+    follow_links: bool
+    one_file_system: bool
+    disk_usage: bool
+    unique_inodes: bool
+    _lock: threading.Lock
+    _seen: Optional[Set[Tuple[int, int]]]
+    _above: _Chain
+
+    def __init__(self, workers: int = 1, follow_links: bool = True,
+                 one_file_system: bool = False, disk_usage: bool = False,
+                 unique_inodes: bool = False) -> None:
+        """Initialize a new Scanner that reads folders with <workers>
+        threads, with the given options.
+        """
+        self.workers = max(1, workers)
+        self.errors = 0
+        self.reused = 0
+        self.folders = 0
+        self.entries = 0
+        self.linked = 0
+        self.follow_links = follow_links
+        self.one_file_system = one_file_system
+        self.disk_usage = disk_usage
+        self.unique_inodes = unique_inodes
+        self._lock = threading.Lock()
+        self._seen = None
+        self._above = frozenset()
+
+    def copy(self) -> Scanner:
+        """Return a new Scanner with the same options as this one.
+        """
+        return Scanner(self.workers, self.follow_links, self.one_file_system,
+                       self.disk_usage, self.unique_inodes)
+
+    def __reduce__(self) -> Tuple[type, Tuple[Any, ...]]:
+        """Return how to build a new Scanner with the same options as this
+        one, so that it can be sent to another process. The counters are
+        not sent.
+        """
+        return Scanner, (self.workers, self.follow_links,
+                         self.one_file_system, self.disk_usage,
+                         self.unique_inodes)
+
+    def mode(self) -> str:
+        """Return a short description of the options of this scanner that
+        change the entries it finds, or '' if they are all the defaults.
+        """
+        return ','.join(name for name, used in (
+            ('nofollow', not self.follow_links),
+            ('xdev', self.one_file_system), ('blocks', self.disk_usage),
+            ('inodes', self.unique_inodes)) if used)
+
+    def scan(self, path: str, previous: Optional[ScanEntry] = None,
+             on_read: Optional[OnRead] = None) -> ScanEntry:
+        """Return the ScanEntry for the file or folder at <path>, with every
+        folder below it read.
+
+        If <previous> is not None, it is the result of an earlier scan of
+        <path>, and the entries of the folders that have not been modified
+        since then are reused instead of being read again. <previous> must
+        not be used after this call, since parts of it may now belong to the
+        result.
+
+        If <on_read> is not None, it is called with the path and the entries
+        of each folder as soon as that folder has been read, in the thread
+        that called scan. Every folder is reported before the folders inside
+        it. The entries of the folders in the list reported may be filled in
+        later, so only their names and sizes should be used.
+
+        Precondition: <path> is a valid path for this computer.
+        """
+        self.errors = 0
+        self.reused = 0
+        self.folders = 0
+        self.entries = 0
+        self.linked = 0
+        stat = self._start(path)
+        root = ScanEntry(os.path.basename(path), self._size(stat),
+                         [] if os.path.isdir(path) else None,
+                         stat.st_mtime_ns)
+        if not root.is_dir():
+            self._seen = None
+            return root
+        if previous is not None and (not previous.is_dir()
+                                     or previous.name != root.name):
+            previous = None
+
+        folder = (path, root, previous, _chain(self._above, stat))
+        try:
+            if self.workers == 1:
+                stack = [folder]
+                while stack:
+                    folder = stack.pop()
+                    stack.extend(self._fill(folder, *self._read_dir(*folder),
+                                            on_read))
+            else:
+                self._scan_parallel(folder, on_read)
+        finally:
+            self._seen = None
+        return root
+
+    def read_folder(self, path: str) -> List[ScanEntry]:
+        """Return the entries directly inside the folder at <path>. The
+        folders among them have an empty list of children.
+
+        Outside of a scan, no hard link is reported as found again, since
+        each call stands on its own. Only a link to the folder itself is
+        known to be a link to an ancestor.
+        """
+        return self._read_dir(path, ScanEntry(os.path.basename(path), 0, []),
+                              None, _chain(frozenset(), os.stat(path)))[0]
+
+    def _scan_parallel(self, root: _Folder,
+                       on_read: Optional[OnRead]) -> None:
+        """Read the folder <root> and every folder below it, using a pool of
+        self.workers threads and reusing what has not changed since the
+        earlier scan in <root>. Report each folder to <on_read> as in scan.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending: Dict[Future, _Folder] = {
+                pool.submit(self._read_dir, *root): root
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    folder = pending.pop(future)
+                    for sub in self._fill(folder, *future.result(), on_read):
+                        pending[pool.submit(self._read_dir, *sub)] = sub
+
+    def _fill(self, folder: _Folder, children: List[ScanEntry],
+              chains: Dict[str, _Chain],
+              on_read: Optional[OnRead] = None) -> List[_Folder]:
+        """Set the children of the entry in <folder> to <children>, report
+        them to <on_read> if it is not None, and return the folders inside
+        it that still need to be read, with their chains from <chains>.
+
+        Each folder is paired with the entry for the same folder in the
+        earlier scan of <folder>, or with None if there is none.
+        """
+        path, entry, old, _ = folder
+        if old is not None and children is old.children:
+            self.reused += 1
+            folders = [(os.path.join(path, sub.name), sub, sub,
+                        chains[sub.name])
+                       for sub in children if sub.is_dir()]
+        else:
+            self.folders += 1
+            earlier = {} if old is None else \
+                {sub.name: sub for sub in old.children if sub.is_dir()}
+            folders = [(os.path.join(path, sub.name), sub,
+                        earlier.get(sub.name), chains[sub.name])
+                       for sub in children if sub.is_dir()]
+        self.entries += len(children)
+        entry.children = children
+        if on_read is not None:
+            on_read(path, children)
+        return folders
+
+    def _read_dir(self, path: str, entry: ScanEntry,
+                  old: Optional[ScanEntry], chain: _Chain) \
+            -> Tuple[List[ScanEntry], Dict[str, _Chain]]:
+        """Return the entries inside the folder <entry> at <path>, whose
+        chain is <chain>, and the chain of each folder among them by name.
+
+        If <old> is the entry for this folder from an earlier scan and the
+        folder has not been modified since, return the entries of <old>
+        without reading the folder. If <entry> is <old> itself, its mtime is
+        read from disk first, and since its parent was not read, it is added
+        to <chain> and recorded as found here.
+
+        Folders in the result have an empty list of children; they are read
+        separately. A folder that cannot be read is treated as empty.
+        """
+        if old is not None:
+            mtime = entry.mtime
+            if entry is old:
+                try:
+                    stat = os.stat(path)
+                    mtime = stat.st_mtime_ns
+                    chain = _chain(chain, stat)
+                    self._claim(stat)
+                except OSError:
+                    mtime = 0
+            if mtime == old.mtime and mtime != 0:
+                # Each folder reused is added to its own chain when it is
+                # checked in turn.
+                return old.children, {sub.name: chain for sub in old.children
+                                      if sub.is_dir()}
+            entry.mtime = mtime
+
+        # The device of the folder is only needed to stay on one file
+        # system, or to skip a hard link found again without calling stat.
+        device = None
+        if self.one_file_system or self.unique_inodes \
+                and self._seen is not None:
+            try:
+                device = os.stat(path).st_dev
+            except OSError:
+                pass
+
+        entries = []
+        chains = {}
+        try:
+            with os.scandir(path) as items:
+                for item in items:
+                    entries.append(self._make_entry(item, device, chain,
+                                                    chains))
+        except OSError:
+            self._count_error()
+        return entries, chains
+
+    def _make_entry(self, item: os.DirEntry, device: Optional[int],
+                    chain: _Chain, chains: Dict[str, _Chain]) -> ScanEntry:
+        """Return a ScanEntry for <item>, which is in a folder on the file
+        system <device>, or None if that is not known, whose chain is
+        <chain>. Its cached stat data is reused. If it is a folder, record
+        its own chain in <chains>.
+
+        Like os.path.isdir and os.path.getsize, symbolic links are followed
+        if self.follow_links. A broken link is reported with the size of
+        the link itself. A folder in <chain>, or a folder or hard-linked file
+        that was already found by the current scan if self.unique_inodes, is
+        reported as an empty file.
+        """
+        follow = self.follow_links
+        if self.unique_inodes and device is not None and self._seen \
+                and not item.is_symlink() \
+                and (device, item.inode()) in self._seen:
+            # The inode number comes with the entry, so this costs no stat
+            # call.
+            self._count_linked()
+            return ScanEntry(item.name, 0)
+        try:
+            is_dir = item.is_dir(follow_symlinks=follow)
+            stat = item.stat(follow_symlinks=follow)
+            size, mtime = self._size(stat), stat.st_mtime_ns
+        except OSError:
+            self._count_error()
+            is_dir = False
+            mtime = 0
+            try:
+                size = self._size(item.stat(follow_symlinks=False))
+            except OSError:
+                size = 0
+            return ScanEntry(item.name, size, None, mtime)
+
+        if is_dir and self.one_file_system and device is not None \
+                and stat.st_dev != device:
+            is_dir = False
+        if is_dir:
+            if stat.st_ino != 0 and (stat.st_dev, stat.st_ino) in chain \
+                    or not self._claim(stat):
+                self._count_linked()
+                return ScanEntry(item.name, 0)
+            chains[item.name] = _chain(chain, stat)
+        elif self.unique_inodes and stat.st_nlink > 1 \
+                and not self._claim(stat):
+            self._count_linked()
+            return ScanEntry(item.name, 0)
+        return ScanEntry(item.name, size, [] if is_dir else None, mtime)
+
+    def _start(self, path: str) -> os.stat_result:
+        """Start recording the folders and hard-linked files found if
+        unique_inodes, beginning with the file or folder at <path>, and
+        return its stat data.
+        """
+        self._seen = set() if self.unique_inodes else None
+        stat = os.stat(path)
+        self._claim(stat)
+        return stat
+
+    def _claim(self, stat: os.stat_result) -> bool:
+        """Record the file or folder with <stat> as found, and return
+        whether it had not been found before. Safe to call from any worker
+        thread.
+
+        Everything counts as new if no scan is running, or if the file
+        system does not report inode numbers.
+        """
+        if self._seen is None or stat.st_ino == 0:
+            return True
+        key = (stat.st_dev, stat.st_ino)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            return True
+
+    def _size(self, stat: os.stat_result) -> int:
+        """Return the size in bytes of the file or folder with <stat>.
+        """
+        blocks = getattr(stat, 'st_blocks', None)
+        if self.disk_usage and blocks is not None:
+            return blocks * 512
+        return stat.st_size
+
+    def _count_error(self) -> None:
+        """Record that an entry could not be read. Safe to call from any
+        worker thread.
+        """
+        with self._lock:
+            self.errors += 1
+
+    def _count_linked(self) -> None:
+        """Record that an entry was found again. Safe to call from any
+        worker thread.
+        """
+        with self._lock:
+            self.linked += 1
+
+
+def _chain(chain: _Chain, stat: os.stat_result) -> _Chain:
+    """Return <chain> with the folder with <stat> added, or <chain> itself
+    if the file system does not report inode numbers.
+    """
+    if stat.st_ino == 0:
+        return chain
+    return chain | {(stat.st_dev, stat.st_ino)}
+
+
+class ScanStream:
+    """A scan running in a background thread, which hands over the entries of
+    each folder as soon as the folder has been read.
+
+    Only the thread that created this ScanStream may call its methods; the
+    queue is the only thing shared with the background thread.
+
+    === Public Attributes ===
+    folders:
+        The number of folders handed over by ready so far.
+    entries:
+        The number of files and folders inside them.
+    result:
+        The ScanEntry returned by the scan once it has finished, or None.
+
+    === Private Attributes ===
+    _results:
+        The (path, entries) pairs of the folders read by the background
+        thread and not yet taken by ready.
+    _thread:
+        The background thread.
+    """
+    folders: int
+    entries: int
+    result: Optional[ScanEntry]
+    _results: queue.Queue
+    _thread: threading.Thread
+
+    def __init__(self, scan: Callable[[OnRead], ScanEntry]) -> None:
+        """Initialize a new ScanStream and start calling <scan> in the
+        background. <scan> must pass the function it is given to
+        Scanner.scan as its on_read argument.
+        """
+        self.folders = 0
+        self.entries = 0
+        self.result = None
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, args=(scan,),
+                                        daemon=True)
+        self._thread.start()
+
+    def ready(self, limit: Optional[int] = None) \
+            -> List[Tuple[str, List[ScanEntry]]]:
+        """Return the path and the entries of each folder read since the last
+        call, in the order they were read, or only the first <limit> of them
+        if <limit> is not None.
+        """
+        found = []
+        while limit is None or len(found) < limit:
+            try:
+                path, entries = self._results.get_nowait()
+            except queue.Empty:
+                break
+            found.append((path, entries))
+            self.folders += 1
+            self.entries += len(entries)
+        return found
+
+    def is_done(self) -> bool:
+        """Return whether the scan has finished and every folder it read has
+        been taken by ready.
+        """
+        return not self._thread.is_alive() and self._results.empty()
+
+    def _run(self, scan: Callable[[OnRead], ScanEntry]) -> None:
+        """Call <scan>, queueing each folder it reads.
+        """
+        self.result = scan(lambda path, entries:
+                           self._results.put((path, entries)))
+
+
+class FolderSizer:
+    """Finds the total size of every folder inside a folder, using a
+    background thread.
+
+    A folder's total is the sum of the sizes of the files inside it and its
+    subfolders, or its own size if it is empty, as in FileSystemTree. Totals
+    are found deepest folder first, and each one is queued as soon as it is
+    known. Only the thread that created this FolderSizer may call its
+    methods; the queue is the only thing shared with the background thread.
+
+    === Public Attributes ===
+    scanner:
+        The Scanner for reading folders in the calling thread. The
+        background thread uses its own Scanner, with the same options.
+
+    === Private Attributes ===
+    _results:
+        The (path, total) pairs found by the background thread and not yet
+        taken by ready.
+    _known:
+        The total of each folder taken from _results so far.
+    _waiting:
+        The item to return from ready for each folder whose total is not
+        known yet.
+    _found:
+        The (item, total) pairs to return from the next call to ready.
+    _stop:
+        Set to ask the background thread to stop.
+    _thread:
+        The background thread.
+    """
+    scanner: Scanner
+    _results: queue.Queue
+    _known: Dict[str, int]
+    _waiting: Dict[str, Any]
+    _found: List[Tuple[Any, int]]
+    _stop: threading.Event
+    _thread: threading.Thread
+
+    def __init__(self, path: str, scanner: Optional[Scanner] = None) -> None:
+        """Initialize a new FolderSizer and start finding the total size of
+        the folder at <path> and of every folder inside it.
+        """
+        self.scanner = scanner or Scanner()
+        self._results = queue.Queue()
+        self._known = {}
+        self._waiting = {}
+        self._found = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(path,),
+                                        daemon=True)
+        self._thread.start()
+
+    def total(self, path: str) -> Optional[int]:
+        """Return the total size of the folder at <path> if it is known by
+        now, or None otherwise.
+        """
+        self._take_results()
+        return self._known.get(path)
+
+    def wait(self, path: str, item: Any) -> None:
+        """Make ready return <item> with the total size of the folder at
+        <path>, once it is known.
+        """
+        self._waiting[path] = item
+
+    def ready(self) -> List[Tuple[Any, int]]:
+        """Return an (item, total) pair for each item passed to wait whose
+        folder's total became known since the last call.
+        """
+        self._take_results()
+        found, self._found = self._found, []
+        return found
+
+    def _take_results(self) -> None:
+        """Move the totals found by the background thread from self._results
+        to self._known and self._found.
+        """
+        while True:
+            try:
+                path, total = self._results.get_nowait()
+            except queue.Empty:
+                return
+            self._known[path] = total
+            if path in self._waiting:
+                self._found.append((self._waiting.pop(path), total))
+
+    def is_done(self) -> bool:
+        """Return whether every total has been found and taken.
+        """
+        return not self._thread.is_alive() and self._results.empty() \
+            and not self._found
+
+    def stop(self) -> None:
+        """Ask the background thread to stop as soon as it can.
+        """
+        self._stop.set()
+
+    def _run(self, path: str) -> None:
+        """Find the total size of the folder at <path> and every folder
+        inside it, putting each one in self._results as soon as it is known.
+        """
+        scanner = self.scanner.copy()
+        stat = scanner._start(path)
+        # Each frame is a folder's path, its own size, the paths, sizes and
+        # chains of the folders inside it not visited yet, and its total so
+        # far.
+        stack = [self._frame(scanner, path, scanner._size(stat),
+                             _chain(frozenset(), stat))]
+        while stack and not self._stop.is_set():
+            frame = stack[-1]
+            if frame[2]:
+                stack.append(self._frame(scanner, *frame[2].pop()))
+                continue
+            stack.pop()
+            folder, own_size, _, total, is_empty = frame
+            total = own_size if is_empty else total
+            self._results.put((folder, total))
+            if stack:
+                stack[-1][3] += total
+
+    @staticmethod
+    def _frame(scanner: Scanner, path: str, own_size: int,
+               chain: _Chain) -> list:
+        """Return the stack frame used by _run for the folder at <path>,
+        which has size <own_size> itself and whose chain is <chain>.
+        """
+        entries, chains = scanner._read_dir(
+            path, ScanEntry(os.path.basename(path), 0, []), None, chain)
+        folders = [(os.path.join(path, entry.name), entry.size,
+                    chains[entry.name])
+                   for entry in entries if entry.is_dir()]
+        files = sum(entry.size for entry in entries if not entry.is_dir())
+        return [path, own_size, folders, files, not entries]
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'os', 'queue', 'threading',
+            'concurrent.futures', '__future__'
+        ]
+    })
@@ -0,0 +1,401 @@
+"""
+Assignment 2: File System Watchers
+
+=== CSC148 Summer 2022 ===
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, David Liu, Diane Horton,
+                   Haocheng Hu, Jacqueline Smith
+
+=== Module Description ===
+This module contains watchers, which report the paths inside a folder that
+were created, deleted, modified or renamed. The visualiser passes these
+paths to FileSystemTree.update_from_disk, which patches the tree in place.
+
+InotifyWatcher uses the Linux inotify API through ctypes, so it is told
+about each change as it happens. PollingWatcher works everywhere: it scans
+the folder again in a background thread every few seconds and compares the
+result with the previous scan. Like a ScanCache, it only reads the folders
+whose mtime changed, so a file rewritten in place is only seen to change
+once its folder is read again. Use open_watcher to get the best watcher
+for this computer.
+
+The kernel limits the number of inotify watches. If a folder cannot be
+watched when an InotifyWatcher starts, it raises an OSError and
+open_watcher uses a PollingWatcher instead. If a folder created later
+cannot be watched, the watcher sets its error attribute, and its changes
+from then on are missed until the caller switches to a PollingWatcher.
+
+A watcher only reports paths, not what happened to them. Whoever applies
+the changes looks at the paths on disk, so a batch of events can be applied
+in any order, and several events for one path cost no more than one.
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Set
+
+from fs_scanner import ScanEntry, Scanner, ScanStream
+from scan_cache import RACY_WINDOW
+
+# Event bits from <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO \
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+# The fixed part of struct inotify_event: wd, mask, cookie and len.
+_EVENT = struct.Struct('iIII')
+
+# The errors of inotify_add_watch for a folder that is gone or cannot be
+# read. Such a folder cannot be scanned either, so nothing is missed.
+_UNWATCHABLE = {errno.ENOENT, errno.ENOTDIR, errno.EACCES}
+
+
+class Watcher:
+    """Reports the changes inside a folder.
+
+    This is an abstract class that should not be instantiated directly.
+
+    === Public Attributes ===
+    path:
+        The folder being watched.
+    error:
+        The error that stopped part of the folder from being watched, so
+        that some changes are no longer reported, or None.
+    """
+    path: str
+    error: Optional[OSError] = None
+
+    def poll(self) -> Set[str]:
+        """Return the paths inside self.path that changed since the last
+        call, without waiting. The paths of the folders that changed may be
+        included as well.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Stop watching and release any resources held by this watcher.
+        """
+
+
+class PollingWatcher(Watcher):
+    """A watcher that scans its folder again every <interval> seconds and
+    reports the differences from the previous scan.
+
+    Only the first scan is made by the thread that creates the watcher.
+    Each later scan runs in a ScanStream, so poll never waits for one, and
+    is given the previous scan, so only the folders whose mtime changed
+    are read again, as with a ScanCache. The folders modified less than
+    RACY_WINDOW before a scan started are read again by the next one.
+
+    === Public Attributes ===
+    interval:
+        The smallest number of seconds between two scans.
+
+    === Private Attributes ===
+    _scanner:
+        The Scanner used to read the folder.
+    _snapshot:
+        The result of the most recent scan.
+    _scanned_at:
+        The time.monotonic() value when the most recent scan finished.
+    _stream:
+        The scan running in the background, or None if none is.
+    _started:
+        The time.time_ns() value when the most recent scan started.
+    _entries:
+        The entry of each folder below self.path in the most recent scan,
+        by path.
+    _children:
+        The entries inside each folder in the most recent scan, by path.
+    _changed:
+        The paths found to have changed by the scan running, or by the
+        most recent scan.
+    """
+    interval: float
+    _scanner: Scanner
+    _snapshot: ScanEntry
+    _scanned_at: float
+    _stream: Optional[ScanStream]
+    _started: int
+    _entries: Dict[str, ScanEntry]
+    _children: Dict[str, List[ScanEntry]]
+    _changed: Set[str]
+
+    def __init__(self, path: str, interval: float = 2.0,
+                 scanner: Optional[Scanner] = None) -> None:
+        """Initialize a new PollingWatcher for the file or folder at <path>.
+        """
+        self.path = path
+        self.interval = interval
+        self._scanner = scanner or Scanner()
+        self._entries = {}
+        self._children = {}
+        self._changed = set()
+        self._stream = None
+        self._snapshot = self._scan(None)
+        self._scanned_at = time.monotonic()
+        # The first scan has nothing to be compared with.
+        self._changed = set()
+
+    def poll(self) -> Set[str]:
+        """Return the paths inside self.path that changed between the last
+        two scans, if a scan has just finished, or an empty set otherwise.
+        If self.path is a file, it is reported when its size or mtime
+        changed.
+
+        A new scan is started in the background once self.interval seconds
+        have passed since the last one finished.
+        """
+        if self._stream is None:
+            if time.monotonic() - self._scanned_at >= self.interval:
+                self._stream = ScanStream(
+                    lambda on_read: self._scan(self._snapshot))
+            return set()
+        if not self._stream.is_done():
+            return set()
+        snapshot = self._stream.result
+        self._stream = None
+        self._scanned_at = time.monotonic()
+        changed, self._changed = self._changed, set()
+        if snapshot is not None:
+            old, self._snapshot = self._snapshot, snapshot
+            if old.is_dir() != snapshot.is_dir() or not snapshot.is_dir() \
+                    and (old.size, old.mtime) != \
+                    (snapshot.size, snapshot.mtime):
+                changed.add(self.path)
+        return changed
+
+    def _scan(self, previous: Optional[ScanEntry]) -> ScanEntry:
+        """Return a new scan of self.path, reusing the folders of the
+        <previous> scan that were not modified since, and record the paths
+        that changed in self._changed.
+        """
+        self._started = time.time_ns()
+        entry = self._scanner.scan(self.path, previous, self._compare)
+        if entry.is_dir() and entry.mtime >= self._started - RACY_WINDOW:
+            entry.mtime = 0
+        return entry
+
+    def _compare(self, path: str, children: List[ScanEntry]) -> None:
+        """Record the changes in the folder at <path>, whose entries were
+        found to be <children> by the scan running.
+
+        This runs in the thread of the scan.
+        """
+        before = self._children.get(path)
+        if children is before:
+            return
+        self._children[path] = children
+        entry = self._entries.get(path)
+        if entry is not None \
+                and entry.mtime >= self._started - RACY_WINDOW:
+            entry.mtime = 0
+        for sub in children:
+            if sub.is_dir():
+                self._entries[os.path.join(path, sub.name)] = sub
+        for gone in _diff(path, before or [], children, self._changed):
+            self._forget(gone)
+
+    def _forget(self, path: str) -> None:
+        """Forget the folder at <path> and every folder inside it, which
+        are gone.
+        """
+        stack = [path]
+        while stack:
+            folder = stack.pop()
+            self._entries.pop(folder, None)
+            stack.extend(os.path.join(folder, sub.name)
+                         for sub in self._children.pop(folder, [])
+                         if sub.is_dir())
+
+
+class InotifyWatcher(Watcher):
+    """A watcher that uses Linux inotify, with one watch per folder.
+
+    === Private Attributes ===
+    _libc:
+        The C library, which provides the inotify functions.
+    _fd:
+        The inotify file descriptor, which is non-blocking.
+    _watches:
+        The path of the folder for each watch descriptor.
+    """
+    _libc: ctypes.CDLL
+    _fd: int
+    _watches: Dict[int, str]
+
+    def __init__(self, path: str) -> None:
+        """Initialize a new InotifyWatcher for the folder at <path> and every
+        folder inside it.
+
+        Raise an OSError if inotify is not available.
+        """
+        self.path = path
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                                 use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self._watches = {}
+        try:
+            self._watch_tree(path)
+        except OSError:
+            self.close()
+            raise
+
+    def poll(self) -> Set[str]:
+        """Return the paths inside self.path that changed since the last
+        call, from the events queued by the kernel.
+
+        If the kernel's queue overflowed, events were lost, so every folder
+        is reported, and whoever applies the changes reads them all again.
+
+        If a new folder cannot be watched, it is still reported, and
+        self.error is set to the reason.
+        """
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:
+                            offset + _EVENT.size + length].split(b'\0', 1)[0]
+                offset += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(folder for folder, _, _
+                                   in os.walk(self.path))
+                elif mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                elif wd in self._watches:
+                    folder = self._watches[wd]
+                    path = os.path.join(folder, os.fsdecode(name)) \
+                        if name else folder
+                    changed.add(path)
+                    try:
+                        self._follow(path, mask)
+                    except OSError as error:
+                        self.error = self.error or error
+        return changed
+
+    def close(self) -> None:
+        """Close the inotify file descriptor, which removes every watch.
+        """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _follow(self, path: str, mask: int) -> None:
+        """Update the watches after an event with <mask> for <path>, so that
+        new folders are watched and the paths of moved folders are right.
+        """
+        if not mask & IN_ISDIR:
+            return
+        if mask & IN_MOVED_FROM:
+            prefix = path + os.sep
+            for wd, folder in list(self._watches.items()):
+                if folder == path or folder.startswith(prefix):
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                    del self._watches[wd]
+        elif mask & (IN_CREATE | IN_MOVED_TO):
+            self._watch_tree(path)
+
+    def _watch_tree(self, path: str) -> None:
+        """Add a watch for the folder at <path> and every folder inside it.
+
+        Folders that are gone or cannot be read are skipped. Raise an
+        OSError if any other folder cannot be watched, such as when the
+        limit on the number of watches is reached; the folders before it
+        are still watched.
+        """
+        for folder, _, _ in os.walk(path):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder),
+                                              _WATCH_MASK)
+            if wd >= 0:
+                self._watches[wd] = folder
+                continue
+            code = ctypes.get_errno()
+            if code not in _UNWATCHABLE:
+                raise OSError(code, os.strerror(code), folder)
+
+
+def open_watcher(path: str, interval: float = 2.0) -> Watcher:
+    """Return an InotifyWatcher for the folder at <path> if this computer
+    supports inotify, and a PollingWatcher that scans every <interval>
+    seconds otherwise.
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(path, interval)
+
+
+def _diff(path: str, before: List[ScanEntry], after: List[ScanEntry],
+          changed: Set[str]) -> List[str]:
+    """Add to <changed> the path of every entry that differs between
+    <before> and <after>, the entries of the folder at <path> in two scans,
+    and return the paths of the folders in <before> that are gone.
+
+    The folders in both are not compared here, since their own entries are
+    compared when they are read.
+    """
+    earlier = {entry.name: entry for entry in before}
+    gone = []
+    for entry in after:
+        sub_path = os.path.join(path, entry.name)
+        old = earlier.pop(entry.name, None)
+        if old is None or old.is_dir() != entry.is_dir():
+            changed.add(sub_path)
+            if old is not None and old.is_dir():
+                gone.append(sub_path)
+        elif not entry.is_dir() and (old.size, old.mtime) != \
+                (entry.size, entry.mtime):
+            changed.add(sub_path)
+    for name, old in earlier.items():
+        changed.add(os.path.join(path, name))
+        if old.is_dir():
+            gone.append(os.path.join(path, name))
+    return gone
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'ctypes', 'ctypes.util', 'errno', 'os',
+            'struct', 'sys', 'time', '__future__', 'fs_scanner', 'scan_cache'
+        ]
+    })
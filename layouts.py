@@ -0,0 +1,504 @@
+"""
+Assignment 2: Treemap Layout Algorithms
+
+=== CSC148 Summer 2022 ===
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, David Liu, Diane Horton,
+                   Haocheng Hu, Jacqueline Smith
+
+=== Module Description ===
+This module contains the layout algorithms used by TMTree.update_rectangles.
+
+A layout algorithm is a function that takes the data sizes of the subtrees
+of a tree, the tree's data_size, and the pygame rectangle of the tree, and
+returns one rectangle per subtree, in the same order as the sizes. It does
+not need to know anything about the trees themselves.
+
+- slice_and_dice: the original treemap algorithm. Subtrees are laid out
+  side by side along the longer side of the rectangle.
+- squarified: subtrees are grouped into rows so that each rectangle is as
+  close to a square as possible. Large subtrees are placed first.
+- strip: subtrees are placed left to right in horizontal strips, keeping
+  their order, with each strip made as square as possible.
+
+The squarified and strip layouts compute exact positions first, then round
+the edges of each rectangle to whole pixels. Neighbouring rectangles share
+the same rounded edge, so the rectangles still cover the whole area without
+gaps or overlaps.
+
+Above VECTORIZE_THRESHOLD subtrees, slice_and_dice computes every offset
+at once with NumPy, if it is installed. The result is the same to the pixel
+as the loop used for fewer subtrees.
+
+This module also contains RectIndex, which finds the rectangles of a tree's
+subtrees that contain a point without checking every one of them.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+from bisect import bisect_left, bisect_right
+from itertools import repeat
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Rect = Tuple[int, int, int, int]
+Layout = Callable[[List[int], int, Rect], List[Rect]]
+
+# The name of the layout used when no other layout is chosen.
+DEFAULT_LAYOUT = 'slice_and_dice'
+
+# The smallest number of subtrees that slice_and_dice lays out with NumPy.
+VECTORIZE_THRESHOLD = 1000
+
+# Sizes below this are exact as floats, so NumPy divides them exactly as
+# Python does.
+_EXACT_FLOAT = 2 ** 53
+
+
+def slice_and_dice(sizes: List[int], total: int, rect: Rect) -> List[Rect]:
+    """Return the rectangles of subtrees with data sizes <sizes> inside
+    <rect>, using the slice-and-dice treemap algorithm.
+
+    If <rect> is wider than it is tall, the subtrees are placed left to right,
+    otherwise they are placed top to bottom. Each subtree gets a share of the
+    width (or height) proportional to its size out of <total>, rounded down,
+    and the last subtree gets whatever is left.
+    """
+    if np is not None and len(sizes) >= VECTORIZE_THRESHOLD:
+        sizes_array = np.array(sizes, dtype=np.float64)
+        if max(total, sizes_array.max()) < _EXACT_FLOAT:
+            return _slice_and_dice_vectorized(sizes_array, total, rect)
+
+    x, y, width, height = rect
+    rects = []
+    if width > height:
+        for i, size in enumerate(sizes):
+            if i == len(sizes) - 1:
+                new_width = width - x + rect[0]
+            else:
+                new_width = math.floor(width * _percent(size, total))
+            rects.append((x, y, new_width, height))
+            x += new_width
+    else:
+        for i, size in enumerate(sizes):
+            if i == len(sizes) - 1:
+                new_height = height - y + rect[1]
+            else:
+                new_height = math.floor(height * _percent(size, total))
+            rects.append((x, y, width, new_height))
+            y += new_height
+    return rects
+
+
+def _slice_and_dice_vectorized(sizes: np.ndarray, total: int,
+                               rect: Rect) -> List[Rect]:
+    """Return the same rectangles as slice_and_dice for the non-empty float
+    array <sizes>, computing the offsets with cumulative sums.
+
+    Precondition: <total> and every size are less than _EXACT_FLOAT.
+    """
+    x, y, width, height = rect
+    length = width if width > height else height
+    if total == 0:
+        shares = np.zeros(len(sizes), dtype=np.int64)
+    else:
+        shares = np.floor(length * (sizes / total)).astype(np.int64)
+    offsets = np.zeros(len(sizes), dtype=np.int64)
+    np.cumsum(shares[:-1], out=offsets[1:])
+    shares[-1] = length - offsets[-1]
+    if width > height:
+        return list(zip((offsets + x).tolist(), repeat(y),
+                        shares.tolist(), repeat(height)))
+    return list(zip(repeat(x), (offsets + y).tolist(),
+                    repeat(width), shares.tolist()))
+
+
+def _percent(size: int, total: int) -> float:
+    """Return the fraction <size> is of <total>, or 0 if <total> is 0.
+    """
+    if total == 0:
+        return 0
+    return size / total
+
+
+def squarified(sizes: List[int], total: int, rect: Rect) -> List[Rect]:
+    """Return the rectangles of subtrees with data sizes <sizes> inside
+    <rect>, using the squarified treemap algorithm.
+
+    Subtrees are taken from largest to smallest, and added to the current row
+    along the shorter side of the remaining area for as long as that does not
+    make the worst aspect ratio in the row any worse. Subtrees of size 0 get
+    an empty rectangle in the bottom right corner of <rect>.
+    """
+    x, y, width, height = rect
+    rects = [(x + width, y + height, 0, 0)] * len(sizes)
+    order = [i for i in sorted(range(len(sizes)), key=lambda j: -sizes[j])
+             if sizes[i] > 0]
+    if total <= 0 or not order:
+        return rects
+
+    scale = width * height / total
+    area = [x, y, x + width, y + height]
+    row = []
+    row_area = 0.0
+    for i in order:
+        # Items are added from largest to smallest, so row[0] is the largest
+        # item in the row and the new item is the smallest.
+        item_area = sizes[i] * scale
+        side = min(area[2] - area[0], area[3] - area[1])
+        if row and _worst(row_area + item_area, row[0][1], item_area, side) \
+                > _worst(row_area, row[0][1], row[-1][1], side):
+            _place_row(row, area, rects, False)
+            row = []
+            row_area = 0.0
+        row.append((i, item_area))
+        row_area += item_area
+    _place_row(row, area, rects, True)
+    return rects
+
+
+def _worst(total: float, largest: float, smallest: float,
+           side: float) -> float:
+    """Return the worst aspect ratio in a row of items with areas adding up
+    to <total>, from <largest> down to <smallest>, laid along a side of
+    length <side>.
+    """
+    if side <= 0 or total <= 0:
+        return math.inf
+    return max(side * side * largest / (total * total),
+               total * total / (side * side * smallest))
+
+
+def _place_row(row: List[Tuple[int, float]], area: List[float],
+               rects: List[Rect], last: bool) -> None:
+    """Place the (index, area) pairs in <row> along the shorter side of
+    <area>, store their rounded rectangles in <rects>, and shrink <area> to
+    the part that is left.
+
+    <area> is [left, top, right, bottom]. If <last> is True, the row takes up
+    all of <area>.
+    """
+    left, top, right, bottom = area
+    row_area = sum(a for _, a in row)
+    if right - left >= bottom - top:
+        # A column on the left of the area, filled top to bottom.
+        column = right if last else left + row_area / max(bottom - top, 1e-9)
+        edge = top
+        for k, (i, a) in enumerate(row):
+            end = bottom if k == len(row) - 1 else \
+                edge + a / max(column - left, 1e-9)
+            rects[i] = _round_rect(left, edge, column, end)
+            edge = end
+        area[0] = column
+    else:
+        # A row along the top of the area, filled left to right.
+        line = bottom if last else top + row_area / max(right - left, 1e-9)
+        edge = left
+        for k, (i, a) in enumerate(row):
+            end = right if k == len(row) - 1 else \
+                edge + a / max(line - top, 1e-9)
+            rects[i] = _round_rect(edge, top, end, line)
+            edge = end
+        area[1] = line
+
+
+def strip(sizes: List[int], total: int, rect: Rect) -> List[Rect]:
+    """Return the rectangles of subtrees with data sizes <sizes> inside
+    <rect>, using the strip treemap algorithm.
+
+    Subtrees keep their order, and are placed left to right in horizontal
+    strips from the top of <rect> down. A subtree starts a new strip when
+    adding it to the current one would make the average aspect ratio of the
+    current strip worse.
+    """
+    x, y, width, height = rect
+    if total <= 0 or width <= 0 or height <= 0 or not sizes:
+        return slice_and_dice(sizes, total, rect)
+
+    scale = width * height / total
+    strips = [[]]
+    shape = _StripShape(width)
+    for i, size in enumerate(sizes):
+        if size <= 0:
+            strips[-1].append(i)
+            continue
+        previous = shape.ratio
+        if shape.add(size * scale) > previous and shape.count > 1:
+            strips.append([i])
+            shape = _StripShape(width)
+            shape.add(size * scale)
+        else:
+            strips[-1].append(i)
+
+    rects = []
+    top = float(y)
+    for k, current in enumerate(strips):
+        strip_area = sum(sizes[i] for i in current) * scale
+        bottom = y + height if k == len(strips) - 1 else \
+            top + strip_area / width
+        edge = float(x)
+        for n, i in enumerate(current):
+            if n == len(current) - 1:
+                end = x + width
+            elif strip_area > 0:
+                end = edge + sizes[i] * scale / (strip_area / width)
+            else:
+                end = edge
+            rects.append(_round_rect(edge, top, end, bottom))
+            edge = end
+        top = bottom
+    return rects
+
+
+class _StripShape:
+    """The average aspect ratio of the items in one strip of the strip
+    layout, updated in amortized logarithmic time as items are added.
+
+    An item of area a in a strip of height h has aspect ratio a / h^2 if it is
+    wider than it is tall (a >= h^2), and h^2 / a otherwise. Adding items
+    only makes the strip taller, so an item only ever moves from the first
+    group to the second.
+
+    === Public Attributes ===
+    count:
+        The number of items in the strip.
+    ratio:
+        The average aspect ratio of the items in the strip, or 0 if it is
+        empty.
+
+    === Private Attributes ===
+    _width:
+        The width of the strip.
+    _area:
+        The total area of the items in the strip.
+    _wide:
+        A heap of the areas of the items that are wider than they are tall.
+    _wide_area:
+        The total area of the items in _wide.
+    _tall_inverse:
+        The sum of 1 / area over the items that are not in _wide.
+    """
+    count: int
+    ratio: float
+    _width: float
+    _area: float
+    _wide: List[float]
+    _wide_area: float
+    _tall_inverse: float
+
+    def __init__(self, width: float) -> None:
+        """Initialize an empty strip of the given <width>.
+        """
+        self.count = 0
+        self.ratio = 0.0
+        self._width = width
+        self._area = 0.0
+        self._wide = []
+        self._wide_area = 0.0
+        self._tall_inverse = 0.0
+
+    def add(self, area: float) -> float:
+        """Add an item of the given positive <area> to this strip, and return
+        the new average aspect ratio.
+        """
+        self.count += 1
+        self._area += area
+        heapq.heappush(self._wide, area)
+        self._wide_area += area
+        height_squared = (self._area / self._width) ** 2
+        while self._wide and self._wide[0] < height_squared:
+            moved = heapq.heappop(self._wide)
+            self._wide_area -= moved
+            self._tall_inverse += 1 / moved
+        self.ratio = (self._wide_area / height_squared
+                      + height_squared * self._tall_inverse) / self.count
+        return self.ratio
+
+
+def _round_rect(left: float, top: float, right: float, bottom: float) -> Rect:
+    """Return the pygame rectangle whose edges are the given edges rounded to
+    the nearest pixel.
+    """
+    x0, y0 = _round(left), _round(top)
+    return x0, y0, max(_round(right) - x0, 0), max(_round(bottom) - y0, 0)
+
+
+def _round(value: float) -> int:
+    """Return <value> rounded to the nearest int, with halves rounded up.
+    """
+    return math.floor(value + 0.5)
+
+
+class RectIndex:
+    """An index over a list of rectangles that finds every rectangle
+    containing a point, where a point on the edge of a rectangle counts as
+    inside it.
+
+    If the rectangles are ordered along one axis, as slice-and-dice lays them
+    out, a query is two binary searches over their start and end offsets.
+    Otherwise the rectangles are bucketed into a grid of about one cell per
+    rectangle, and a query only checks the rectangles in one cell.
+
+    === Private Attributes ===
+    _rects:
+        The rectangles in this index.
+    _always:
+        The positions in _rects that every query returns, whether or not
+        the point is inside them.
+    _axis:
+        0 or 1 if the rectangles are ordered along x or y, otherwise None.
+    _starts:
+        The start offset of each rectangle along _axis.
+    _ends:
+        The end offset of each rectangle along _axis.
+    _origin:
+        The top left corner of the grid.
+    _cell:
+        The width and height of a grid cell.
+    _columns:
+        The number of columns in the grid.
+    _rows:
+        The number of rows in the grid.
+    _grid:
+        For each grid cell, in row-major order, the positions in _rects of
+        the rectangles that touch that cell, in increasing order.
+
+    === Representation Invariants ===
+    - If _axis is not None, _starts and _ends are in non-decreasing order.
+    """
+    _rects: List[Rect]
+    _always: List[int]
+    _axis: Optional[int]
+    _starts: List[int]
+    _ends: List[int]
+    _origin: Tuple[int, int]
+    _cell: Tuple[int, int]
+    _columns: int
+    _rows: int
+    _grid: List[List[int]]
+
+    def __init__(self, rects: List[Rect],
+                 always: Optional[List[int]] = None) -> None:
+        """Initialize a new index over <rects>.
+
+        The positions in <always> are returned by every query. This is for
+        rectangles whose contents may lie outside of them.
+        """
+        self._rects = rects
+        self._always = always or []
+        self._axis = None
+        best_spread = 0
+        for axis in (0, 1):
+            starts = [r[axis] for r in rects]
+            ends = [r[axis] + r[axis + 2] for r in rects]
+            spread = len(set(starts))
+            if spread > best_spread and _is_sorted(starts) \
+                    and _is_sorted(ends):
+                self._axis, self._starts, self._ends = axis, starts, ends
+                best_spread = spread
+        if self._axis is None:
+            self._build_grid()
+
+    def _build_grid(self) -> None:
+        """Bucket the rectangles in this index into a grid.
+        """
+        left = min(r[0] for r in self._rects)
+        top = min(r[1] for r in self._rects)
+        right = max(r[0] + r[2] for r in self._rects)
+        bottom = max(r[1] + r[3] for r in self._rects)
+        side = max(1, math.isqrt(len(self._rects)))
+        self._origin = (left, top)
+        self._cell = (max(1, (right - left) // side + 1),
+                      max(1, (bottom - top) // side + 1))
+        self._columns = (right - left) // self._cell[0] + 1
+        self._rows = (bottom - top) // self._cell[1] + 1
+        self._grid = [[] for _ in range(self._columns * self._rows)]
+        for i, (x, y, width, height) in enumerate(self._rects):
+            if width < 0 or height < 0:
+                continue
+            first_col, first_row = self._cell_of(x, y)
+            last_col, last_row = self._cell_of(x + width, y + height)
+            for row in range(first_row, last_row + 1):
+                for col in range(first_col, last_col + 1):
+                    self._grid[row * self._columns + col].append(i)
+
+    def _cell_of(self, x: int, y: int) -> Tuple[int, int]:
+        """Return the (column, row) of the grid cell containing (<x>, <y>).
+        """
+        return ((x - self._origin[0]) // self._cell[0],
+                (y - self._origin[1]) // self._cell[1])
+
+    def query(self, pos: Tuple[int, int]) -> List[int]:
+        """Return the positions of the rectangles in this index that contain
+        <pos>, in increasing order.
+        """
+        if self._axis is not None:
+            value = pos[self._axis]
+            candidates = range(bisect_left(self._ends, value),
+                               bisect_right(self._starts, value))
+        else:
+            col, row = self._cell_of(pos[0], pos[1])
+            if 0 <= col < self._columns and 0 <= row < self._rows:
+                candidates = self._grid[row * self._columns + col]
+            else:
+                candidates = []
+        found = [i for i in candidates if _contains(self._rects[i], pos)]
+        if self._always:
+            found = sorted(set(found).union(self._always))
+        return found
+
+
+def _is_sorted(values: List[int]) -> bool:
+    """Return True iff <values> is in non-decreasing order.
+    """
+    return all(values[i] <= values[i + 1] for i in range(len(values) - 1))
+
+
+def _contains(rect: Rect, pos: Tuple[int, int]) -> bool:
+    """Return True iff <pos> is inside <rect> or on its edge.
+    """
+    x, y, width, height = rect
+    return x <= pos[0] <= x + width and y <= pos[1] <= y + height
+
+
+def overlaps(rect: Rect, area: Optional[Rect]) -> bool:
+    """Return whether <rect> has pixels in <area>, or any pixels at all if
+    <area> is None.
+    """
+    x, y, width, height = rect
+    if width <= 0 or height <= 0:
+        return False
+    if area is None:
+        return True
+    left, top, area_width, area_height = area
+    return x < left + area_width and left < x + width \
+        and y < top + area_height and top < y + height
+
+
+LAYOUTS: Dict[str, Layout] = {
+    'slice_and_dice': slice_and_dice,
+    'squarified': squarified,
+    'strip': strip,
+}
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'heapq', 'math', 'bisect', 'itertools',
+            'numpy', '__future__'
+        ]
+    })
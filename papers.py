@@ -58,13 +58,23 @@ Recommended steps:
    sure you have documented any new private attributes, and that PyTA passes
    on your code.
 """
+from __future__ import annotations
+
 import csv
-from typing import List, Dict
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
 from tm_trees import TMTree
 
 # Filename for the dataset
 DATA_FILE = 'cs1_papers.csv'
 
+# The ways the papers can be grouped above their categories, in the order
+# the visualiser switches between them. 'category' has no group above the
+# categories.
+HIERARCHIES = ('year', 'category', 'author', 'decade')
+
 
 class PaperTree(TMTree):
     """A tree representation of Computer Science Education research paper data.
@@ -76,6 +86,20 @@ class PaperTree(TMTree):
         The list of authors of the PaperTree.
     _doi:
         The string of the doi to access the PaperTree.
+    _year:
+        The year the paper was published, or None if this is a category or
+        the year is not known.
+    _catalogue:
+        The indexes of the papers in this tree if it is the root of a loaded
+        tree or of a view made by filter, and None otherwise.
+    _removed:
+        Whether this tree was deleted from the visualization.
+    _store:
+        The PaperStore this tree was built from if it is the root of a
+        loaded tree, and None otherwise.
+    _hierarchy:
+        The name in HIERARCHIES of the grouping of this tree if _store is
+        not None, and None otherwise.
 
     === Inherited Attributes ===
     rect:
@@ -101,6 +125,11 @@ class PaperTree(TMTree):
     # TO-DO: Add the type contracts for your new attributes here
     _authors: str
     _doi: str
+    _year: Optional[int] = None
+    _catalogue: Optional[PaperIndex] = None
+    _removed: bool = False
+    _store: Optional[PaperStore] = None
+    _hierarchy: Optional[str] = None
 
     def __init__(self, name: str, subtrees: List[TMTree], authors: str = '',
                  doi: str = '', citations: int = 0, by_year: bool = True,
@@ -110,7 +139,8 @@ class PaperTree(TMTree):
 
         If <all_papers> is True, then this tree is to be the root of the paper
         tree. In that case, load data about papers from DATA_FILE to build the
-        tree.
+        tree. The file is only read again if it changed since it was last
+        read, as described in get_store.
 
         If <all_papers> is False, Do NOT load new data.
 
@@ -124,7 +154,11 @@ class PaperTree(TMTree):
         self._authors = authors
         self._doi = doi
         if all_papers:
-            new_subtrees = _build_tree_from_dict(_load_papers_to_dict(by_year))
+            self._store = get_store()
+            self._hierarchy = 'year' if by_year else 'category'
+            self._catalogue = PaperIndex(by_year)
+            new_subtrees = self._store.build(self._hierarchy, self._catalogue)
+            self._store.keep(self)
         else:
             new_subtrees = subtrees
         super().__init__(name, new_subtrees, citations)
@@ -137,90 +171,463 @@ class PaperTree(TMTree):
     def get_suffix(self) -> str:
         """Return the end of the path directory.
         """
-        return ' (category)' if len(self._subtrees) != 0 else ' (paper)'
+        return self._describe(len(self._subtrees), self.data_size)
 
+    @staticmethod
+    def _describe(item_count: int, data_size: int) -> str:
+        """Return the end of the path directory of a category or paper that
+        holds <item_count> subtrees and has size <data_size>.
+        """
+        return ' (category)' if item_count != 0 else ' (paper)'
 
-def _load_papers_to_dict(by_year: bool = True) -> Dict:
-    """Return a nested dictionary of the data read from the papers dataset file.
+    def delete_self(self) -> bool:
+        """Removes the current node from the visualization and
+        returns whether the deletion was successful.
+        """
+        if not super().delete_self():
+            return False
+        self._removed = True
+        return True
+
+    def next_hierarchy(self) -> Optional[PaperTree]:
+        """Return the root of the tree of the same papers grouped by the
+        hierarchy after this one in HIERARCHIES, or None if this tree is not
+        the root of a loaded tree.
+
+        Each tree is built the first time it is asked for and then kept, so
+        switching back and forth does not build it again.
+        """
+        if self._store is None:
+            return None
+        following = HIERARCHIES.index(self._hierarchy) + 1
+        return self._store.tree(HIERARCHIES[following % len(HIERARCHIES)],
+                                self._name)
+
+    def filter(self, author: Optional[str] = None,
+               years: Optional[Tuple[int, int]] = None,
+               category: Optional[str] = None,
+               doi: Optional[str] = None) -> PaperTree:
+        """Return a new tree holding a copy of each paper in this tree that
+        was written by <author>, published in the inclusive range of <years>,
+        is in <category> and has <doi>, leaving out each of these that is
+        None.
+
+        <category> is written as in the dataset, e.g. 'FLP: other', and
+        matches the papers in its subcategories as well. The new tree has
+        the same categories above its papers as this tree, and can be
+        filtered in turn. This tree is not changed.
+
+        The papers are found through the indexes of the root of this tree,
+        so this takes time proportional to the number of papers in the
+        smallest index entry used, not to the size of the tree. Raise a
+        ValueError if the root of this tree was not loaded with
+        all_papers=True or made by filter.
+        """
+        root = self
+        while root._catalogue is None and root._parent_tree is not None:
+            root = root._parent_tree
+        if root._catalogue is None:
+            raise ValueError(f'{self._name!r} is not part of a loaded '
+                             f'paper tree')
+        papers = root._catalogue.find(author, years, category, doi,
+                                      None if root is self else self)
+
+        # Only the root of a grouped tree has groups as its subtrees: the
+        # names below any other tree start at a category.
+        view = PaperTree(self._name, [])
+        view._catalogue = PaperIndex(root._catalogue.grouped and root is self)
+        trie = {}
+        for paper in papers:
+            names = []
+            tree = paper._parent_tree
+            while tree is not self:
+                names.append(tree._name)
+                tree = tree._parent_tree
+            names.reverse()
+            copy = PaperTree(paper._name, [], paper._authors, paper._doi,
+                             paper.data_size)
+            copy._year = paper._year
+            _add_paper(copy, names, trie, view, [], view._catalogue)
+        view.update_data_sizes()
+        return view
+
+
+class PaperIndex:
+    """Inverted indexes over the papers of a PaperTree, used to find papers
+    without walking the tree.
+
+    Papers deleted after they were indexed are kept in the indexes, and left
+    out of the results of find.
+
+    === Public Attributes ===
+    grouped:
+        Whether the first level of subtrees of the tree groups the papers by
+        something other than category, such as their year.
+    authors:
+        The papers written by each author.
+    years:
+        The papers published in each year.
+    categories:
+        The category trees with each category path, which is the tuple of
+        the names of the category and its ancestors, leaving out the group.
+        There is one tree for each group with papers in the category if
+        grouped is True.
+    dois:
+        The paper with each DOI.
 
-    If <by_year>, then use years as the roots of the subtrees of the root of
-    the whole tree. Otherwise, ignore years and use categories only.
-    """
-    # TO-DO: Implement this helper, or remove it if you do not plan to use it
-    final = {}
-    with open(DATA_FILE, 'r') as info:
-        info.readline()
-        doc = csv.reader(info)
-
-        for row in doc:
-            authors = row[0]
-            title = row[1]
-            year = row[2]
-            start_categories = row[3]
-            doi = row[4]
-            citations = row[5]
-            final_categories = start_categories.split(':')
-
-            if by_year:
-                final_categories.insert(0, year)
-
-            temp_dict = final
-            _helper_load(final_categories, temp_dict, title, authors, doi,
-                         citations)
-
-    return final
-
-
-def _helper_load(final_categories: list, temp_dict: dict, title: str,
-                 authors: str, doi: str, citations: str) -> None:
-    """Helper to organize the final dictionary
+    === Private Attributes ===
+    _sorted_years:
+        The keys of years in increasing order, or None if a year was added
+        since they were last sorted.
     """
-    for item in final_categories:
-        if item not in temp_dict.keys():
-            temp_dict[item] = {}
-        temp_dict = temp_dict[item]
-        temp_dict[title] = {}
-    temp_dict = temp_dict[title]
-    temp_dict['authors'] = authors
-    temp_dict['title'] = title
-    temp_dict['doi'] = doi
-    temp_dict['citations'] = int(citations)
-
-
-def _build_tree_from_dict(nested_dict: Dict) -> List[PaperTree]:
-    """Return a list of trees from the nested dictionary <nested_dict>.
+    grouped: bool
+    authors: Dict[str, List[PaperTree]]
+    years: Dict[int, List[PaperTree]]
+    categories: Dict[Tuple[str, ...], List[PaperTree]]
+    dois: Dict[str, PaperTree]
+    _sorted_years: Optional[List[int]]
+
+    def __init__(self, grouped: bool) -> None:
+        """Initialize empty indexes for a tree whose first level of subtrees
+        groups the papers if <grouped>.
+        """
+        self.grouped = grouped
+        self.authors = {}
+        self.years = {}
+        self.categories = {}
+        self.dois = {}
+        self._sorted_years = None
+
+    def add_category(self, path: Tuple[str, ...], tree: PaperTree) -> None:
+        """Index the category <tree> under its category <path>.
+        """
+        self.categories.setdefault(path, []).append(tree)
+
+    def add_paper(self, paper: PaperTree) -> None:
+        """Index <paper> by its authors, year and DOI.
+        """
+        for author in _split_authors(paper._authors):
+            self.authors.setdefault(author, []).append(paper)
+        if paper._year is not None:
+            if paper._year not in self.years:
+                self.years[paper._year] = []
+                self._sorted_years = None
+            self.years[paper._year].append(paper)
+        if paper._doi:
+            self.dois[paper._doi] = paper
+
+    def find(self, author: Optional[str] = None,
+             years: Optional[Tuple[int, int]] = None,
+             category: Optional[str] = None, doi: Optional[str] = None,
+             within: Optional[PaperTree] = None) -> List[PaperTree]:
+        """Return the papers that match each of <author>, <years>,
+        <category> and <doi> that is not None, as described in
+        PaperTree.filter, and that are inside <within> if it is not None.
+
+        The papers of the smallest index entry are checked against the
+        other conditions one by one, so the whole tree is only walked if
+        no condition but <within> is given.
+        """
+        # Each condition that can be looked up gives a list of candidates,
+        # or a list of lists for a range of years.
+        options = []
+        if doi is not None:
+            options.append([[self.dois[doi]]] if doi in self.dois else [])
+        if author is not None:
+            options.append([self.authors.get(author, [])])
+        if years is not None:
+            options.append(self._in_years(years[0], years[1]))
+        ancestors = []
+        if category is not None:
+            path = tuple(category.split(':'))
+            ancestors.append({id(tree) for tree
+                              in self.categories.get(path, [])})
+            if not options:
+                options.append([_papers_in(tree) for tree
+                                in self.categories.get(path, [])])
+        if within is not None:
+            ancestors.append({id(within)})
+            if not options:
+                options.append([_papers_in(within)])
+        if not options:
+            raise ValueError('no condition to find papers by')
+
+        candidates = min(options, key=lambda lists: sum(map(len, lists)))
+        low, high = years if years is not None else (None, None)
+        found = []
+        for papers in candidates:
+            for paper in papers:
+                if (author is None
+                        or author in _split_authors(paper._authors)) \
+                        and (years is None or paper._year is not None
+                             and low <= paper._year <= high) \
+                        and (doi is None or paper._doi == doi) \
+                        and _is_inside(paper, ancestors):
+                    found.append(paper)
+        return found
+
+    def _in_years(self, low: int, high: int) -> List[List[PaperTree]]:
+        """Return the lists of papers published in each year from <low> to
+        <high>, inclusive.
+        """
+        if self._sorted_years is None:
+            self._sorted_years = sorted(self.years)
+        keys = self._sorted_years[bisect_left(self._sorted_years, low):
+                                  bisect_right(self._sorted_years, high)]
+        return [self.years[year] for year in keys]
+
+
+class PaperStore:
+    """The papers of a dataset file, read once and kept as columns, from
+    which a tree of the papers can be built for each of HIERARCHIES.
+
+    Each column holds one value per paper, in the order of the file. The
+    numbers are kept in arrays, and each distinct category is kept once,
+    so the store takes much less memory than a tree of the same papers.
+
+    === Public Attributes ===
+    path:
+        The dataset file the papers were read from.
+    modified:
+        The modification time of the file when it was read.
+
+    === Private Attributes ===
+    _titles:
+        The title of each paper.
+    _authors:
+        The authors of each paper, as written in the file.
+    _dois:
+        The DOI of each paper.
+    _years:
+        The year of each paper, or -1 if it is not known.
+    _citations:
+        The number of citations of each paper.
+    _categories:
+        The index in _category_names of the categories of each paper.
+    _category_names:
+        Each distinct list of categories, from the top category down.
+    _trees:
+        The root of the tree built for each name in HIERARCHIES so far.
+
+    === Representation Invariants ===
+    - All of the columns have the same length.
     """
-    # TO-DO: Implement this helper, or remove it if you do not plan to use it
-    final = []
-    if 'authors' in nested_dict.keys():
-        _build(nested_dict, final)
+    path: str
+    modified: float
+    _titles: List[str]
+    _authors: List[str]
+    _dois: List[str]
+    _years: array
+    _citations: array
+    _categories: array
+    _category_names: List[List[str]]
+    _trees: Dict[str, PaperTree]
+
+    def __init__(self, path: str = DATA_FILE) -> None:
+        """Initialize a new PaperStore with the papers in the dataset file
+        at <path>.
+
+        The rows are read one at a time and added to the columns, so the
+        file is never held in memory.
+        """
+        self.path = path
+        self.modified = os.path.getmtime(path)
+        self._titles = []
+        self._authors = []
+        self._dois = []
+        self._years = array('i')
+        self._citations = array('q')
+        self._categories = array('i')
+        self._category_names = []
+        self._trees = {}
+
+        codes = {}
+        with open(path, 'r', newline='') as info:
+            doc = csv.reader(info)
+            next(doc, None)
+
+            for row in doc:
+                authors, title, year, categories, doi, citations = row[:6]
+                code = codes.get(categories)
+                if code is None:
+                    code = codes[categories] = len(self._category_names)
+                    self._category_names.append(categories.split(':'))
+                self._titles.append(title)
+                self._authors.append(authors)
+                self._dois.append(doi)
+                self._years.append(int(year) if year.isdigit() else -1)
+                self._citations.append(int(citations))
+                self._categories.append(code)
+
+    def __len__(self) -> int:
+        """Return the number of papers in this store.
+        """
+        return len(self._titles)
 
-    elif nested_dict == {}:
-        return final
+    def tree(self, hierarchy: str, name: str = 'CS1') -> PaperTree:
+        """Return the root of the tree of the papers in this store grouped
+        by <hierarchy>, a name in HIERARCHIES, building it with the name
+        <name> if it has not been built yet.
+        """
+        root = self._trees.get(hierarchy)
+        if root is None:
+            catalogue = PaperIndex(hierarchy != 'category')
+            root = PaperTree(name, self.build(hierarchy, catalogue))
+            root._store = self
+            root._hierarchy = hierarchy
+            root._catalogue = catalogue
+            self._trees[hierarchy] = root
+        return root
+
+    def keep(self, root: PaperTree) -> None:
+        """Keep <root>, which was built from this store, as the tree for its
+        hierarchy, unless one has been built already.
+        """
+        self._trees.setdefault(root._hierarchy, root)
+
+    def build(self, hierarchy: str, catalogue: Optional[PaperIndex] = None) \
+            -> List[PaperTree]:
+        """Return new subtrees of the root of a tree of the papers in this
+        store grouped by <hierarchy>, a name in HIERARCHIES. If <catalogue>
+        is not None, add each category and paper to it.
+
+        The categories are found through a trie of
+        (tree, {name: child entry}) pairs, which is thrown away once every
+        paper has been added. The data_size of each category is summed
+        once, at the end.
+        """
+        if hierarchy not in HIERARCHIES:
+            raise ValueError(f'unknown hierarchy {hierarchy!r}; expected one '
+                             f'of {", ".join(HIERARCHIES)}')
+        trie = {}
+        roots = []
+        for i, title in enumerate(self._titles):
+            names = self._category_names[self._categories[i]]
+            group = self._group(hierarchy, i)
+            if group is not None:
+                names = [group] + names
+
+            paper = PaperTree(title, [], self._authors[i], self._dois[i],
+                              self._citations[i])
+            if self._years[i] >= 0:
+                paper._year = self._years[i]
+            _add_paper(paper, names, trie, None, roots, catalogue)
+
+        for root in roots:
+            root.update_data_sizes()
+        return roots
+
+    def _group(self, hierarchy: str, i: int) -> Optional[str]:
+        """Return the name of the group of paper <i> above its categories
+        in <hierarchy>, or None if <hierarchy> has no groups.
+        """
+        year = self._years[i]
+        if hierarchy == 'year':
+            return str(year) if year >= 0 else 'unknown year'
+        elif hierarchy == 'decade':
+            return f'{year // 10 * 10}s' if year >= 0 else 'unknown year'
+        elif hierarchy == 'author':
+            authors = _split_authors(self._authors[i])
+            return authors[0] if authors else 'unknown author'
+        return None
 
-    else:
-        _helper_build(nested_dict, final)
 
-    return final
+# The store read from each dataset file, so that it is only read once.
+_STORES: Dict[str, PaperStore] = {}
 
 
-def _build(nested_dict: dict, final: list) -> None:
-    add = PaperTree(nested_dict['title'], [], nested_dict['authors'],
-                    nested_dict['doi'], nested_dict['citations'])
-    final.append(add)
+def get_store(path: str = DATA_FILE) -> PaperStore:
+    """Return the PaperStore of the dataset file at <path>, reading the file
+    only if it was not read before or was modified since.
+    """
+    store = _STORES.get(path)
+    if store is None or store.modified != os.path.getmtime(path):
+        store = _STORES[path] = PaperStore(path)
+    return store
+
+
+def _add_paper(paper: PaperTree, names: List[str], trie: Dict,
+               parent: Optional[PaperTree], roots: List[PaperTree],
+               catalogue: Optional[PaperIndex]) -> None:
+    """Add <paper> under the categories <names>, the first of which is a
+    subtree of <parent>, or is added to <roots> if <parent> is None.
+
+    <trie> maps the name of each category already made to a
+    (tree, {name: child entry}) pair, and the categories not in it are made
+    and added to it. If <catalogue> is not None, the new categories and
+    <paper> are added to it.
+    """
+    level = trie
+    for depth, name in enumerate(names):
+        entry = level.get(name)
+        if entry is None:
+            entry = (PaperTree(name, []), {})
+            level[name] = entry
+            _attach(entry[0], parent, roots)
+            if catalogue is not None and depth >= catalogue.grouped:
+                catalogue.add_category(
+                    tuple(names[catalogue.grouped:depth + 1]), entry[0])
+        parent, level = entry
+    _attach(paper, parent, roots)
+    if catalogue is not None:
+        catalogue.add_paper(paper)
+
+
+def _split_authors(authors: str) -> List[str]:
+    """Return the names of the authors in <authors>, as written in the
+    dataset, e.g. 'Gries, David and Conway, Richard W.'.
+    """
+    return [name.strip() for name in authors.split(' and ') if name.strip()]
+
+
+def _papers_in(tree: PaperTree) -> List[PaperTree]:
+    """Return the leaves of <tree>.
+    """
+    papers = []
+    stack = [tree]
+    while stack:
+        tree = stack.pop()
+        if tree._subtrees:
+            stack.extend(tree._subtrees)
+        else:
+            papers.append(tree)
+    return papers
 
 
-def _helper_build(nested_dict: dict, final: list) -> None:
-    for title, item in nested_dict.items():
-        add = PaperTree(title, _build_tree_from_dict(item))
-        final.append(add)
+def _is_inside(paper: PaperTree, ancestors: List[set]) -> bool:
+    """Return whether <paper> was not deleted and, for each set of tree ids
+    in <ancestors>, has an ancestor whose id is in that set.
+    """
+    found = [False] * len(ancestors)
+    tree = paper
+    while tree is not None:
+        if tree._removed:
+            return False
+        for i, ids in enumerate(ancestors):
+            found[i] = found[i] or id(tree) in ids
+        tree = tree._parent_tree
+    return all(found)
+
+
+def _attach(tree: PaperTree, parent: Optional[PaperTree],
+            roots: List[PaperTree]) -> None:
+    """Add <tree> as the last subtree of <parent>, or to <roots> if <parent>
+    is None, without updating any data_size.
+    """
+    if parent is None:
+        roots.append(tree)
+    else:
+        tree._parent_tree = parent
+        parent._subtrees.append(tree)
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'allowed-import-modules': ['python_ta', 'typing', 'csv', 'tm_trees'],
-        'allowed-io': ['_load_papers_to_dict'],
+        'allowed-import-modules': ['python_ta', 'typing', 'csv', 'bisect',
+                                   'array', 'os', 'tm_trees',
+                                   '__future__'],
+        'allowed-io': ['PaperStore.__init__'],
         'max-args': 8
     })
@@ -0,0 +1,180 @@
+"""
+Assignment 2: Profiling
+
+=== CSC148 Summer 2022 ===
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, David Liu, Diane Horton,
+                   Haocheng Hu, Jacqueline Smith
+
+=== Module Description ===
+This module contains the Profiler that times the trees and the visualiser,
+so that it is possible to tell which part of the work a slow frame went to.
+
+PROFILER is the one Profiler used everywhere. It is off until
+PROFILER.enabled is set, and can be turned on and off at any time. The
+methods of TMTree that do the most work are wrapped with @timed, and the
+visualiser times each stage of its loop with PROFILER.span. While the
+profiler is off, a timed call costs one extra function call and one
+attribute check, and nothing is recorded.
+
+While it is on, the profiler keeps a running total of the time and number
+of calls for each name, which the visualiser shows as an overlay, and a
+list of events that export_trace writes in the Chrome trace format. A
+trace can be opened in chrome://tracing or https://ui.perfetto.dev.
+"""
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Tuple
+
+
+class Profiler:
+    """Collects the time spent in named parts of the program, and counters.
+
+    === Public Attributes ===
+    enabled:
+        Whether anything is being recorded.
+
+    === Private Attributes ===
+    _events:
+        The most recent trace events, as dictionaries in the Chrome trace
+        format. The oldest events are dropped once there are max_events.
+    _totals:
+        The number of calls and total seconds for each name since the
+        totals were last taken.
+    _counters:
+        The current value of each counter.
+    _origin:
+        The time.perf_counter_ns() value that trace timestamps count from.
+    """
+    enabled: bool
+    _events: Deque[Dict[str, Any]]
+    _totals: Dict[str, List[float]]
+    _counters: Dict[str, int]
+    _origin: int
+
+    def __init__(self, max_events: int = 1000000) -> None:
+        """Initialize a new Profiler that is off, and keeps at most
+        <max_events> trace events.
+        """
+        self.enabled = False
+        self._events = deque(maxlen=max_events)
+        self._totals = {}
+        self._counters = {}
+        self._origin = time.perf_counter_ns()
+
+    def record(self, name: str, category: str, start: int, end: int) -> None:
+        """Record that <name> in <category> ran from <start> to <end>, which
+        are time.perf_counter_ns() values.
+        """
+        total = self._totals.get(name)
+        if total is None:
+            self._totals[name] = [1, (end - start) / 1e9]
+        else:
+            total[0] += 1
+            total[1] += (end - start) / 1e9
+        self._events.append({'name': name, 'cat': category, 'ph': 'X',
+                             'ts': (start - self._origin) / 1000,
+                             'dur': (end - start) / 1000, 'pid': os.getpid(),
+                             'tid': threading.get_ident()})
+
+    @contextmanager
+    def span(self, name: str, category: str = 'visualiser') -> Iterator[None]:
+        """Time the body of a with statement as <name> in <category>, if this
+        profiler is on.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.perf_counter_ns())
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Add <amount> to the counter <name>, if this profiler is on.
+        """
+        if not self.enabled:
+            return
+        self._counters[name] = self._counters.get(name, 0) + amount
+        self._events.append({'name': name, 'ph': 'C',
+                             'ts': (time.perf_counter_ns() - self._origin)
+                             / 1000,
+                             'pid': os.getpid(),
+                             'args': {'value': self._counters[name]}})
+
+    def counters(self) -> Dict[str, int]:
+        """Return the current value of each counter.
+        """
+        return dict(self._counters)
+
+    def take_totals(self) -> List[Tuple[str, int, float]]:
+        """Return a (name, calls, seconds) triple for each name recorded
+        since the last call, slowest first, and start new totals.
+        """
+        totals, self._totals = self._totals, {}
+        return sorted(((name, int(calls), seconds)
+                       for name, (calls, seconds) in totals.items()),
+                      key=lambda item: -item[2])
+
+    def export_trace(self, path: str) -> None:
+        """Write the recorded events to <path> in the Chrome trace format.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': list(self._events),
+                       'displayTimeUnit': 'ms'}, file)
+
+    def clear(self) -> None:
+        """Forget every event, total and counter recorded so far.
+        """
+        self._events.clear()
+        self._totals = {}
+        self._counters = {}
+
+
+PROFILER = Profiler()
+
+
+def timed(category: str) -> Callable[[Callable], Callable]:
+    """Return a decorator that times each call of a function as its
+    qualified name in <category>, while PROFILER is on.
+    """
+    def decorator(func: Callable) -> Callable:
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                PROFILER.record(name, category, start,
+                                time.perf_counter_ns())
+        return wrapper
+    return decorator
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'collections', 'contextlib', 'functools',
+            'json', 'os', 'threading', 'time', '__future__'
+        ]
+    })
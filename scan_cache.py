@@ -0,0 +1,292 @@
+"""
+Assignment 2: Scan Cache
+
+=== CSC148 Summer 2022 ===
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, David Liu, Diane Horton,
+                   Haocheng Hu, Jacqueline Smith
+
+=== Module Description ===
+This module contains ScanCache, which saves the result of a Scanner to a
+file so that the next scan of the same path only reads the folders that
+were modified since.
+
+A snapshot is a gzip-compressed JSON object holding one list per field of
+ScanEntry, with the entries in preorder. A folder's entry is followed by the
+entries inside it, and its count says how many there are; a file has a count
+of -1. Snapshots are plain data, so loading one never runs any code.
+
+The same format is used outside of a ScanCache: save_snapshot and
+load_snapshot write and read one snapshot as a file of its own, so that
+scans made by other processes or on other computers can be merged, as
+scan_shards does.
+
+A folder can be modified again within the same tick of its file system's
+clock, without its mtime changing. So folders modified shortly before a
+snapshot was taken are always read again, as git does for its index.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+
+from fs_scanner import OnRead, ScanEntry, Scanner
+
+# Increase this whenever the snapshot format changes, so that older
+# snapshots are ignored instead of being misread.
+SNAPSHOT_VERSION = 1
+
+# Folders modified less than this many nanoseconds before a snapshot was
+# taken are not trusted. This covers file systems with coarse timestamps.
+RACY_WINDOW = 2 * 10 ** 9
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'treemap')
+
+
+class ScanCache:
+    """A folder of scan snapshots, one for each path that was scanned.
+
+    === Public Attributes ===
+    directory:
+        The folder that holds the snapshots.
+    max_bytes:
+        The largest snapshot file to keep, in bytes, or None for no limit.
+        A larger snapshot is not saved.
+    refresh:
+        Whether to ignore the saved snapshots and read every folder again.
+        The new snapshots are still saved.
+
+    === Representation Invariants ===
+    - max_bytes is None or max_bytes >= 0
+    """
+    directory: str
+    max_bytes: Optional[int]
+    refresh: bool
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR,
+                 max_bytes: Optional[int] = None,
+                 refresh: bool = False) -> None:
+        """Initialize a new ScanCache that keeps its snapshots in
+        <directory>.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+
+    def scan(self, scanner: Scanner, path: str,
+             on_read: Optional[OnRead] = None) -> ScanEntry:
+        """Return the ScanEntry for the file or folder at <path> read by
+        <scanner>, reusing the saved snapshot of <path> if there is one, and
+        save the result as the new snapshot.
+
+        <on_read> is passed on to Scanner.scan.
+        """
+        started = time.time_ns()
+        mode = scanner.mode()
+        entry = scanner.scan(path, None if self.refresh
+                             else self.load(path, mode), on_read)
+        self.save(path, entry, started, mode)
+        return entry
+
+    def snapshot_path(self, path: str, mode: str = '') -> str:
+        """Return the path of the snapshot file for <path> scanned by a
+        Scanner whose mode() is <mode>.
+
+        Each mode has its own snapshot, since the sizes found differ.
+        """
+        name = os.path.abspath(path) + (f'\0{mode}' if mode else '')
+        key = hashlib.sha1(name.encode('utf-8', 'surrogateescape'))
+        return os.path.join(self.directory, key.hexdigest() + '.json.gz')
+
+    def load(self, path: str, mode: str = '') -> Optional[ScanEntry]:
+        """Return the saved snapshot of <path> scanned in <mode>, or None if
+        there is no readable snapshot of it.
+
+        The folders modified too shortly before the snapshot was taken have
+        an mtime of 0, so that a Scanner reads them again.
+        """
+        try:
+            found, _, entry = load_snapshot(self.snapshot_path(path, mode),
+                                            RACY_WINDOW)
+        except (OSError, ValueError):
+            return None
+        return entry if found == os.path.abspath(path) else None
+
+    def save(self, path: str, entry: ScanEntry,
+             scanned: Optional[int] = None, mode: str = '') -> bool:
+        """Save <entry> as the snapshot of <path> scanned in <mode>, and
+        return whether it was saved.
+
+        <scanned> is the time in nanoseconds when the scan of <entry>
+        started, or None if it started now.
+
+        The snapshot is written to a temporary file that then replaces the
+        old snapshot, so an interrupted save never leaves a damaged file.
+        A snapshot larger than max_bytes is not saved, and the old snapshot
+        of <path> is removed so that it is not reused.
+        """
+        compressed = encode_snapshot(path, entry, scanned)
+        target = self.snapshot_path(path, mode)
+        try:
+            if self.max_bytes is not None \
+                    and len(compressed) > self.max_bytes:
+                if os.path.exists(target):
+                    os.remove(target)
+                return False
+            os.makedirs(self.directory, exist_ok=True)
+            _write_file(target, compressed)
+        except OSError:
+            return False
+        return True
+
+
+def encode_snapshot(path: str, entry: ScanEntry,
+                    scanned: Optional[int] = None) -> bytes:
+    """Return the compressed snapshot of <entry>, the result of a scan of
+    <path> that started at time <scanned> in nanoseconds, or now if
+    <scanned> is None.
+    """
+    if scanned is None:
+        scanned = time.time_ns()
+    names, sizes, mtimes, counts = encode_entries(entry)
+    data = json.dumps({'version': SNAPSHOT_VERSION,
+                       'path': os.path.abspath(path), 'scanned': scanned,
+                       'names': names,
+                       'sizes': sizes, 'mtimes': mtimes,
+                       'counts': counts}, separators=(',', ':'))
+    return gzip.compress(data.encode('utf-8'), compresslevel=1)
+
+
+def decode_snapshot(data: bytes, racy_window: Optional[int] = None) \
+        -> Tuple[str, int, ScanEntry]:
+    """Return the absolute path that was scanned, the time the scan started
+    and the ScanEntry found, from the snapshot <data> made by
+    encode_snapshot.
+
+    If <racy_window> is not None, the folders modified less than
+    <racy_window> nanoseconds before the scan started have an mtime of 0,
+    so that a Scanner reads them again.
+
+    Raise a ValueError if <data> is not a snapshot in this format.
+    """
+    try:
+        snapshot = json.loads(gzip.decompress(data).decode('utf-8'))
+    except (OSError, EOFError, ValueError) as error:
+        raise ValueError('not a scan snapshot') from error
+    if not isinstance(snapshot, dict) \
+            or snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError('not a scan snapshot of this version')
+    try:
+        mtimes = snapshot['mtimes']
+        if racy_window is not None:
+            trusted = snapshot['scanned'] - racy_window
+            mtimes = [0 if count >= 0 and mtime >= trusted else mtime
+                      for mtime, count in zip(mtimes, snapshot['counts'])]
+        return snapshot['path'], snapshot['scanned'], decode_entries(
+            snapshot['names'], snapshot['sizes'], mtimes, snapshot['counts'])
+    except (KeyError, TypeError) as error:
+        raise ValueError('scan snapshot is incomplete') from error
+
+
+def save_snapshot(filename: str, path: str, entry: ScanEntry,
+                  scanned: Optional[int] = None) -> None:
+    """Write the snapshot of <entry>, the result of a scan of <path> that
+    started at time <scanned>, to the file <filename>, as encode_snapshot.
+
+    Raise an OSError if the file cannot be written.
+    """
+    _write_file(filename, encode_snapshot(path, entry, scanned))
+
+
+def load_snapshot(filename: str, racy_window: Optional[int] = None) \
+        -> Tuple[str, int, ScanEntry]:
+    """Return the path, the start time and the ScanEntry of the snapshot in
+    the file <filename>, as decode_snapshot.
+
+    Raise an OSError if the file cannot be read, and a ValueError if it
+    does not hold a snapshot.
+    """
+    with open(filename, 'rb') as file:
+        return decode_snapshot(file.read(), racy_window)
+
+
+def _write_file(filename: str, data: bytes) -> None:
+    """Write <data> to a temporary file that then replaces <filename>, so
+    that an interrupted write never leaves a damaged file.
+    """
+    temporary = f'{filename}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, filename)
+
+
+def encode_entries(entry: ScanEntry) \
+        -> Tuple[List[str], List[int], List[int], List[int]]:
+    """Return the names, sizes, mtimes and counts of <entry> and every entry
+    inside it, in preorder, as four lists.
+    """
+    names, sizes, mtimes, counts = [], [], [], []
+    stack = [entry]
+    while stack:
+        entry = stack.pop()
+        names.append(entry.name)
+        sizes.append(entry.size)
+        mtimes.append(entry.mtime)
+        if entry.children is None:
+            counts.append(-1)
+        else:
+            counts.append(len(entry.children))
+            stack.extend(reversed(entry.children))
+    return names, sizes, mtimes, counts
+
+
+def decode_entries(names: List[str], sizes: List[int], mtimes: List[int],
+                   counts: List[int]) -> ScanEntry:
+    """Return the ScanEntry encoded by encode_entries as <names>, <sizes>,
+    <mtimes> and <counts>.
+
+    Raise a ValueError if the lists do not encode exactly one entry.
+    """
+    if not len(names) == len(sizes) == len(mtimes) == len(counts) > 0:
+        raise ValueError('snapshot lists have different lengths')
+    root = None
+    # Each element is a folder and the number of its entries still to come.
+    stack = []
+    for name, size, mtime, count in zip(names, sizes, mtimes, counts):
+        entry = ScanEntry(name, size, None if count < 0 else [], mtime)
+        if stack:
+            stack[-1][0].children.append(entry)
+            stack[-1][1] -= 1
+            if stack[-1][1] == 0:
+                stack.pop()
+        elif root is None:
+            root = entry
+        else:
+            raise ValueError('snapshot holds more than one tree')
+        if count > 0:
+            stack.append([entry, count])
+    if stack:
+        raise ValueError('snapshot ends in the middle of a folder')
+    return root
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'gzip', 'hashlib', 'json', 'os', 'time',
+            '__future__', 'fs_scanner'
+        ]
+    })
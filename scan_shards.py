@@ -0,0 +1,247 @@
+"""
+Assignment 2: Sharded Scans
+
+=== CSC148 Summer 2022 ===
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, David Liu, Diane Horton,
+                   Haocheng Hu, Jacqueline Smith
+
+=== Module Description ===
+This module scans a folder with a pool of processes, and merges scans that
+were made separately into one.
+
+scan_sharded reads the folder itself, then scans each folder directly
+inside it as an independent shard in a worker process, so that a large scan
+is not held to one core by the global interpreter lock. Each shard is sent
+back as a snapshot in the format of scan_cache, which is much smaller than
+the ScanEntry objects it holds.
+
+merge_entries grafts the scans of different paths, such as snapshots saved
+on other computers, under the folder that holds them all. Folder sizes are
+not stored in a scan: FileSystemTree adds them up when the merged entry is
+turned into a tree, so they are always the totals of what was merged.
+
+Each shard is told which folder it was shared out from, so a link back to
+that folder is found to be a cycle, as in a serial scan. The hard-linked
+files found are recorded by each shard on its own, so with
+Scanner.unique_inodes a file hard-linked from two shards is counted in
+each.
+
+Run this module to save the snapshot of a folder, or to merge saved
+snapshots into one:
+
+    python scan_shards.py scan /srv --out srv.json.gz --processes 8
+    python scan_shards.py merge srv.json.gz home.json.gz --out all.json.gz
+
+A snapshot can be shown with treemap_visualiser.py --snapshot. Run this
+module with no arguments to check it with python_ta.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import FrozenSet, List, Optional, Tuple
+
+from fs_scanner import ScanEntry, Scanner
+from scan_cache import ScanCache, decode_snapshot, encode_snapshot, \
+    load_snapshot, save_snapshot
+
+# The counters of a Scanner, in the order a shard sends them back.
+_COUNTERS = ('errors', 'reused', 'folders', 'entries', 'linked')
+
+
+def scan_sharded(path: str, scanner: Optional[Scanner] = None,
+                 processes: Optional[int] = None,
+                 cache: Optional[ScanCache] = None) -> ScanEntry:
+    """Return the ScanEntry for the file or folder at <path>, as
+    Scanner.scan does, with each folder directly inside it scanned by one
+    of up to <processes> worker processes, or one per CPU if <processes> is
+    None.
+
+    The shards are read with the options of <scanner>, or of a
+    single-threaded Scanner if it is None, and the counters of <scanner>
+    are set to the totals of the whole scan. If <cache> is not None, each
+    shard reuses and updates its own snapshot in <cache>.
+
+    A file, or a folder with fewer than two folders in it, is scanned in
+    this process, since there is nothing to share out, and so is everything
+    if <processes> is 1 or less.
+
+    Precondition: <path> is a valid path for this computer.
+    """
+    if scanner is None:
+        scanner = Scanner()
+    if processes is not None and processes <= 1 \
+            or not os.path.isdir(path):
+        return _scan(scanner, path, cache)
+    for name in _COUNTERS:
+        setattr(scanner, name, 0)
+    stat = os.stat(path)
+    children = scanner.read_folder(path)
+    shards = [i for i, sub in enumerate(children) if sub.is_dir()]
+    if len(shards) < 2:
+        return _scan(scanner, path, cache)
+    scanner.folders += 1
+    scanner.entries += len(children)
+
+    above = frozenset([(stat.st_dev, stat.st_ino)])
+    jobs = [(scanner, os.path.join(path, children[i].name), cache, above)
+            for i in shards]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for i, (data, counts) in zip(shards, pool.map(_scan_shard, jobs)):
+            children[i] = decode_snapshot(data)[2]
+            for name, count in zip(_COUNTERS, counts):
+                setattr(scanner, name, getattr(scanner, name) + count)
+    # The size of a folder is only shown while it is empty, which this one
+    # is not, so the apparent size is used whatever the options.
+    return ScanEntry(os.path.basename(path), stat.st_size, children,
+                     stat.st_mtime_ns)
+
+
+def merge_entries(snapshots: List[Tuple[str, ScanEntry]]) \
+        -> Tuple[str, ScanEntry]:
+    """Return the path of the folder that holds every path in <snapshots>,
+    and a ScanEntry for that folder with the entry of each path grafted at
+    its place.
+
+    <snapshots> holds (absolute path, ScanEntry) pairs, such as those
+    returned by load_snapshot. The folders between the common folder and
+    each path that no snapshot covers are empty folders with an mtime of 0,
+    so that a Scanner given the result reads them again. An entry replaces
+    whatever an earlier entry in <snapshots> held at its path, so a newer
+    scan of part of a folder can be merged over an older scan of all of it.
+    The entries in <snapshots> must not be used afterwards, since they are
+    now part of the result.
+
+    Raise a ValueError if <snapshots> is empty, or if its paths have no
+    folder in common.
+    """
+    paths = [os.path.normpath(path) for path, _ in snapshots]
+    common = os.path.commonpath(paths)
+    root = ScanEntry(os.path.basename(common) or common, 0, [])
+    for path, (_, entry) in zip(paths, snapshots):
+        if path == common:
+            entry.name = root.name
+            root = entry
+            continue
+        names = os.path.relpath(path, common).split(os.sep)
+        folder = root
+        for name in names[:-1]:
+            folder = _graft(folder, ScanEntry(name, 0, []), False)
+        entry.name = names[-1]
+        _graft(folder, entry, True)
+    return common, root
+
+
+def merge_snapshots(filenames: List[str]) -> Tuple[str, ScanEntry]:
+    """Return the common folder and the merged ScanEntry of the snapshot
+    files <filenames>, in order, as merge_entries.
+
+    Raise an OSError if a file cannot be read, and a ValueError if it does
+    not hold a snapshot or the snapshots cannot be merged.
+    """
+    snapshots = []
+    for filename in filenames:
+        path, _, entry = load_snapshot(filename)
+        snapshots.append((path, entry))
+    return merge_entries(snapshots)
+
+
+def _graft(folder: ScanEntry, entry: ScanEntry,
+           replace: bool) -> ScanEntry:
+    """Put <entry> into <folder>, in place of the entry of the same name if
+    there is one, and return it. If not <replace>, an existing folder of
+    that name is kept and returned instead.
+
+    A <folder> that was scanned as a file becomes a folder.
+    """
+    if folder.children is None:
+        folder.children = []
+    for i, sub in enumerate(folder.children):
+        if sub.name == entry.name:
+            if not replace and sub.is_dir():
+                return sub
+            folder.children[i] = entry
+            return entry
+    folder.children.append(entry)
+    return entry
+
+
+def _scan(scanner: Scanner, path: str,
+          cache: Optional[ScanCache]) -> ScanEntry:
+    """Return the ScanEntry for <path> read by <scanner>, through <cache>
+    if it is not None.
+    """
+    return scanner.scan(path) if cache is None else cache.scan(scanner, path)
+
+
+def _scan_shard(job: Tuple[Scanner, str, Optional[ScanCache],
+                          FrozenSet[Tuple[int, int]]]) \
+        -> Tuple[bytes, Tuple[int, ...]]:
+    """Scan the folder in <job>, below the folders whose (st_dev, st_ino)
+    pairs are in <job>, and return its snapshot and the counters of the
+    scanner, as scan_sharded does for one shard. This runs in a worker
+    process.
+    """
+    scanner, path, cache, scanner._above = job
+    started = time.time_ns()
+    entry = _scan(scanner, path, cache)
+    return encode_snapshot(path, entry, started), \
+        tuple(getattr(scanner, name) for name in _COUNTERS)
+
+
+def _parse_args() -> argparse.Namespace:
+    """Return the command line options for saving and merging snapshots.
+    """
+    parser = argparse.ArgumentParser(
+        description='Save the scan snapshot of a folder, or merge saved '
+                    'snapshots into one.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    scan = commands.add_parser('scan', help='scan a folder')
+    scan.add_argument('path', help='the folder to scan')
+    scan.add_argument('--processes', type=int, default=None,
+                      help='number of processes (default: one per CPU)')
+    scan.add_argument('--workers', type=int, default=1,
+                      help='number of threads used by each process')
+    merge = commands.add_parser('merge', help='merge snapshots')
+    merge.add_argument('snapshots', nargs='+',
+                       help='the snapshot files, with the newest last')
+    for command in (scan, merge):
+        command.add_argument('--out', required=True,
+                             help='the snapshot file to write')
+    return parser.parse_args()
+
+
+if __name__ == '__main__' and len(sys.argv) == 1:
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'argparse', 'os', 'sys', 'time',
+            'concurrent.futures', '__future__', 'fs_scanner', 'scan_cache'
+        ]
+    })
+elif __name__ == '__main__':
+    ARGS = _parse_args()
+    try:
+        if ARGS.command == 'scan':
+            STARTED = time.time_ns()
+            ROOT = os.path.abspath(ARGS.path)
+            ENTRY = scan_sharded(ROOT, Scanner(ARGS.workers), ARGS.processes)
+        else:
+            STARTED = None
+            ROOT, ENTRY = merge_snapshots(ARGS.snapshots)
+        save_snapshot(ARGS.out, ROOT, ENTRY, STARTED)
+    except (OSError, ValueError) as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    print(f'{ROOT} -> {ARGS.out}')
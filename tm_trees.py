@@ -22,8 +22,24 @@ from __future__ import annotations
 
 import math
 import os
+import sys
 from random import randint
-from typing import List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from fs_scanner import FolderSizer, Scanner, ScanEntry, ScanStream
+from scan_cache import ScanCache
+from scan_shards import scan_sharded
+from layouts import DEFAULT_LAYOUT, LAYOUTS, Layout, RectIndex, overlaps
+from profiling import PROFILER, timed
+
+# Set this to True to check the representation invariants of the whole tree
+# after every change_size, move and delete_self. This visits every tree, so
+# it should only be used while debugging.
+CHECK_INVARIANTS = False
+
+# Trees with more subtrees than this get a RectIndex for finding the subtree
+# at a position. Smaller trees are faster to search one subtree at a time.
+INDEX_THRESHOLD = 16
 
 
 class TMTree:
@@ -32,12 +48,11 @@ class TMTree:
 
     This is an abstract class that should not be instantiated directly.
 
-    You may NOT add any attributes, public or private, to this class.
-    However, part of this assignment will involve you implementing new public
-    *methods* for this interface.
-    You should not add any new public methods other than those required by
-    the client code.
-    You can, however, freely add private methods as needed.
+    Besides the attributes of the original interface, a TMTree keeps some
+    private state, from _layout to _path below, so that it can be laid out
+    again and find its path without walking the whole tree. Only add public
+    methods that the client code needs; private methods and attributes can
+    be added as needed, as long as they are documented here.
 
     === Public Attributes ===
     rect:
@@ -58,6 +73,22 @@ class TMTree:
         as a subtree, or None if this tree is not part of a larger tree.
     _expanded:
         Whether or not this tree is considered expanded for visualization.
+    _layout:
+        The name of the layout algorithm chosen for this tree with
+        set_layout, or None to use the same layout as the parent tree.
+    _index:
+        An index over the rectangles of the subtrees, built by
+        update_rectangles for expanded trees with many subtrees, or None.
+    _stray:
+        Whether this tree held an expanded tree of data_size 0 when it was
+        last laid out, so that part of it may be outside of rect.
+    _dirty:
+        Whether the size, the subtrees or the expansion of this tree or one
+        of its descendants changed since update_dirty_rectangles last laid
+        this tree out.
+    _path:
+        The path string of this tree, saved by get_path_string, or None if
+        it was not asked for since this tree was last moved or deleted.
 
     === Representation Invariants ===
     - data_size >= 0
@@ -76,6 +107,12 @@ class TMTree:
     - if _expanded is False, then _expanded is False for every tree
       in _subtrees
     - if _subtrees is empty, then _expanded is False
+
+    - if _layout is not None, then it is a key of layouts.LAYOUTS
+    - if _index is not None, then it holds one rectangle per subtree, in the
+      same order as _subtrees
+    - if _path is not None, then _parent_tree is None or _parent_tree._path
+      is not None
     """
 
     rect: Tuple[int, int, int, int]
@@ -85,6 +122,11 @@ class TMTree:
     _subtrees: List[TMTree]
     _parent_tree: Optional[TMTree]
     _expanded: bool
+    _layout: Optional[str] = None
+    _index: Optional[RectIndex] = None
+    _stray: bool = False
+    _dirty: bool = False
+    _path: Optional[str] = None
 
     def __init__(self, name: str, subtrees: List[TMTree],
                  data_size: int = 0) -> None:
@@ -101,7 +143,8 @@ class TMTree:
         Precondition: if <name> is None, then <subtrees> is empty.
         """
         self.rect = (0, 0, 0, 0)
-        self._name = name
+        # The same names appear in many places, so only one copy is kept.
+        self._name = name if name is None else sys.intern(name)
         self._subtrees = subtrees[:]
         self._parent_tree = None
 
@@ -122,17 +165,12 @@ class TMTree:
 
         self._colour = (randint(0, 255), randint(0, 255), randint(0, 255))
 
-        # if self._subtrees is not None or self._subtrees != []:
-        #     sum_size = 0
-        #     for sub in self._subtrees:
-        #         sum_size += sub.data_size
-        #         sub._parent_tree = self
-        #     self.data_size = sum_size
-        # else:
-        #     self.data_size = data_size
-
-        self.data_size = data_size
-        self._helper_size()
+        # Subtrees are always built before their parent, so each subtree's
+        # data_size is already known and only one level needs to be summed.
+        if self._subtrees:
+            self.data_size = sum(sub.data_size for sub in self._subtrees)
+        else:
+            self.data_size = data_size
 
         for sub in self._subtrees:
             sub._parent_tree = self
@@ -160,9 +198,13 @@ class TMTree:
         """
         return self._parent_tree
 
+    @timed('tree')
     def update_rectangles(self, rect: Tuple[int, int, int, int]) -> None:
         """Update the rectangles in this tree and its descendents using the
         treemap algorithm to fill the area defined by pygame rectangle <rect>.
+
+        The layout algorithm is the one chosen with set_layout for this tree
+        or its closest ancestor, or slice-and-dice if none was chosen.
         """
         # TO-DO: (Task 2) Complete the body of this method.
         # Read the handout carefully to help get started identifying base cases,
@@ -171,71 +213,139 @@ class TMTree:
         # Programming tip: use "tuple unpacking assignment" to easily extract
         # elements of a rectangle, as follows.
         # x, y, width, height = rect
+        if self._layout_rectangles(rect, LAYOUTS[self._get_layout()]):
+            # Part of this tree may now be outside of its rectangle, so the
+            # indexes of its ancestors can no longer be trusted.
+            ancestor = self._parent_tree
+            while ancestor is not None:
+                ancestor._index = None
+                ancestor = ancestor._parent_tree
+
+    def _layout_rectangles(self, rect: Tuple[int, int, int, int],
+                           layout: Layout) -> bool:
+        """Update the rectangles in this tree and its descendents to fill
+        <rect>, using the layout algorithm <layout> unless a tree chose its
+        own.
+
+        Return True iff this tree holds an expanded tree of data_size 0.
+        Such a tree is not laid out, so its subtrees keep their old
+        rectangles, which may be outside of <rect>.
+        """
+        if self._layout is not None:
+            layout = LAYOUTS[self._layout]
+
         if not self._expanded or not self._subtrees:
             self.rect = rect
+            return False
 
         elif self.data_size == 0 or self.is_empty():
-            return
+            self.rect = rect
+            self._stray = True
+            return True
 
         else:
             self.rect = rect
-            x, y, width, height = rect
-            if width > height:
-                x, y = self._helper_width_greater(x, y, width, height)
+            sizes = [sub.data_size for sub in self._subtrees]
+            sub_rects = layout(sizes, self.data_size, rect)
+            stray = [i for i, (sub, sub_rect)
+                     in enumerate(zip(self._subtrees, sub_rects))
+                     if sub._layout_rectangles(sub_rect, layout)]
+            self._build_index(stray)
+            return self._stray
+
+    @timed('tree')
+    def update_dirty_rectangles(self, rect: Tuple[int, int, int, int]) \
+            -> Set[Tuple[int, int, int, int]]:
+        """Update the rectangles in this tree and its descendents to fill
+        <rect> like update_rectangles, but only lay out again the trees that
+        are dirty, and the trees whose rectangles moved as a result.
+
+        A tree is dirty if its size, its subtrees or whether it is expanded
+        changed since it was last laid out by this method.
+
+        Return the set of rectangles of displayed trees that changed. Only
+        these parts of the treemap need to be drawn again.
+        """
+        changed = set()
+        if self._relayout(rect, LAYOUTS[self._get_layout()], changed):
+            ancestor = self._parent_tree
+            while ancestor is not None:
+                ancestor._index = None
+                ancestor = ancestor._parent_tree
+        return changed
+
+    def _relayout(self, rect: Tuple[int, int, int, int], layout: Layout,
+                  changed: Set[Tuple[int, int, int, int]]) -> bool:
+        """Lay out this tree again in <rect> if it is dirty or has moved, and
+        add the rectangles of the displayed trees that changed to <changed>.
+
+        Return True iff this tree holds an expanded tree of data_size 0, as
+        in _layout_rectangles.
+        """
+        if self._layout is not None:
+            layout = LAYOUTS[self._layout]
 
-            else:
-                x, y = self._helper_height_greater(x, y, width, height)
+        if not self._dirty and rect == self.rect:
+            return self._stray
+        self._dirty = False
+
+        if not self._expanded or not self._subtrees:
+            self.rect = rect
+            changed.add(rect)
+            return False
+
+        elif self.data_size == 0 or self.is_empty():
+            self.rect = rect
+            changed.add(rect)
+            self._stray = True
+            return True
 
-    def _helper_width_greater(self, x: int, y: int, width: int, height: int) ->\
-            tuple[int, int]:
-        """Helper function when width is greater than height.
+        else:
+            self.rect = rect
+            sizes = [sub.data_size for sub in self._subtrees]
+            sub_rects = layout(sizes, self.data_size, rect)
+            stray = [i for i, (sub, sub_rect)
+                     in enumerate(zip(self._subtrees, sub_rects))
+                     if sub._relayout(sub_rect, layout, changed)]
+            self._build_index(stray)
+            return self._stray
+
+    def _build_index(self, stray: List[int]) -> None:
+        """Rebuild the index over the rectangles of the subtrees of this
+        tree, where <stray> holds the positions of the subtrees that may lie
+        outside of their rectangles.
         """
-        for sub in self._subtrees:
-            if self.data_size == 0:
-                percent = 0
-            else:
-                percent = sub.data_size / self.data_size
-            new_width = math.floor(width * percent)
-            new_height = height
-            new_x = x + new_width
-            new_y = y
-            if sub is not self._subtrees[-1]:
-                sub.update_rectangles((x, y, new_width, new_height))
-            else:
-                new_width = width - x + self.rect[0]
-                new_height = height
-                new_x = x + new_width
-                new_y = y
-                sub.update_rectangles((x, y, new_width, new_height))
-            x = new_x
-            y = new_y
-        return x, y
-
-    def _helper_height_greater(self, x: int, y: int, width: int, height: int)\
-            -> tuple[int, int]:
-        """ Helper function when height is greater than equal to width
+        self._index = None
+        if len(self._subtrees) > INDEX_THRESHOLD:
+            self._index = RectIndex([sub.rect for sub in self._subtrees],
+                                    stray)
+        self._stray = bool(stray)
+
+    def set_layout(self, layout: str) -> None:
+        """Use the layout algorithm named <layout> for this tree and for every
+        tree in it that has not chosen its own layout.
+
+        The names are the keys of layouts.LAYOUTS. Raise a ValueError if
+        <layout> is not one of them.
         """
-        for sub in self._subtrees:
-            if self.data_size == 0:
-                percent = 0
-            else:
-                percent = sub.data_size / self.data_size
-            new_width = width
-            new_height = math.floor(height * percent)
-            new_x = x
-            new_y = y + new_height
-            if sub is not self._subtrees[-1]:
-                sub.update_rectangles((x, y, new_width, new_height))
-            else:
-                new_width = width
-                new_height = height - y + self.rect[1]
-                new_x = x
-                new_y = y + new_height
-                sub.update_rectangles((x, y, new_width, new_height))
-            x = new_x
-            y = new_y
-        return x, y
-
+        if layout not in LAYOUTS:
+            raise ValueError(f'unknown layout {layout!r}; expected one of '
+                             f'{", ".join(LAYOUTS)}')
+        self._layout = layout
+        self._mark_displayed_dirty()
+
+    def _get_layout(self) -> str:
+        """Return the name of the layout algorithm chosen for this tree or
+        its closest ancestor, or DEFAULT_LAYOUT if none was chosen.
+        """
+        tree = self
+        while tree is not None:
+            if tree._layout is not None:
+                return tree._layout
+            tree = tree._parent_tree
+        return DEFAULT_LAYOUT
+
+    @timed('tree')
     def get_rectangles(self) -> List[Tuple[Tuple[int, int, int, int],
                                            Tuple[int, int, int]]]:
         """Return a list with tuples for every leaf in the displayed-tree
@@ -244,19 +354,64 @@ class TMTree:
         to fill it with.
         """
         # TO-DO: (Task 2) Complete the body of this method.
-        if self._expanded:
-            if not self._subtrees:
-                return [(self.rect, self._colour)]
-            elif self.is_empty():
-                return []
-            else:
-                final = []
-                for sub in self._subtrees:
-                    final.extend(sub.get_rectangles())
-                return final
-        else:
-            return [(self.rect, self._colour)]
+        return list(self.iter_rectangles())
 
+    def iter_rectangles(self) -> Iterator[Tuple[Tuple[int, int, int, int],
+                                                 Tuple[int, int, int]]]:
+        """Yield the same rectangles and colours as get_rectangles, in the
+        same order, one at a time, so that a very large treemap can be drawn
+        without building the whole list.
+        """
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if not tree._expanded or not tree._subtrees:
+                yield tree.rect, tree._colour
+            elif not tree.is_empty():
+                stack.extend(reversed(tree._subtrees))
+
+    def iter_drawable(self, area: Optional[Tuple[int, int, int, int]] = None,
+                      detail: int = 1) \
+            -> Iterator[Tuple[Tuple[int, int, int, int],
+                              Tuple[int, int, int]]]:
+        """Yield rectangles and colours that, filled in order, paint the
+        displayed-tree rooted at this tree at a level of detail where no
+        rectangle is smaller than <detail> pixels.
+
+        The subtrees with no area are skipped, and so are those outside
+        <area> if it is not None. An expanded tree with fewer than <detail>
+        pixels is drawn in its own colour, without looking at its subtrees.
+        An expanded tree with subtrees smaller than that is first filled in
+        its own colour, and those subtrees are skipped, so that runs of
+        tiny subtrees show as their parent. The number of trees visited
+        therefore depends on the number of pixels, not on how many trees
+        are expanded.
+        """
+        if not overlaps(self.rect, area):
+            return
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            _, _, width, height = tree.rect
+            if not tree._expanded or not tree._subtrees \
+                    or width * height < detail:
+                yield tree.rect, tree._colour
+                continue
+            shown = []
+            merged = False
+            for sub in tree._subtrees:
+                _, _, width, height = sub.rect
+                if sub.data_size == 0 or not overlaps(sub.rect, area):
+                    continue
+                if width * height < detail:
+                    merged = True
+                else:
+                    shown.append(sub)
+            if merged:
+                yield tree.rect, tree._colour
+            stack.extend(reversed(shown))
+
+    @timed('tree')
     def get_tree_at_position(self, pos: Tuple[int, int]) -> Optional[TMTree]:
         """Return the leaf in the displayed-tree rooted at this tree whose
         rectangle contains position <pos>, or None if <pos> is outside of this
@@ -266,14 +421,20 @@ class TMTree:
         always return the leftmost and topmost rectangle (wherever applicable).
         """
         # TO-DO: (Task 3) Complete the body of this method
+        return self._tree_at_position(pos)
+
+    def _tree_at_position(self, pos: Tuple[int, int]) -> Optional[TMTree]:
+        """Return the same tree as get_tree_at_position.
 
+        The subtrees are searched with this method, so that only the outer
+        call is timed by the profiler.
+        """
         given_x, given_y = pos
 
         x, y, width, height = self.rect
 
         if not self._expanded or not self._subtrees:
-            if given_x in range(x, x + width + 1) and \
-                    given_y in range(y, y + height + 1):
+            if x <= given_x <= x + width and y <= given_y <= y + height:
                 return self
             return None
 
@@ -285,11 +446,21 @@ class TMTree:
 
     def _helper_get_position(self, pos: Tuple[int, int], ) -> Optional[TMTree]:
         """Helper function for the get_tree_at_position.
+
+        Only the subtrees whose rectangles contain <pos> are searched. They
+        are found with the index built by the last update_rectangles call if
+        there is one, and by checking every subtree otherwise.
         """
+        if self._index is not None:
+            candidates = [self._subtrees[i] for i in self._index.query(pos)]
+        else:
+            candidates = self._subtrees
+
         finds = []
-        for sub in self._subtrees:
-            if sub.get_tree_at_position(pos) is not None:
-                finds.append(sub.get_tree_at_position(pos))
+        for sub in candidates:
+            found = sub._tree_at_position(pos)
+            if found is not None:
+                finds.append(found)
 
         if len(finds) + 1 > 2:
             best = finds[0]
@@ -306,27 +477,75 @@ class TMTree:
         else:
             return None
 
+    @timed('tree')
     def update_data_sizes(self) -> int:
         """Update the data_size for this tree and its subtrees, based on the
         size of their leaves, and return the new size.
 
         If this tree is a leaf, return its size unchanged.
+
+        This recomputes the whole subtree. The editing methods below keep
+        every data_size up to date on their own, so this is only needed after
+        data_size has been changed directly.
         """
         # TO-DO: (Task 4) Complete the body of this method.
         return self._helper_size()
 
+    def _propagate_size(self, change: int) -> None:
+        """Add <change> to the data_size of this tree and of each of its
+        ancestors.
+
+        This only walks up to the root, so it takes time proportional to the
+        depth of this tree rather than the size of the whole tree.
+        """
+        tree = self
+        while tree is not None:
+            tree.data_size += change
+            tree._dirty = True
+            tree = tree._parent_tree
+
+    def _mark_dirty(self) -> None:
+        """Mark this tree and each of its ancestors as dirty, so that the next
+        update_dirty_rectangles call lays them out again.
+        """
+        tree = self
+        while tree is not None:
+            tree._dirty = True
+            tree = tree._parent_tree
+
+    def _detach(self) -> None:
+        """Remove this tree from its parent's subtrees, and subtract its
+        data_size from each of its ancestors.
+
+        Precondition: this tree has a parent tree.
+        """
+        parent = self._parent_tree
+        parent._subtrees.remove(self)
+        parent._index = None
+        parent._propagate_size(-self.data_size)
+        if not parent._subtrees:
+            parent._expanded = False
+
+    @timed('tree')
     def move(self, destination: TMTree) -> None:
         """If this tree is a leaf, and <destination> is not a leaf, move this
         tree to be the last subtree of <destination>. Otherwise, do nothing.
+
+        The data_size of this tree is taken off its old ancestors and added
+        to its new ones. A parent left with no subtrees has a data_size of 0.
         """
         # TO-DO: (Task 4) Complete the body of this method.
-        if destination._subtrees != [] and not self._subtrees:
-            parent = self.get_parent()
-            parent._subtrees.remove(self)
-            parent.update_data_sizes()
+        if destination._subtrees != [] and not self._subtrees \
+                and self._parent_tree is not None:
+            self._detach()
             destination._subtrees.append(self)
-            destination.update_data_sizes()
+            destination._index = None
+            self._parent_tree = destination
+            self._forget_paths()
+            destination._propagate_size(self.data_size)
+            _debug_check(self)
 
+    @timed('tree')
     def change_size(self, factor: float) -> None:
         """Change the value of this tree's data_size attribute by <factor>.
 
@@ -337,10 +556,11 @@ class TMTree:
         """
         # TO-DO: (Task 4) Complete the body of this method
         if not self.is_empty() and not self._subtrees:
-            change = math.ceil(factor * self.data_size)
-            self.data_size += change
-            self._parent_tree.update_data_sizes()
+            change = max(math.ceil(factor * self.data_size), -self.data_size)
+            self._propagate_size(change)
+            _debug_check(self)
 
+    @timed('tree')
     def delete_self(self) -> bool:
         """Removes the current node from the visualization and
         returns whether the deletion was successful.
@@ -349,16 +569,55 @@ class TMTree:
 
         Do not set self._parent_tree to None, because it might be used
         by the visualiser to go back to the parent folder.
+
+        The data_size of this tree is taken off each of its ancestors, so a
+        parent left with no subtrees has a data_size of 0.
         """
         # TO-DO: (Task 4) Complete the body of this method
         if self.get_parent():
             parent = self.get_parent()
-            parent._subtrees.remove(self)
-            parent.update_data_sizes()
+            self._detach()
+            self._forget_paths()
+            _debug_check(parent)
             return True
         else:
             return False
 
+    def _check_rep_invariants(self) -> None:
+        """Raise an AssertionError if the data_size or structure
+        representation invariants are violated anywhere in this tree.
+
+        This visits every tree in this tree, so it is only meant for
+        debugging. See CHECK_INVARIANTS.
+        """
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            assert tree.data_size >= 0, \
+                f'{tree._name}: negative data_size {tree.data_size}'
+            assert all(0 <= c <= 255 for c in tree._colour), \
+                f'{tree._name}: invalid colour {tree._colour}'
+            if tree.is_empty():
+                assert not tree._subtrees and tree._parent_tree is None \
+                    and tree.data_size == 0, 'invalid empty tree'
+            if tree._parent_tree is not None:
+                assert any(sub is tree
+                           for sub in tree._parent_tree._subtrees), \
+                    f'{tree._name}: not a subtree of its parent'
+                assert tree._path is None \
+                    or tree._parent_tree._path is not None, \
+                    f'{tree._name}: path saved without its parent\'s'
+            if tree._subtrees:
+                total = sum(sub.data_size for sub in tree._subtrees)
+                assert tree.data_size == total, \
+                    f'{tree._name}: data_size {tree.data_size} != {total}'
+                for sub in tree._subtrees:
+                    assert sub._parent_tree is tree, \
+                        f'{sub._name}: wrong parent tree'
+                stack.extend(tree._subtrees)
+            else:
+                assert not tree._expanded, f'{tree._name}: expanded leaf'
+
     # TO-DO: (Task 5) Write the methods expand, expand_all, collapse, and
     # TO-DO: collapse_all, and add the displayed-tree functionality to the
     # TO-DO: methods from Tasks 2 and 3
@@ -369,6 +628,7 @@ class TMTree:
         if not self._subtrees or self._expanded:
             return
         self._expanded = True
+        self._mark_displayed_dirty()
         self.update_rectangles(self.rect)
 
     def expand_all(self) -> None:
@@ -377,11 +637,27 @@ class TMTree:
         """
         if not self._subtrees or self._expanded:
             return
-        self._expanded = True
-        for sub in self._subtrees:
-            sub.expand_all()
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree._subtrees and not tree._expanded:
+                tree._expanded = True
+                stack.extend(tree._subtrees)
+        self._mark_displayed_dirty()
         self.update_rectangles(self.rect)
 
+    def _mark_displayed_dirty(self) -> None:
+        """Mark this tree and its ancestors as dirty, along with every tree
+        this tree displays, so that all of them are drawn again.
+        """
+        self._mark_dirty()
+        stack = list(self._subtrees)
+        while stack:
+            tree = stack.pop()
+            tree._dirty = True
+            if tree._expanded:
+                stack.extend(tree._subtrees)
+
     def collapse(self) -> None:
         """Collapse current tree.
         Do nothing if the tree is a root (no parent)
@@ -390,6 +666,7 @@ class TMTree:
             return
         parent = self.get_parent()
         parent._expanded = False
+        parent._mark_dirty()
 
     def collapse_all(self) -> None:
         """Collapse all the trees
@@ -403,6 +680,7 @@ class TMTree:
                 curr = curr.get_parent()
             root = curr
         root._helper_collapse_all()
+        root._dirty = True
 
     def _helper_collapse_all(self) -> None:
         """Recursive function for the collapse all.
@@ -420,11 +698,49 @@ class TMTree:
         and its ancestors, using the separator for this OS between each
         tree's name.
         """
-        if self._parent_tree is None:
-            return self._name
-        else:
-            return self._parent_tree\
-                       .get_path_string() + self.get_separator() + self._name
+        # Go up to the closest tree whose path is saved, then save the path
+        # of each tree on the way back down.
+        chain = []
+        tree = self
+        while tree is not None and tree._path is None:
+            chain.append(tree)
+            tree = tree._parent_tree
+        path = None if tree is None else tree._path
+        for tree in reversed(chain):
+            if path is None:
+                path = tree._name
+            else:
+                path = path + tree.get_separator() + tree._name
+            tree._path = path
+        return path
+
+    def iter_paths(self) -> Iterator[Tuple[TMTree, str]]:
+        """Yield every tree in this tree, each before its subtrees, with its
+        path string.
+
+        Each path is made from the path of its parent, so the time taken is
+        linear in the total length of the paths rather than the number of
+        trees times their depth. The paths yielded are not saved.
+        """
+        stack = [(self, self.get_path_string())]
+        while stack:
+            tree, path = stack.pop()
+            yield tree, path
+            if tree._subtrees:
+                prefix = path + tree.get_separator()
+                stack.extend((sub, prefix + sub._name)
+                             for sub in reversed(tree._subtrees))
+
+    def _forget_paths(self) -> None:
+        """Forget the saved path strings of this tree and its descendants,
+        because this tree was moved or deleted.
+        """
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree._path is not None:
+                tree._path = None
+                stack.extend(tree._subtrees)
 
     def get_separator(self) -> str:
         """Return the string used to separate names in the string
@@ -439,6 +755,16 @@ class TMTree:
         raise NotImplementedError
 
 
+def _debug_check(tree: TMTree) -> None:
+    """If CHECK_INVARIANTS is True, check the representation invariants of
+    the whole tree that contains <tree>.
+    """
+    if CHECK_INVARIANTS:
+        while tree._parent_tree is not None:
+            tree = tree._parent_tree
+        tree._check_rep_invariants()
+
+
 class FileSystemTree(TMTree):
     """A tree representation of files and folders in a file system.
 
@@ -450,11 +776,71 @@ class FileSystemTree(TMTree):
 
     The data_size attribute for regular files is simply the size of the file,
     as reported by os.path.getsize.
-    """
 
-    def __init__(self, path: str) -> None:
+    A tree built with lazy=True only reads a folder when it is first
+    expanded. Until then the folder is a leaf, and its data_size is the total
+    found by a FolderSizer in the background, or its own size until that
+    total is known.
+
+    === Private Attributes ===
+    _folder_path:
+        The path of this folder if it has not been read yet, or None.
+    _sizer:
+        The FolderSizer shared by every folder of a lazy tree, or None if
+        this tree is not lazy.
+    _stream:
+        The ScanStream still adding entries to this tree, or None. Only the
+        root of a streamed tree has one.
+    _stream_folders:
+        The folder in this tree for the path of each folder whose entries
+        the stream has not handed over yet, or None.
+    _removed:
+        Whether this tree was deleted, so that its entries are no longer
+        added when they arrive from a stream.
+    _fold:
+        The size in bytes below which the files in this folder are folded
+        into one leaf, or 0 if they are not folded.
+    _folded:
+        The files folded into this leaf if it stands for the small files of
+        its folder, or None if it is a real file or folder.
+    """
+    _folder_path: Optional[str] = None
+    _sizer: Optional[FolderSizer] = None
+    _stream: Optional[ScanStream] = None
+    _stream_folders: Optional[Dict[str, FileSystemTree]] = None
+    _removed: bool = False
+    _fold: int = 0
+    _folded: Optional[List[ScanEntry]] = None
+
+    def __init__(self, path: str, scanner: Optional[Scanner] = None,
+                 cache: Optional[ScanCache] = None, lazy: bool = False,
+                 stream: bool = False, fold: int = 0,
+                 processes: int = 1) -> None:
         """Store the file tree structure contained in the given file or folder.
 
+        The file system is read with <scanner>, or with a single-threaded
+        Scanner if <scanner> is None. If <cache> is not None, only the
+        folders modified since the snapshot of <path> in <cache> are read,
+        and the snapshot is updated.
+
+        If <lazy>, only the folder at <path> itself is read now, and <cache>
+        is not used. Call update_folder_sizes regularly to show the sizes of
+        the folders that have not been read.
+
+        If <stream>, the scan runs in the background and this tree starts
+        out empty. Call update_from_stream regularly to add the entries read
+        so far.
+
+        If <fold> is positive, the files smaller than <fold> bytes in each
+        folder are kept as one leaf instead of a tree each, as by fold. This
+        is not done for a tree built with <stream>.
+
+        If <processes> is more than 1, the folders directly inside <path>
+        are scanned by that many processes, as by scan_shards.scan_sharded.
+
+        Precondition: <lazy> and <stream> are not both True, and neither is
+        used with <processes> more than 1.
+
         Precondition: <path> is a valid path for this computer.
 
         >>> file = FileSystemTree('/Users/mohamadsabagh/Desktop/School Work/A 2021-2022@UTM/SUMMER 2022/CSC148/csc148 Pycharm/assignments/a2/example-directory/workshop/prep/reading.md')
@@ -482,15 +868,471 @@ class FileSystemTree(TMTree):
         #
         # Also remember to make good use of the superclass constructor!
         # TO-DO: (Task 1) Implement the initializer
+        if scanner is None:
+            scanner = Scanner()
+        if lazy and os.path.isdir(path):
+            self._init_placeholder(
+                ScanEntry(os.path.basename(path), os.path.getsize(path), []),
+                path, FolderSizer(path, scanner))
+            self._fold = fold
+            self._load()
+        elif stream and os.path.isdir(path):
+            self._init_from_entry(
+                ScanEntry(os.path.basename(path), os.path.getsize(path)))
+            self._stream_folders = {path: self}
+            if cache is None:
+                self._stream = ScanStream(
+                    lambda on_read: scanner.scan(path, on_read=on_read))
+            else:
+                self._stream = ScanStream(
+                    lambda on_read: cache.scan(scanner, path, on_read))
+        else:
+            with PROFILER.span('FileSystemTree.scan', 'scan'):
+                if processes > 1:
+                    entry = scan_sharded(path, scanner, processes, cache)
+                elif cache is None:
+                    entry = scanner.scan(path)
+                else:
+                    entry = cache.scan(scanner, path)
+            PROFILER.count('scan.folders_read', scanner.folders)
+            PROFILER.count('scan.folders_reused', scanner.reused)
+            PROFILER.count('scan.entries', scanner.entries)
+            PROFILER.count('scan.errors', scanner.errors)
+            PROFILER.count('scan.linked', scanner.linked)
+            with PROFILER.span('FileSystemTree.build', 'scan'):
+                self._init_from_entry(entry, fold)
+
+    @classmethod
+    def from_scan(cls, entry: ScanEntry, fold: int = 0) -> FileSystemTree:
+        """Return a new FileSystemTree of the scanned file or folder <entry>,
+        such as one loaded from a snapshot, with the files smaller than
+        <fold> bytes in each folder folded into one leaf if <fold> is
+        positive.
+
+        The tree is not connected to the file system, so it cannot be
+        updated from disk unless <entry> was scanned on this computer.
+        """
+        tree = cls.__new__(cls)
+        with PROFILER.span('FileSystemTree.build', 'scan'):
+            tree._init_from_entry(entry, fold)
+        return tree
+
+    def _init_from_entry(self, entry: ScanEntry, fold: int = 0) -> None:
+        """Initialize this tree from the scanned file or folder <entry>,
+        creating a new FileSystemTree for each entry inside it, with the
+        files smaller than <fold> bytes in each folder folded into one leaf
+        if <fold> is positive.
+        """
         sub_tree = []
-        if os.path.isdir(path):
+        if entry.is_dir():
+            children, small = _split_small(entry.children, fold)
+            for sub_entry in children:
+                sub = FileSystemTree.__new__(FileSystemTree)
+                sub._init_from_entry(sub_entry, fold)
+                sub_tree.append(sub)
+            if small:
+                sub_tree.append(_folded_leaf(small))
+
+        super().__init__(entry.name, sub_tree, entry.size)
+        if fold > 0 and entry.is_dir():
+            self._fold = fold
+
+    def _init_placeholder(self, entry: ScanEntry, path: str,
+                          sizer: FolderSizer) -> None:
+        """Initialize this tree as the folder <entry> at <path>, without
+        reading the folder.
+        """
+        super().__init__(entry.name, [], entry.size)
+        self._folder_path = path
+        self._sizer = sizer
+        total = sizer.total(path)
+        if total is None:
+            sizer.wait(path, self)
+        else:
+            self.data_size = total
+
+    def _load(self, recursive: bool = False) -> None:
+        """Read this folder if it has not been read yet, and add a subtree for
+        each entry inside it.
+
+        If <recursive>, read every folder inside it as well. Otherwise the
+        folders inside it are not read.
+        """
+        if self._folder_path is None:
+            return
+        path = self._folder_path
+        if recursive:
+            entries = self._sizer.scanner.scan(path).children
+        else:
+            entries = self._sizer.scanner.read_folder(path)
+        self._folder_path = None
+        PROFILER.count('scan.folders_loaded')
+
+        subtrees = []
+        entries, small = _split_small(entries, self._fold)
+        for entry in entries:
+            sub = FileSystemTree.__new__(FileSystemTree)
+            if entry.is_dir() and not recursive:
+                sub._init_placeholder(entry, os.path.join(path, entry.name),
+                                      self._sizer)
+                sub._fold = self._fold
+            else:
+                sub._init_from_entry(entry, self._fold)
+            subtrees.append(sub)
+        if small:
+            subtrees.append(_folded_leaf(small))
+        for sub in subtrees:
+            sub._parent_tree = self
+        if subtrees:
+            self._subtrees = subtrees
+            self._index = None
+            self._propagate_size(sum(sub.data_size for sub in subtrees)
+                                 - self.data_size)
+
+    def update_from_stream(self, limit: Optional[int] = None) -> bool:
+        """Add the entries of the folders read by the background scan since
+        the last call, or of only the first <limit> of those folders if
+        <limit> is not None, and return whether any were added.
+
+        Only the ancestors of the folders that grew have their data_size
+        updated. This does nothing for a tree that was not built with
+        stream=True. It must be called on the root of the tree.
+        """
+        if self._stream is None:
+            return False
+        batches = self._stream.ready(limit)
+        if batches:
+            PROFILER.count('scan.folders_streamed', len(batches))
+        for path, entries in batches:
+            tree = self._stream_folders.pop(path, None)
+            if tree is None or not entries or tree._is_removed():
+                continue
+            subtrees = []
+            for entry in entries:
+                # Only the name and size are safe to read, and the folders
+                # inside are added by their own batch.
+                sub = FileSystemTree.__new__(FileSystemTree)
+                sub._init_from_entry(ScanEntry(entry.name, entry.size))
+                if entry.is_dir():
+                    self._stream_folders[os.path.join(path, entry.name)] = sub
+                subtrees.append(sub)
+            tree._add_subtrees(subtrees)
+        if self._stream.is_done():
+            self._stream = None
+            self._stream_folders = None
+        if batches:
+            _debug_check(self)
+        return bool(batches)
+
+    def is_loading(self) -> bool:
+        """Return whether a background scan or background sizing of this
+        tree may still have results for update_from_stream or
+        update_folder_sizes.
+        """
+        return self._stream is not None \
+            or self._sizer is not None and not self._sizer.is_done()
 
-            for name in os.listdir(path):
-                sub_item = os.path.join(path, name)
-                sub_tree.append(FileSystemTree(sub_item))
+    def scan_progress(self) -> Optional[str]:
+        """Return a description of how much of this tree has been read by
+        the background scan, or None if it is not being streamed.
+        """
+        if self._stream is None:
+            return None
+        return f'scanning: {self._stream.folders:,} folders, ' \
+               f'{self._stream.entries:,} entries'
+
+    def _is_removed(self) -> bool:
+        """Return whether this tree or one of its ancestors was deleted.
+        """
+        tree = self
+        while tree is not None:
+            if tree._removed:
+                return True
+            tree = tree._parent_tree
+        return False
 
-        super().__init__(os.path.basename(path), sub_tree,
-                         os.path.getsize(path))
+    def delete_self(self) -> bool:
+        """Removes the current node from the visualization and
+        returns whether the deletion was successful.
+        """
+        if not super().delete_self():
+            return False
+        self._removed = True
+        return True
+
+    def update_folder_sizes(self) -> bool:
+        """Give each folder that has not been read the total size found for it
+        in the background since the last call, and return whether any
+        data_size changed.
+
+        This does nothing for a tree that was not built with lazy=True.
+        """
+        if self._sizer is None:
+            return False
+        changed = False
+        for tree, total in self._sizer.ready():
+            if tree._folder_path is not None:
+                changed = tree._set_leaf_size(total) or changed
+        return changed
+
+    def expand(self) -> None:
+        """Expand the tree to show subtrees if not expanded already, reading
+        this folder first if needed.
+        If expanded do nothing.
+        """
+        self._load()
+        super().expand()
+
+    def expand_all(self) -> None:
+        """Expand the tree and all subtrees if not expanded, reading every
+        folder in this tree first if needed.
+        If expanded do nothing.
+        """
+        if self._sizer is not None:
+            stack = [self]
+            while stack:
+                tree = stack.pop()
+                if tree._folder_path is not None:
+                    tree._load(recursive=True)
+                else:
+                    stack.extend(tree._subtrees)
+        super().expand_all()
+
+    def fold(self, size: Optional[int] = None) -> None:
+        """Replace the files smaller than <size> bytes in this folder and in
+        every folder inside it by one leaf per folder, named for the number
+        of files it stands for, as long as a folder has at least two such
+        files. The data_size of every folder stays the same.
+
+        If <size> is None, each folder is folded with the size it was last
+        folded with, if any, so that the folders opened by unfold are
+        folded again.
+        """
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            stack.extend(sub for sub in tree._subtrees if sub._subtrees)
+            threshold = tree._fold if size is None else size
+            if threshold <= 0 or not tree._subtrees:
+                continue
+            tree._fold = threshold
+            tree._fold_files()
+
+    def _fold_files(self) -> None:
+        """Replace the files smaller than self._fold bytes directly in this
+        folder by one leaf, as fold does for each folder.
+        """
+        kept, small, folded = [], [], []
+        for sub in self._subtrees:
+            if sub._folded is not None:
+                folded.append(sub)
+            elif not sub._subtrees and sub._folder_path is None \
+                    and sub.data_size < self._fold:
+                small.append(ScanEntry(sub._name, sub.data_size))
+            else:
+                kept.append(sub)
+        if not small and len(folded) < 2 \
+                or len(small) + sum(len(f._folded) for f in folded) < 2:
+            return
+        # A folded leaf whose size was changed goes back to the total size of
+        # its files.
+        change = 0
+        for leaf in folded:
+            small.extend(leaf._folded)
+            change += sum(entry.size for entry in leaf._folded) \
+                - leaf.data_size
+            leaf._parent_tree = None
+        leaf = _folded_leaf(small)
+        leaf._parent_tree = self
+        self._subtrees = kept + [leaf]
+        self._index = None
+        self._propagate_size(change)
+
+    def unfold(self) -> FileSystemTree:
+        """Give each of the files folded into a leaf of this folder a leaf
+        of its own again, and return this folder. If this tree is itself a
+        leaf of folded files, unfold its folder and return that instead.
+
+        The folder is not folded again until fold is called, though an
+        update from disk that has to unfold a folder folds it again
+        afterwards.
+        """
+        if self._folded is not None and self._parent_tree is not None:
+            return self._parent_tree.unfold()
+        folded = [sub for sub in self._subtrees if sub._folded is not None]
+        if not folded:
+            return self
+        subtrees = []
+        for entry in (entry for leaf in folded for entry in leaf._folded):
+            sub = FileSystemTree.__new__(FileSystemTree)
+            sub._init_from_entry(entry)
+            sub._parent_tree = self
+            subtrees.append(sub)
+        for leaf in folded:
+            leaf._parent_tree = None
+        self._subtrees = [sub for sub in self._subtrees
+                          if sub._folded is None] + subtrees
+        self._index = None
+        self._propagate_size(sum(sub.data_size for sub in subtrees)
+                             - sum(leaf.data_size for leaf in folded))
+        return self
+
+    def update_from_disk(self, root_path: str, paths: Iterable[str],
+                         scanner: Optional[Scanner] = None) -> bool:
+        """Bring the trees for <paths> up to date with the file system, where
+        this tree is the folder at <root_path>, and return whether anything
+        changed.
+
+        Each path is looked up on disk, so it does not matter whether it was
+        created, deleted, modified or renamed. New files and folders are
+        read with <scanner>, or with a single-threaded Scanner if <scanner>
+        is None. For a folder that is already in this tree, only the entries
+        directly inside it are checked.
+
+        Only the ancestors of the changed trees have their data_size updated,
+        and they are marked dirty for update_dirty_rectangles. Paths inside
+        folders that have not been read yet are skipped.
+        """
+        scanner = scanner or Scanner()
+        changed = False
+        # Folders come before their contents, so a new folder is read once
+        # and the paths inside it are then found in this tree.
+        for path in sorted(set(paths), key=lambda p: (p.count(os.sep), p)):
+            relative = os.path.relpath(path, root_path)
+            if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+                continue
+            names = [] if relative == os.curdir else relative.split(os.sep)
+            changed = self._update_path(root_path, names, scanner) or changed
+        if changed:
+            _debug_check(self)
+        return changed
+
+    def _update_path(self, path: str, names: List[str],
+                     scanner: Scanner) -> bool:
+        """Bring the tree for the path made of <names> inside this tree up to
+        date with the file system, where this tree is the file or folder at
+        <path>, and return whether anything changed.
+
+        A folded folder that has to be unfolded to find a file in it is
+        folded again afterwards.
+        """
+        refold = []
+        try:
+            tree = self
+            for name in names:
+                if tree._folder_path is not None:
+                    return False
+                path = os.path.join(path, name)
+                sub = next((sub for sub in tree._subtrees
+                            if sub._name == name), None)
+                if sub is None and any(sub._folded is not None
+                                       for sub in tree._subtrees):
+                    # The file may be one of the small files folded together.
+                    refold.append(tree.unfold())
+                    sub = next((sub for sub in tree._subtrees
+                                if sub._name == name), None)
+                if sub is None:
+                    if os.path.lexists(path) and os.path.isdir(
+                            os.path.dirname(path)):
+                        tree._add_entry(scanner.scan(path))
+                        return True
+                    return False
+                tree = sub
+
+            if not os.path.lexists(path):
+                parent = tree._parent_tree
+                if parent is None:
+                    return False
+                tree._detach()
+                if not parent._subtrees:
+                    parent._set_leaf_size(
+                        os.path.getsize(os.path.dirname(path)))
+                return True
+            elif tree._folder_path is not None:
+                return False
+            elif os.path.isdir(path):
+                return tree._update_folder(path, scanner)
+            elif tree._subtrees:
+                if tree._parent_tree is None:
+                    return False
+                tree._replace(scanner.scan(path))
+                return True
+            else:
+                return tree._set_leaf_size(os.path.getsize(path))
+        finally:
+            for folder in refold:
+                folder._fold_files()
+
+    def _update_folder(self, path: str, scanner: Scanner) -> bool:
+        """Bring the entries directly inside this tree up to date with the
+        folder at <path>, and return whether anything changed. If this
+        folder was folded, it is folded again afterwards.
+        """
+        on_disk = {entry.name: entry for entry in scanner.read_folder(path)}
+        changed = False
+        folded = any(sub._folded is not None for sub in self._subtrees)
+        self.unfold()
+        for sub in list(self._subtrees):
+            entry = on_disk.pop(sub._name, None)
+            if entry is None:
+                sub._detach()
+                changed = True
+            elif entry.is_dir() and not sub._subtrees \
+                    or not entry.is_dir() and sub._subtrees:
+                sub._replace(scanner.scan(os.path.join(path, sub._name)))
+                changed = True
+            elif not entry.is_dir():
+                changed = sub._set_leaf_size(entry.size) or changed
+        for name in on_disk:
+            self._add_entry(scanner.scan(os.path.join(path, name)))
+            changed = True
+        if not self._subtrees:
+            changed = self._set_leaf_size(os.path.getsize(path)) or changed
+        elif folded:
+            self._fold_files()
+        return changed
+
+    def _add_entry(self, entry: ScanEntry) -> None:
+        """Add a new tree for the scanned file or folder <entry> as the last
+        subtree of this tree.
+        """
+        sub = FileSystemTree.__new__(FileSystemTree)
+        sub._init_from_entry(entry)
+        self._add_subtrees([sub])
+
+    def _add_subtrees(self, subtrees: List[FileSystemTree]) -> None:
+        """Add <subtrees> to the end of the subtrees of this tree, and add
+        their data_size to this tree and each of its ancestors.
+        """
+        # An empty folder's data_size is its own size, which no longer
+        # counts once it holds something.
+        change = sum(sub.data_size for sub in subtrees)
+        if not self._subtrees:
+            change -= self.data_size
+        self._subtrees.extend(subtrees)
+        for sub in subtrees:
+            sub._parent_tree = self
+        self._index = None
+        self._propagate_size(change)
+
+    def _replace(self, entry: ScanEntry) -> None:
+        """Replace this tree with a new tree for the scanned file or folder
+        <entry>, which has changed from a file to a folder or back.
+
+        Precondition: this tree has a parent tree.
+        """
+        parent = self._parent_tree
+        self._detach()
+        parent._add_entry(entry)
+
+    def _set_leaf_size(self, size: int) -> bool:
+        """Set the data_size of this tree, which has no subtrees, to <size>,
+        and return whether it changed.
+        """
+        if size == self.data_size:
+            return False
+        self._propagate_size(size - self.data_size)
+        return True
 
     def get_separator(self) -> str:
         """Return the file separator for this OS.
@@ -500,6 +1342,19 @@ class FileSystemTree(TMTree):
     def get_suffix(self) -> str:
         """Return the final descriptor of this tree.
         """
+        if self._folder_path is not None:
+            return self._describe(None, self.data_size)
+        if self._folded is not None:
+            return self._describe(-len(self._folded), self.data_size)
+        return self._describe(len(self._subtrees), self.data_size)
+
+    @staticmethod
+    def _describe(item_count: Optional[int], data_size: int) -> str:
+        """Return the final descriptor of a file or folder that holds
+        <item_count> entries and has size <data_size>, where <item_count> is
+        None for a folder that has not been read, and minus the number of
+        files for a leaf of folded files.
+        """
 
         def convert_size(data_size: float, suffix: str = 'B') -> str:
             suffixes = {'B': 'kB', 'kB': 'MB', 'MB': 'GB', 'GB': 'TB'}
@@ -508,20 +1363,53 @@ class FileSystemTree(TMTree):
             return convert_size(data_size / 1024, suffixes[suffix])
 
         components = []
-        if len(self._subtrees) == 0:
+        if item_count is None:
+            components.append('folder')
+        elif item_count < 0:
+            components.append(f'{-item_count} small files, Q to show them')
+        elif item_count == 0:
             components.append('file')
         else:
             components.append('folder')
-            components.append(f'{len(self._subtrees)} items')
-        components.append(convert_size(self.data_size))
+            components.append(f'{item_count} items')
+        components.append(convert_size(data_size))
         return f' ({", ".join(components)})'
 
 
+def _split_small(entries: List[ScanEntry], fold: int) \
+        -> Tuple[List[ScanEntry], List[ScanEntry]]:
+    """Return the entries in <entries> that are not files smaller than
+    <fold> bytes, and those that are, or all of <entries> and an empty list
+    if <fold> is not positive or there are fewer than two small files.
+    """
+    if fold <= 0:
+        return entries, []
+    small = [entry for entry in entries
+             if not entry.is_dir() and entry.size < fold]
+    if len(small) < 2:
+        return entries, []
+    return [entry for entry in entries
+            if entry.is_dir() or entry.size >= fold], small
+
+
+def _folded_leaf(entries: List[ScanEntry]) -> FileSystemTree:
+    """Return a new leaf that stands for the files <entries>, with their
+    total size.
+    """
+    leaf = FileSystemTree.__new__(FileSystemTree)
+    TMTree.__init__(leaf, f'{len(entries)} small files', [],
+                    sum(entry.size for entry in entries))
+    leaf._folded = entries
+    return leaf
+
+
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'math', 'random', 'os', '__future__'
+            'python_ta', 'typing', 'math', 'random', 'os', 'sys',
+            '__future__', 'fs_scanner', 'layouts', 'profiling', 'scan_cache',
+            'scan_shards'
         ]
     })
@@ -0,0 +1,202 @@
+"""
+Assignment 2: Headless Treemap Export
+
+=== CSC148 Summer 2022 ===
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, David Liu, Diane Horton,
+                   Haocheng Hu, Jacqueline Smith
+
+=== Module Description ===
+This module draws treemaps to image files without opening a window, so that
+reports can be made by scheduled jobs on machines without a display.
+
+export_treemap lays out any TMTree, such as a FileSystemTree or a PaperTree,
+at a given size, and writes it as a PNG drawn on an offscreen pygame
+surface, or as an SVG written one rectangle at a time. The rectangles come
+from TMTree.iter_rectangles, so the list of all of them is never built.
+
+Run this module to export the treemap of each folder named on the command
+line. The folders are scanned and drawn in parallel, one process each:
+
+    python treemap_export.py /home /srv /var --out-dir reports --format svg
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, TextIO, Tuple
+
+import pygame
+
+from fs_scanner import Scanner
+from scan_cache import ScanCache
+from tm_trees import FileSystemTree, TMTree
+
+# The file formats that export_treemap can write, by extension.
+FORMATS = ('png', 'svg')
+
+DEFAULT_SIZE = (1920, 1080)
+
+
+def export_treemap(tree: TMTree, path: str,
+                   size: Tuple[int, int] = DEFAULT_SIZE) -> None:
+    """Lay out <tree> to fill an image of <size> pixels, and write it to
+    <path> as a PNG or an SVG, depending on the extension of <path>.
+
+    Only the displayed-tree is drawn, so expand <tree> first to draw every
+    leaf. Raise a ValueError if the extension of <path> is not in FORMATS.
+    """
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension not in FORMATS:
+        raise ValueError(f'cannot export to {path!r}; expected a file '
+                         f'ending in {", ".join("." + f for f in FORMATS)}')
+    tree.update_rectangles((0, 0, size[0], size[1]))
+    if extension == 'png':
+        write_png(tree, path, size)
+    else:
+        with open(path, 'w', encoding='utf-8') as file:
+            write_svg(tree, file, size)
+
+
+def write_png(tree: TMTree, path: str, size: Tuple[int, int]) -> None:
+    """Draw the rectangles of <tree>, which is already laid out, on an
+    offscreen surface of <size> pixels, and save it to <path> as a PNG.
+    """
+    surface = pygame.Surface(size)
+    surface.fill(pygame.Color('black'))
+    for rect, colour in tree.iter_rectangles():
+        pygame.draw.rect(surface, colour, rect)
+    pygame.image.save(surface, path)
+
+
+def write_svg(tree: TMTree, file: TextIO, size: Tuple[int, int]) -> None:
+    """Write the rectangles of <tree>, which is already laid out, to <file>
+    as an SVG image of <size> pixels, one line per rectangle.
+
+    Empty rectangles are left out, since they would not be drawn.
+    """
+    width, height = size
+    file.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+               f'height="{height}" viewBox="0 0 {width} {height}" '
+               f'shape-rendering="crispEdges">\n')
+    file.write(f'<rect width="{width}" height="{height}" fill="#000000"/>\n')
+    for (x, y, rect_width, rect_height), colour in tree.iter_rectangles():
+        if rect_width > 0 and rect_height > 0:
+            file.write(f'<rect x="{x}" y="{y}" width="{rect_width}" '
+                       f'height="{rect_height}" '
+                       f'fill="#{colour[0]:02x}{colour[1]:02x}'
+                       f'{colour[2]:02x}"/>\n')
+    file.write('</svg>\n')
+
+
+def output_path(root: str, out_dir: str, image_format: str) -> str:
+    """Return the path in <out_dir> of the <image_format> image exported for
+    the folder <root>.
+
+    The name is the name of <root> followed by a hash of its absolute path,
+    so that folders with the same name do not overwrite each other.
+    """
+    root = os.path.abspath(root)
+    name = os.path.basename(root) or 'root'
+    key = hashlib.sha1(root.encode('utf-8', 'surrogateescape')).hexdigest()
+    return os.path.join(out_dir, f'{name}-{key[:8]}.{image_format}')
+
+
+def export_all(roots: List[str], out_dir: str, image_format: str = 'png',
+               size: Tuple[int, int] = DEFAULT_SIZE,
+               jobs: Optional[int] = None,
+               cache_dir: Optional[str] = None) \
+        -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """Export the fully expanded treemap of each folder in <roots> to
+    <out_dir>, using up to <jobs> processes, or one per CPU if <jobs> is
+    None.
+
+    If <cache_dir> is not None, the scans are cached there as by ScanCache,
+    so that the next export only reads the folders modified since.
+
+    Return a (root, output path, error) triple for each root, in the order
+    of <roots>. The output path is None if the export failed, and the error
+    is None if it succeeded. A failed export does not stop the others.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    work = [(root, output_path(root, out_dir, image_format), size, cache_dir)
+            for root in roots]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_export_root, work))
+
+
+def _export_root(job: Tuple[str, str, Tuple[int, int], Optional[str]]) \
+        -> Tuple[str, Optional[str], Optional[str]]:
+    """Scan the folder in <job> and export its fully expanded treemap, as
+    export_all does for one root. This runs in a worker process.
+
+    Any error is returned as the error of this root rather than raised, so
+    that it does not stop the export of the others.
+    """
+    root, path, size, cache_dir = job
+    try:
+        cache = None if cache_dir is None else ScanCache(cache_dir)
+        tree = FileSystemTree(root, Scanner(), cache)
+        tree.expand_all()
+        export_treemap(tree, path, size)
+    except Exception as error:
+        return root, None, f'{type(error).__name__}: {error}'
+    return root, path, None
+
+
+def _parse_size(text: str) -> Tuple[int, int]:
+    """Return the (width, height) written as <text> in the form WIDTHxHEIGHT.
+    """
+    try:
+        width, height = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f'expected WIDTHxHEIGHT, not {text!r}') from None
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError('the size must be positive')
+    return width, height
+
+
+def _parse_args() -> argparse.Namespace:
+    """Return the command line options of the export.
+    """
+    parser = argparse.ArgumentParser(
+        description='Export the treemap of each folder to an image file.')
+    parser.add_argument('roots', nargs='+', help='the folders to export')
+    parser.add_argument('--out-dir', default='.',
+                        help='folder to write the images to')
+    parser.add_argument('--format', choices=FORMATS, default='png',
+                        help='image format (default: png)')
+    parser.add_argument('--size', type=_parse_size,
+                        default=DEFAULT_SIZE, metavar='WIDTHxHEIGHT',
+                        help='image size in pixels (default: 1920x1080)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='number of processes (default: one per CPU)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='folder that holds scan snapshots, to only '
+                             'read the folders modified since the last '
+                             'export')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    ARGS = _parse_args()
+    FAILED = 0
+    for ROOT, OUTPUT, ERROR in export_all(ARGS.roots, ARGS.out_dir,
+                                          ARGS.format, ARGS.size, ARGS.jobs,
+                                          ARGS.cache_dir):
+        if ERROR is None:
+            print(f'{ROOT} -> {OUTPUT}')
+        else:
+            print(f'{ROOT}: {ERROR}', file=sys.stderr)
+            FAILED += 1
+    sys.exit(1 if FAILED else 0)
@@ -20,19 +20,83 @@ and detecting user events like mouse clicks and key presses and responding
 to them.
 """
 
+import argparse
+import math
+import time
 from os import getcwd
-from sys import platform
-from typing import Optional, Tuple
+from sys import platform, stderr
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import pygame
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from compact_tree import CompactTree
+from fs_scanner import Scanner
+from fs_watch import PollingWatcher, Watcher, open_watcher
+from layouts import DEFAULT_LAYOUT, LAYOUTS
 from papers import PaperTree
+from profiling import PROFILER
+from scan_cache import DEFAULT_CACHE_DIR, ScanCache
+from scan_shards import merge_snapshots, scan_sharded
 from tm_trees import TMTree, FileSystemTree
 
+# Rectangles with at most this many pixels are written straight into the
+# pixels of the treemap in one batch, rather than filled one at a time.
+BATCH_AREA = 64
+
 
 class Visualiser:
     """
     A class that uses pygame to visualise a tm_tree object.
+
+    The treemap is drawn once onto a cached surface, and only the parts of
+    it that changed are drawn again. Each frame copies that surface to the
+    screen and draws the hover and selection outlines and the text on top.
+    The window is only redrawn when something changed, and the event loop
+    sleeps until the next event when nothing is happening in the
+    background.
+
+    The treemap is drawn at a level of detail: a part of it smaller than
+    detail pixels is drawn in the colour of the tree it belongs to instead
+    of its own, and the smallest rectangles are written into the pixels of
+    the surface in one batch when NumPy is installed. This keeps the time
+    to draw the treemap bounded by its number of pixels.
+
+    === Public Attributes ===
+    detail:
+        The smallest number of pixels that a rectangle drawn may have.
+
+    === Private Attributes ===
+    _clock:
+        The clock that keeps the frame rate at or below fps.
+    _treemap:
+        The cached drawing of the treemap, or None if it must be drawn from
+        scratch.
+    _damage:
+        The part of _treemap that must be drawn again, or None if none of it
+        must be.
+    _revision:
+        The number of times the tree shown has changed.
+    _fonts:
+        The font loaded for each text height used so far.
+    _status_key:
+        The selected node, width and _revision for which _status_text was
+        worked out, or None if it must be worked out again.
+    _status_text:
+        The text shown at the bottom of the window for _status_key.
+    _status_surface:
+        _status_text as drawn, or None if it must be drawn again.
+    _profile_lines:
+        The lines of the profiler overlay, or None if it is hidden.
+    _profile_taken:
+        The time.monotonic() value when _profile_lines were last updated.
+    _profile_owned:
+        Whether the profiler was turned on by showing the overlay, and so
+        should be turned off when it is hidden.
     """
     width: int
     height: int
@@ -41,8 +105,44 @@ class Visualiser:
     screen: Optional[pygame.Surface]
     hover_node: Optional[TMTree]
     selected_node: Optional[TMTree]
-
-    def __init__(self) -> None:
+    layout: Optional[str]
+    watcher: Optional[Watcher]
+    stream_interval: float
+    stream_batch: int
+    fps: int
+    detail: int
+    _last_stream: float
+    _clock: Optional[pygame.time.Clock]
+    _treemap: Optional[pygame.Surface]
+    _damage: Optional[pygame.Rect]
+    _revision: int
+    _fonts: Dict[int, pygame.font.Font]
+    _status_key: Optional[Tuple[Optional[TMTree], int, int]]
+    _status_text: str
+    _status_surface: Optional[pygame.Surface]
+    _profile_lines: Optional[List[str]]
+    _profile_taken: float
+    _profile_owned: bool
+
+    def __init__(self, layout: Optional[str] = None, fps: int = 60) -> None:
+        """Initialize a new Visualiser.
+
+        If <layout> is not None, every tree shown uses the layout algorithm
+        with that name from layouts.LAYOUTS. Otherwise each tree keeps the
+        layout it chose with set_layout.
+
+        If watcher is set to a Watcher for the folder of the tree shown,
+        the changes it reports are applied to the tree as they happen. The
+        sizes found in the background for a lazy FileSystemTree are applied
+        in the same way.
+
+        The entries read by the background scan of a streamed FileSystemTree
+        are added at most once every stream_interval seconds, and at most
+        stream_batch folders at a time, so that the display stays
+        responsive.
+
+        The window is redrawn at most <fps> times a second.
+        """
         # You may adjust the height and width as you'd like, depending on your screen resolution
         self.width = 1200
         self.height = 700
@@ -53,6 +153,24 @@ class Visualiser:
         self.screen = None
         self.hover_node = None
         self.selected_node = None
+        self.layout = layout
+        self.watcher = None
+        self.stream_interval = 0.1
+        self.stream_batch = 2000
+        self.fps = fps
+        self.detail = 4
+        self._last_stream = 0.0
+        self._clock = None
+        self._treemap = None
+        self._damage = None
+        self._revision = 0
+        self._fonts = {}
+        self._status_key = None
+        self._status_text = ''
+        self._status_surface = None
+        self._profile_lines = None
+        self._profile_taken = 0.0
+        self._profile_owned = False
 
     def run_visualisation(self, tree: TMTree) -> None:
         """Display an interactive graphical display of the given tree's treemap.
@@ -62,10 +180,12 @@ class Visualiser:
         pygame.init()
         self.screen = pygame.display.set_mode((self.width, self.height), pygame.RESIZABLE)
         self.tree = tree
+        self._apply_layout()
 
         # Render the initial display of the static treemap.
-        self.render_display()
         tree.update_rectangles((0, 0, self.width, self.height - self.font_height))
+        self._invalidate()
+        self.render_display()
 
         # Start an event loop to respond to events.
         self.event_loop()
@@ -85,10 +205,9 @@ class Visualiser:
         except ValueError:
             return
 
-        # TODO: Uncomment this after you have completed Task 2
-        for rect, colour in self.tree.get_rectangles():
-            # Note that the arguments are in the opposite order
-            pygame.draw.rect(subscreen, colour, rect)
+        with PROFILER.span('Visualiser.draw_treemap'):
+            self._draw_treemap()
+            subscreen.blit(self._treemap, (0, 0))
 
         # add the hover rectangle
         if self.selected_node is not None:
@@ -96,21 +215,142 @@ class Visualiser:
         if self.hover_node is not None:
             pygame.draw.rect(subscreen, (255, 255, 255), self.hover_node.rect, 2)
 
-        self._render_text()
+        with PROFILER.span('Visualiser.draw_text'):
+            self._render_text()
+            self._render_profile()
 
         # This must be called *after* all other pygame functions have run.
-        pygame.display.flip()
+        with PROFILER.span('Visualiser.flip'):
+            pygame.display.flip()
+
+    def _draw_treemap(self) -> None:
+        """Bring the cached drawing of the treemap up to date, drawing it
+        from scratch if there is none or the window was resized, and drawing
+        only the damaged part of it otherwise.
+        """
+        size = (self.width, self.height - self.font_height)
+        if self._treemap is None or self._treemap.get_size() != size:
+            self._treemap = pygame.Surface(size)
+            area = self._treemap.get_rect()
+        elif self._damage is None:
+            return
+        else:
+            area = self._damage
+        self._damage = None
+
+        treemap = self._treemap
+        treemap.set_clip(area)
+        treemap.fill(pygame.Color('black'))
+        # Rectangles painted later never overlap the small ones other than
+        # their parents, so the batch can be written last.
+        batch = [] if np is not None and treemap.get_bytesize() == 4 \
+            else None
+        for rect, colour in self.tree.iter_drawable(tuple(area), self.detail):
+            if batch is not None and rect[2] * rect[3] <= BATCH_AREA:
+                batch.append((*rect, treemap.map_rgb(colour)))
+            else:
+                treemap.fill(colour, rect)
+        if batch:
+            _write_rects(treemap, np.array(batch, dtype=np.int64), area)
+        treemap.set_clip(None)
+
+    def _invalidate(self, rects: Optional[Iterable[Tuple[int, int, int, int]]]
+                    = None) -> None:
+        """Mark the parts of the treemap covered by <rects> to be drawn
+        again, or all of it if <rects> is None.
+        """
+        self._revision += 1
+        if rects is None:
+            self._treemap = None
+            return
+        for rect in rects:
+            if self._damage is None:
+                self._damage = pygame.Rect(rect)
+            else:
+                self._damage.union_ip(rect)
 
     def _render_text(self) -> None:
         """Render text at the bottom of the display.
         """
         # The font we want to use
-        font = pygame.font.SysFont('Consolas', self.font_height - 8)
-        text_surface = font.render(self._get_display_text(), True, pygame.Color('white'))
+        font = self._get_font(self.font_height - 8)
+        text = self._get_display_text()
+        if self._status_surface is None:
+            self._status_surface = font.render(text, True, pygame.Color('white'))
 
         # Where to render the text_surface
         text_pos = (0, self.height - self.font_height + 4)
-        self.screen.blit(text_surface, text_pos)
+        self.screen.blit(self._status_surface, text_pos)
+
+        # Show how far a background scan has got at the right end
+        progress = self._get_progress_text()
+        if progress:
+            progress_surface = font.render(progress, True,
+                                           pygame.Color('yellow'))
+            self.screen.blit(progress_surface,
+                             (self.width - progress_surface.get_width() - 4,
+                              text_pos[1]))
+
+    def _render_profile(self) -> None:
+        """Render the profiler overlay in the top left corner of the
+        treemap, if it is shown.
+        """
+        if self._profile_lines is None:
+            return
+        font = self._get_font(16)
+        surfaces = [font.render(line, True, pygame.Color('white'))
+                    for line in self._profile_lines]
+        width = max(surface.get_width() for surface in surfaces) + 8
+        height = sum(surface.get_height() for surface in surfaces) + 8
+        background = pygame.Surface((width, height))
+        background.set_alpha(200)
+        self.screen.blit(background, (0, 0))
+        y = 4
+        for surface in surfaces:
+            self.screen.blit(surface, (4, y))
+            y += surface.get_height()
+
+    def _toggle_profile(self) -> None:
+        """Show the profiler overlay if it is hidden, and hide it otherwise.
+
+        The profiler is turned on while the overlay is shown, unless it was
+        already on, for example to record a trace.
+        """
+        if self._profile_lines is None:
+            self._profile_owned = not PROFILER.enabled
+            PROFILER.enabled = True
+            PROFILER.take_totals()
+            self._profile_taken = time.monotonic()
+            self._profile_lines = ['profiling... (P to hide)']
+        else:
+            if self._profile_owned:
+                PROFILER.enabled = False
+            self._profile_lines = None
+
+    def _update_profile(self) -> bool:
+        """Replace the lines of the profiler overlay with the totals of the
+        last second, once a second, and return whether they were replaced.
+        """
+        now = time.monotonic()
+        if self._profile_lines is None or now - self._profile_taken < 1.0:
+            return False
+        elapsed = now - self._profile_taken
+        self._profile_taken = now
+        lines = [f'last {elapsed:.1f}s (P to hide)    calls        ms']
+        for name, calls, seconds in PROFILER.take_totals()[:12]:
+            lines.append(f'{name:<32} {calls:>6} {seconds * 1000:>9.1f}')
+        for name, value in sorted(PROFILER.counters().items()):
+            lines.append(f'{name:<32} {value:>16,}')
+        self._profile_lines = lines
+        return True
+
+    def _get_font(self, size: int) -> pygame.font.Font:
+        """Return the font used for text of height <size>, loading it the
+        first time it is needed.
+        """
+        if size not in self._fonts:
+            self._fonts[size] = pygame.font.SysFont('Consolas', size)
+        return self._fonts[size]
 
     def event_loop(self) -> None:
         """Respond to events (mouse clicks, key presses) and update the display.
@@ -119,85 +359,205 @@ class Visualiser:
         the next event, determines the event's type, and then updates the state
         of the visualisation or the tree itself, updating the display if necessary.
         This loop ends only when the user closes the window.
+
+        While the tree is being read or watched in the background, the loop
+        wakes up once a frame to apply what was found. Otherwise it sleeps
+        until the next event, or for a second while the profiler overlay is
+        shown.
         """
         selected_node = self.tree
+        self._clock = pygame.time.Clock()
+        drawable = (0, 0, self.width, self.height - self.font_height)
 
         while True:
-            # Wait for an event
-            event = pygame.event.poll()
-            if event.type == pygame.QUIT:
-                return
+            # Wait for an event, or only until the next frame if there is
+            # work going on in the background
+            events = pygame.event.get()
+            if not events:
+                if self._is_busy():
+                    events = [pygame.event.wait(max(1, 1000 // self.fps))]
+                elif self._profile_lines is not None:
+                    events = [pygame.event.wait(1000)]
+                else:
+                    events = [pygame.event.wait()]
+
+            # Anything but the mouse moving may change what is shown
+            redraw = any(event.type not in (pygame.NOEVENT, pygame.MOUSEMOTION)
+                         for event in events)
+            with PROFILER.span('Visualiser.apply_updates'):
+                redraw = self._apply_updates() or redraw
+
+            for event in events:
+                if event.type == pygame.QUIT:
+                    return
 
-            if event.type == pygame.VIDEORESIZE:
-                self.width = int(event.w) if event.w else self.width
-                self.height = int(event.h) if event.h else self.height
-                self.run_visualisation(self.tree)
-                return
+                if event.type == pygame.VIDEORESIZE:
+                    self.width = int(event.w) if event.w else self.width
+                    self.height = int(event.h) if event.h else self.height
+                    self.run_visualisation(self.tree)
+                    return
 
-            # get the hover position and the corresponding node
-            hover_node = self.tree.get_tree_at_position(pygame.mouse.get_pos())
-
-            if event.type == pygame.MOUSEBUTTONUP:
-                selected_node = \
-                    self._handle_click(event.button, event.pos, selected_node)
-
-            elif event.type == pygame.KEYUP and selected_node is not None:
-                drawable_height = self.height - self.font_height
-                k = event.key
-                if k == pygame.K_UP:
-                    selected_node.change_size(0.01)
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
-
-                elif k == pygame.K_DOWN:
-                    selected_node.change_size(-0.01)
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
-
-                elif k == pygame.K_DELETE or platform == 'darwin' and k == pygame.K_BACKSPACE:
-                    if selected_node.delete_self():
-                        self.tree.update_data_sizes()
-                        self.tree.update_rectangles((0, 0, self.width, drawable_height))
+                if event.type == pygame.MOUSEBUTTONUP:
+                    selected_node = \
+                        self._handle_click(event.button, event.pos, selected_node)
+
+                elif event.type == pygame.KEYUP and selected_node is not None:
+                    k = event.key
+                    if k == pygame.K_UP:
+                        selected_node.change_size(0.01)
+                        self._invalidate(self.tree.update_dirty_rectangles(drawable))
+
+                    elif k == pygame.K_DOWN:
+                        selected_node.change_size(-0.01)
+                        self._invalidate(self.tree.update_dirty_rectangles(drawable))
+
+                    elif k == pygame.K_DELETE or platform == 'darwin' and k == pygame.K_BACKSPACE:
+                        if selected_node.delete_self():
+                            self._invalidate(self.tree.update_dirty_rectangles(drawable))
+                            selected_node = None
+
+                    elif k == pygame.K_m:
+                        hover_node = self.tree.get_tree_at_position(pygame.mouse.get_pos())
+                        selected_node.move(hover_node)
+                        self._invalidate(self.tree.update_dirty_rectangles(drawable))
+                        selected_node = hover_node
+
+                    elif k == pygame.K_e:
+                        selected_node.expand()
+                        self.tree.update_dirty_rectangles(drawable)
+                        self._invalidate()
                         selected_node = None
 
-                elif k == pygame.K_m:
-                    selected_node.move(hover_node)
-                    self.tree.update_data_sizes()
-                    self.tree.update_rectangles((0, 0, self.width, drawable_height))
-                    selected_node = hover_node
-
-                elif k == pygame.K_e:
-                    selected_node.expand()
-                    selected_node = None
-
-                elif k == pygame.K_a:
-                    selected_node.expand_all()
-                    selected_node = None
-
-                elif k == pygame.K_c:
-                    selected_node.collapse()
-                    if selected_node is not self.tree:
-                        selected_node = selected_node.get_parent()
-
-                elif k == pygame.K_x:
-                    selected_node.collapse_all()
-                    selected_node = self.tree
+                    elif k == pygame.K_a:
+                        selected_node.expand_all()
+                        self.tree.update_dirty_rectangles(drawable)
+                        self._invalidate()
+                        selected_node = None
 
-                elif k == pygame.K_q and selected_node is not self.tree:
-                    self.run_visualisation(selected_node)
-                    return
+                    elif k == pygame.K_c:
+                        selected_node.collapse()
+                        self._invalidate()
+                        if selected_node is not self.tree:
+                            selected_node = selected_node.get_parent()
+
+                    elif k == pygame.K_x:
+                        selected_node.collapse_all()
+                        self._invalidate()
+                        selected_node = self.tree
+
+                    elif k == pygame.K_q and selected_node is not self.tree:
+                        if isinstance(selected_node, FileSystemTree):
+                            selected_node = selected_node.unfold()
+                        self.run_visualisation(selected_node)
+                        return
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_b:
+                    if self.tree.get_parent():
+                        if isinstance(self.tree, FileSystemTree):
+                            self.tree.fold()
+                        self.tree.get_parent().collapse_all()
+                        self.run_visualisation(self.tree.get_parent())
+                        return
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_l:
+                    names = list(LAYOUTS)
+                    current = names.index(self.layout or DEFAULT_LAYOUT)
+                    self.layout = names[(current + 1) % len(names)]
+                    self._apply_layout()
+                    self.tree.update_rectangles(drawable)
+                    self._invalidate()
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_p:
+                    self._toggle_profile()
+
+                if event.type == pygame.KEYUP and event.key == pygame.K_v:
+                    root = self._get_root()
+                    if isinstance(root, PaperTree) \
+                            and root.next_hierarchy() is not None:
+                        self.run_visualisation(root.next_hierarchy())
+                        return
 
-            if event.type == pygame.KEYUP and event.key == pygame.K_b:
-                if self.tree.get_parent():
-                    self.tree.get_parent().collapse_all()
-                    self.run_visualisation(self.tree.get_parent())
-                    return
+            # get the hover position and the corresponding node
+            with PROFILER.span('Visualiser.hover'):
+                hover_node = self.tree.get_tree_at_position(pygame.mouse.get_pos())
+            redraw = redraw or hover_node is not self.hover_node
 
             self.selected_node = selected_node
             self.hover_node = hover_node
 
-            # Update display
-            self.render_display()
+            # Update display, at most fps times a second
+            redraw = self._update_profile() or redraw
+            if redraw:
+                with PROFILER.span('Visualiser.frame'):
+                    self.render_display()
+                self._clock.tick(self.fps)
+
+    def _apply_layout(self) -> None:
+        """Set this visualiser's layout on the root of the whole tree being
+        shown, so that it is kept when zooming in and out with Q and B.
+        """
+        if self.layout is None:
+            return
+        self._get_root().set_layout(self.layout)
+
+    def _get_root(self) -> TMTree:
+        """Return the root of the whole tree being shown, which is above
+        self.tree after zooming in with Q.
+        """
+        root = self.tree
+        while root.get_parent() is not None:
+            root = root.get_parent()
+        return root
+
+    def _is_busy(self) -> bool:
+        """Return whether the tree shown may still change without any event,
+        because it is being watched or read in the background.
+        """
+        root = self._get_root()
+        return self.watcher is not None \
+            or isinstance(root, FileSystemTree) and root.is_loading()
+
+    def _apply_updates(self) -> bool:
+        """Apply the changes reported by self.watcher and the folder sizes
+        found in the background to the whole tree, lay out again only the
+        parts of the display that changed, and return whether anything
+        changed.
+        """
+        root = self._get_root()
+        changed = False
+        if self.watcher is not None:
+            paths = self.watcher.poll()
+            if self.watcher.error is not None:
+                paths |= self._fall_back_to_polling()
+            if paths:
+                changed = root.update_from_disk(self.watcher.path, paths)
+        if isinstance(root, FileSystemTree):
+            changed = root.update_folder_sizes() or changed
+            now = time.monotonic()
+            if now - self._last_stream >= self.stream_interval:
+                self._last_stream = now
+                changed = root.update_from_stream(self.stream_batch) \
+                    or changed
+        if changed:
+            self._invalidate(self.tree.update_dirty_rectangles(
+                (0, 0, self.width, self.height - self.font_height)))
+        return changed
+
+    def _fall_back_to_polling(self) -> Set[str]:
+        """Replace self.watcher, which can no longer watch all of its folder,
+        with a PollingWatcher, and return the paths the old watcher reported
+        in the meantime.
+
+        The PollingWatcher takes its first scan before the old watcher is
+        polled for the last time, so no change falls between the two.
+        """
+        old = self.watcher
+        print(f'Cannot watch every folder ({old.error}), so the folder is '
+              f'scanned every few seconds instead', file=stderr)
+        self.watcher = PollingWatcher(old.path)
+        paths = old.poll()
+        old.close()
+        return paths
 
     def _handle_click(self, button: int, pos: Tuple[int, int],
                       old_selected_leaf: Optional[TMTree]) -> Optional[TMTree]:
@@ -220,29 +580,109 @@ class Visualiser:
         else:
             return old_selected_leaf
 
+    def _get_progress_text(self) -> str:
+        """Return the progress of the background scan of the tree shown, or
+        the empty string if there is none.
+        """
+        root = self._get_root()
+        if isinstance(root, FileSystemTree):
+            return root.scan_progress() or ''
+        return ''
+
     def _get_display_text(self) -> str:
         """Return the display text of this leaf.
-        """
 
-        leaf = self.selected_node
+        The text is only worked out again after the selection, the tree or
+        the width of the window changed.
+        """
+        key = (self.selected_node, self.width, self._revision)
+        if key != self._status_key:
+            self._status_key = key
+            self._status_text = self._abbreviate(self.selected_node)
+            self._status_surface = None
+        return self._status_text
+
+    def _abbreviate(self, leaf: Optional[TMTree]) -> str:
+        """Return the path and suffix of <leaf>, with its longest names
+        shortened until it fits the width of the window, or the empty string
+        if <leaf> is None.
+        """
         if leaf is None:
             return ''
-        else:
-            leaf_path = leaf.get_path_string()
-
-            while len(leaf_path + leaf.get_suffix()) > self.width // 13:
-                components = leaf_path.split(leaf.get_separator())
-                longest = max(len(s) for s in components)
-                if longest <= 3:
-                    break
-                components = [i[:-3] + '..' if len(i) == longest
-                              else i for i in components]
-                leaf_path = leaf.get_separator().join(components)
-            return leaf_path + leaf.get_suffix()
+        separator = leaf.get_separator()
+        suffix = leaf.get_suffix()
+        components = leaf.get_path_string().split(separator)
+        length = sum(len(s) for s in components) \
+            + len(separator) * (len(components) - 1) + len(suffix)
+
+        while length > self.width // 13:
+            longest = max(len(s) for s in components)
+            if longest <= 3:
+                break
+            for i, component in enumerate(components):
+                if len(component) == longest:
+                    # Each shortened name loses one character
+                    components[i] = component[:-3] + '..'
+                    length -= 1
+        return separator.join(components) + suffix
+
+
+def _write_rects(surface: pygame.Surface, rects: np.ndarray,
+                 area: pygame.Rect) -> None:
+    """Write the rectangles in <rects> straight into the pixels of the 32-bit
+    <surface>, leaving out the pixels outside <area>.
+
+    Each row of <rects> is the x, y, width and height of a rectangle and
+    the mapped colour to fill it with. Every pixel of every rectangle is
+    worked out at once, so there is no call per rectangle.
+    """
+    x, y, width, height, colour = rects.T
+    counts = width * height
+    # The position of each pixel within its own rectangle.
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    widths = np.repeat(width, counts)
+    xs = np.repeat(x, counts) + offsets % widths
+    ys = np.repeat(y, counts) + offsets // widths
+    inside = (xs >= area.left) & (xs < area.right) & (ys >= area.top) \
+        & (ys < area.bottom)
+    pixels = pygame.surfarray.pixels2d(surface)
+    pixels[xs[inside], ys[inside]] = \
+        np.repeat(colour, counts)[inside].astype(pixels.dtype)
+    del pixels
+
+
+def run_treemap_file_system(path: str, scanner: Optional[Scanner] = None,
+                            compact: bool = False,
+                            cache: Optional[ScanCache] = None,
+                            watch: bool = False, lazy: bool = False,
+                            stream: bool = False, fold: int = 0,
+                            fold_pixels: int = 0, processes: int = 1) -> None:
+    """Run a treemap visualisation for the given path's file structure.
 
+    The file system is read with <scanner>, or with a single-threaded
+    Scanner if <scanner> is None. If <compact>, the files are stored in a
+    CompactTree, which uses much less memory for very large folders. If
+    <cache> is not None, only the folders modified since the last run are
+    read again. If <watch>, changes to the files are shown as they happen.
+    If <lazy>, each folder is only read when it is first expanded, so the
+    treemap appears at once; <cache> is not used then. If <stream>, the
+    treemap is shown while the scan goes on and grows as folders are read.
+    Only one of <compact>, <lazy> and <stream> can be used, and <watch>
+    cannot be combined with <compact> or <stream>.
+
+    If <fold> is positive, the files smaller than <fold> bytes in each
+    folder are shown as one leaf, as by FileSystemTree.fold. If
+    <fold_pixels> is positive, so are the files that would take up fewer
+    than <fold_pixels> pixels if the whole window was shown. A folder's
+    files are shown again when it is zoomed into with Q, and folded again
+    when going back with B. Folding cannot be combined with <compact> or
+    <stream>.
+
+    If <processes> is more than 1, the folders directly inside <path> are
+    scanned by that many processes. This cannot be combined with <lazy> or
+    <stream>.
 
-def run_treemap_file_system(path: str) -> None:
-    """Run a treemap visualisation for the given path's file structure.
     Precondition: <path> is a valid path to a file or folder.
     """
     instructions = '\n==== Instructions for use ====\n' \
@@ -251,29 +691,179 @@ def run_treemap_file_system(path: str) -> None:
                    '"A" to expand the folder and all folders inside\n' \
                    '"C" to collapse the parent folder\n' \
                    '"X" to collapse the entire display\n' \
-                   '"Q" to visualize the selected folder/file\n' \
+                   '"Q" to visualize the selected folder/file, showing its small files\n' \
                    '"B" to go back to parent folder (if Q was pressed)\n' \
                    '"Up" and "Down" arrow keys to change the size of a file (in visualization)\n' \
                    '"M" to move a file (while selecting a file and hovering over a folder)\n' \
                    '"Del" to delete a file or folder from the visualization\n' \
+                   '"L" to switch between the treemap layouts\n' \
+                   '"P" to show or hide the profiler overlay\n' \
                    '(Drag window to resize)'
-    file_tree = FileSystemTree(path)
+    if compact + lazy + stream > 1 or watch and (compact or stream):
+        raise ValueError('only one of compact, lazy and stream can be used, '
+                         'and watch only works with lazy or neither')
+    if (fold > 0 or fold_pixels > 0) and (compact or stream):
+        raise ValueError('small files cannot be folded with compact or '
+                         'stream')
+    if processes > 1 and (lazy or stream):
+        raise ValueError('processes cannot be used with lazy or stream')
+    if watch:
+        # Start watching first, so that no change made during the scan is
+        # missed.
+        visualizer.watcher = open_watcher(path)
+    if compact:
+        entry = scan_sharded(path, scanner, processes, cache)
+        file_tree = CompactTree.from_scan(entry).root()
+    else:
+        file_tree = FileSystemTree(path, scanner, cache, lazy, stream, fold,
+                                   processes)
+        if fold_pixels > 0:
+            _fold_pixels(file_tree, fold_pixels)
     print(instructions)
+    try:
+        visualizer.run_visualisation(file_tree)
+    finally:
+        if visualizer.watcher is not None:
+            visualizer.watcher.close()
+
+
+def run_treemap_snapshots(filenames: List[str], compact: bool = False,
+                          fold: int = 0, fold_pixels: int = 0) -> None:
+    """Run a treemap visualisation of the scan snapshots in the files
+    <filenames>, merged as by scan_shards.merge_snapshots, with the newest
+    last.
+
+    <compact>, <fold> and <fold_pixels> are as for run_treemap_file_system.
+    Changes made in the visualisation are not saved to the snapshots.
+    """
+    path, entry = merge_snapshots(filenames)
+    print(f'Showing the snapshots of {path}')
+    if compact:
+        visualizer.run_visualisation(CompactTree.from_scan(entry).root())
+        return
+    file_tree = FileSystemTree.from_scan(entry, fold)
+    if fold_pixels > 0:
+        _fold_pixels(file_tree, fold_pixels)
     visualizer.run_visualisation(file_tree)
 
 
-def run_treemap_papers() -> None:
+def _fold_pixels(tree: FileSystemTree, area: int) -> None:
+    """Fold the files of <tree> that would take up fewer than <area> pixels
+    if the whole window was shown.
+    """
+    tree.fold(math.ceil(tree.data_size * area
+                        / (visualizer.width * visualizer.height)))
+
+
+def run_treemap_papers(author: Optional[str] = None,
+                       years: Optional[Tuple[int, int]] = None,
+                       category: Optional[str] = None) -> None:
     """Run a treemap visualization for CS Education research papers data.
 
     You can try changing the value of the named argument by_year, but the
     others should stay the same.
+
+    If any of <author>, <years> and <category> is given, only show the
+    papers that match, as found by PaperTree.filter.
     """
     paper_tree = PaperTree('CS1', [], all_papers=True, by_year=True)
+    if author is not None or years is not None or category is not None:
+        paper_tree = paper_tree.filter(author, years, category)
+    else:
+        print('Press "V" to group the papers by year, category, first '
+              'author or decade')
     visualizer.run_visualisation(paper_tree)
 
 
+def _parse_args() -> argparse.Namespace:
+    """Return the command line options of the file system visualisation.
+    """
+    parser = argparse.ArgumentParser(
+        description='Show a treemap of the files in a folder.')
+    parser.add_argument('path', nargs='?', default='',
+                        help='the folder to show (default: the current '
+                             'folder)')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='number of threads used to read folders')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of processes that scan the folders '
+                             'inside the path, each with its own threads')
+    parser.add_argument('--snapshot', action='append', default=[],
+                        metavar='FILE',
+                        help='show a snapshot saved by scan_shards.py '
+                             'instead of scanning; repeat to merge several')
+    parser.add_argument('--compact', action='store_true',
+                        help='store the tree in compact arrays, for folders '
+                             'with millions of files')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='folder that holds the scan snapshots')
+    parser.add_argument('--cache-limit', type=float, default=None,
+                        metavar='MB',
+                        help='largest scan snapshot to keep, in megabytes')
+    parser.add_argument('--refresh', action='store_true',
+                        help='read every folder again instead of reusing '
+                             'the snapshot')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read or write scan snapshots')
+    parser.add_argument('--watch', action='store_true',
+                        help='show changes to the files as they happen')
+    parser.add_argument('--lazy', action='store_true',
+                        help='read each folder only when it is expanded')
+    parser.add_argument('--stream', action='store_true',
+                        help='show the treemap while the folder is read')
+    parser.add_argument('--no-follow', action='store_true',
+                        help='do not follow symbolic links')
+    parser.add_argument('--one-file-system', action='store_true',
+                        help='do not read folders on other file systems')
+    parser.add_argument('--disk-usage', action='store_true',
+                        help='show the space allocated on disk instead of '
+                             'the apparent size')
+    parser.add_argument('--unique-inodes', action='store_true',
+                        help='count each hard-linked file only once')
+    parser.add_argument('--fold', type=int, default=0, metavar='BYTES',
+                        help='show the files smaller than BYTES in each '
+                             'folder as one leaf')
+    parser.add_argument('--fold-pixels', type=int, default=0,
+                        metavar='AREA',
+                        help='show the files that would be smaller than '
+                             'AREA pixels in each folder as one leaf')
+    parser.add_argument('--fps', type=int, default=60,
+                        help='largest number of frames drawn per second')
+    parser.add_argument('--profile', action='store_true',
+                        help='start with the profiler overlay shown')
+    parser.add_argument('--trace', default=None, metavar='PATH',
+                        help='record a Chrome trace of the scan and every '
+                             'frame, written to PATH on exit')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    visualizer = Visualiser()
     PATH_TO_VISUALISE = ''  # enter a custom path here if you wish
-    run_treemap_file_system(PATH_TO_VISUALISE or getcwd())
+    ARGS = _parse_args()
+    visualizer = Visualiser(fps=ARGS.fps)
+    if ARGS.trace is not None:
+        PROFILER.enabled = True
+    if ARGS.profile:
+        visualizer._toggle_profile()
+    if ARGS.no_cache:
+        CACHE = None
+    else:
+        CACHE = ScanCache(ARGS.cache_dir, None if ARGS.cache_limit is None
+                          else int(ARGS.cache_limit * 1024 * 1024),
+                          ARGS.refresh)
+    try:
+        if ARGS.snapshot:
+            run_treemap_snapshots(ARGS.snapshot, ARGS.compact, ARGS.fold,
+                                  ARGS.fold_pixels)
+        else:
+            run_treemap_file_system(
+                ARGS.path or PATH_TO_VISUALISE or getcwd(),
+                Scanner(ARGS.workers, not ARGS.no_follow,
+                        ARGS.one_file_system, ARGS.disk_usage,
+                        ARGS.unique_inodes),
+                ARGS.compact, CACHE, ARGS.watch, ARGS.lazy, ARGS.stream,
+                ARGS.fold, ARGS.fold_pixels, ARGS.processes)
+    finally:
+        if ARGS.trace is not None:
+            PROFILER.export_trace(ARGS.trace)
     # run_treemap_papers()